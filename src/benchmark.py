@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark potoku analizy na syntetycznych danych.
+
+Generuje realistyczne logi SUPLA (kumulatywny fae_balanced z zadanym
+krokiem próbkowania i resetami licznika) oraz syntetyczne ceny TGE,
+a następnie mierzy czas i szczytowe zużycie pamięci etapów:
+parse_json_to_dataframe, normalize_logs_to_hourly_kwh, compute_costs,
+compute_dynamic_tariff_cost, create_visualizations i batch_tariff_costs
+(wszystkie liczniki scenariusza naraz).
+
+Wyniki zapisywane są do pliku JSON (z hashem commita), żeby można było
+porównywać kolejne wersje:
+
+    cd src
+    python benchmark.py                         # scenariusze 1m i 1y
+    python benchmark.py --scenarios 1m 1y 10y_100m --interval 300
+    python benchmark.py --compare ../output/benchmark_old.json
+    python benchmark.py --scenarios 1m --tge-days 31          # + ceny TGE: HTTP vs Selenium
+"""
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import numpy as np
+import pandas as pd
+
+try:
+    import supla_config  # noqa: F401
+except ImportError:
+    # Bez własnej konfiguracji używamy cen z przykładowego pliku
+    _spec = importlib.util.spec_from_file_location(
+        "supla_config", os.path.join(os.path.dirname(__file__), "supla_config.example.py"))
+    _module = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(_module)
+    sys.modules["supla_config"] = _module
+
+import supla_pge
+
+
+# Scenariusze: (liczba miesięcy, liczba liczników)
+SCENARIOS = {
+    "1m": (1, 1),
+    "1y": (12, 1),
+    "10y_100m": (120, 100),
+}
+
+# Czy mierzyć szczytową pamięć (drugie wywołanie etapu pod tracemalloc)
+MEASURE_MEMORY = True
+
+# Rok etykiety wykresów - plik wyjściowy nie nadpisze prawdziwych analiz
+CHART_LABEL_YEAR = 1900
+
+
+# ----------------------------
+# DANE SYNTETYCZNE
+# ----------------------------
+def synthetic_supla_logs(start: datetime, end: datetime, interval_s: int = 600, seed: int = 0,
+                         resets: int = 2) -> list:
+    """
+    Logi w formacie odpowiedzi /measurement-logs: lista słowników z
+    date_timestamp i kumulatywnym fae_balanced (setne Wh).
+
+    Pobór ma profil dobowy (szczyt rano i wieczorem) z szumem, a licznik
+    jest `resets` razy zerowany w losowych momentach.
+    """
+    rng = np.random.default_rng(seed)
+    ts = np.arange(int(start.timestamp()), int(end.timestamp()) + 1, interval_s, dtype=np.int64)
+    hour = (ts // 3600 + 1) % 24  # przybliżony czas lokalny
+
+    base_kw = 0.25 + 0.6 * np.exp(-((hour - 7) ** 2) / 4) + 0.9 * np.exp(-((hour - 19) ** 2) / 6)
+    kw = np.clip(base_kw * rng.lognormal(0, 0.35, len(ts)), 0, None)
+    step = np.round(kw * interval_s / 3600 * 100000).astype(np.int64)  # kWh -> 0.01 Wh
+
+    counter = 10 ** 9 + np.cumsum(step)
+    for pos in np.sort(rng.integers(1, len(ts), size=min(resets, max(len(ts) - 1, 0)))):
+        counter[pos:] -= counter[pos] - step[pos]
+
+    return [{"date_timestamp": int(t), "fae_balanced": int(c)} for t, c in zip(ts, counter)]
+
+
+def synthetic_tge_prices(start: datetime, end: datetime, seed: int = 0) -> pd.DataFrame:
+    """Godzinowe ceny TGE (zł/kWh netto) w formacie fetch_tge_prices - symulator z supla_pge."""
+    first = pd.Timestamp(start).floor('h')
+    last = pd.Timestamp(end).floor('h')
+    return supla_pge.simulate_tge_prices(first, last + pd.Timedelta(hours=1),
+                                         profile=supla_pge.DEFAULT_PRICE_PROFILE, seed=seed)
+
+
+# ----------------------------
+# POMIAR
+# ----------------------------
+def measure(fn, *args, **kwargs):
+    """
+    Wywołuje fn i zwraca (wynik, sekundy, szczytowa pamięć MB).
+
+    Czas mierzony jest bez śledzenia pamięci; pamięć (tracemalloc) w osobnym
+    wywołaniu, bo samo śledzenie wielokrotnie spowalnia kod alokujący obiekty.
+    """
+    gc.collect()
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - t0
+
+    peak_mb = float('nan')
+    if MEASURE_MEMORY:
+        del result
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = fn(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        peak_mb = peak / 2 ** 20
+    return result, elapsed, peak_mb
+
+
+def run_scenario(name: str, interval_s: int, charts: bool = True) -> list:
+    months, meters = SCENARIOS[name]
+    start = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    end = (pd.Timestamp(start) + pd.DateOffset(months=months) - pd.Timedelta(seconds=1)).to_pydatetime()
+    tge_prices = synthetic_tge_prices(start, end)
+
+    stages = {}
+    households = {}
+
+    def record(stage, rows, seconds, peak_mb):
+        s = stages.setdefault(stage, {"scenario": name, "stage": stage, "meters": 0,
+                                      "rows": 0, "seconds": 0.0, "peak_mb": None})
+        s["meters"] += 1
+        s["rows"] += int(rows)
+        s["seconds"] += seconds
+        if MEASURE_MEMORY:
+            s["peak_mb"] = max(s["peak_mb"] or 0.0, peak_mb)
+
+    for meter in range(meters):
+        payload = synthetic_supla_logs(start, end, interval_s, seed=meter)
+
+        df_raw, t, m = measure(supla_pge.parse_json_to_dataframe, payload)
+        record("parse_json_to_dataframe", len(payload), t, m)
+        del payload
+
+        hourly, t, m = measure(supla_pge.normalize_logs_to_hourly_kwh, df_raw, start, end)
+        record("normalize_logs_to_hourly_kwh", len(df_raw), t, m)
+        del df_raw
+
+        res, t, m = measure(supla_pge.compute_costs, hourly, supla_pge.PRICES,
+                            supla_pge.METER_SUPPORTS_SUMMER_WINTER)
+        record("compute_costs", len(hourly), t, m)
+
+        dynamic_result, t, m = measure(supla_pge.compute_dynamic_tariff_cost, hourly, tge_prices)
+        record("compute_dynamic_tariff_cost", len(hourly), t, m)
+        households[meter] = hourly[["hour_utc", "kwh"]]
+
+        # Wykres tylko dla pierwszego licznika - koszt rysowania nie zależy od licznika
+        if charts and meter == 0:
+            _, t, m = measure(supla_pge.create_visualizations, hourly, res,
+                              CHART_LABEL_YEAR, 1, dynamic_result, show=False)
+            record("create_visualizations", len(hourly), t, m)
+            chart = os.path.join(os.path.dirname(__file__), '..', 'output',
+                                 f'analiza_energii_{CHART_LABEL_YEAR}_01.png')
+            if os.path.exists(chart):
+                os.remove(chart)
+
+        print(f"  {name}: licznik {meter + 1}/{meters}", file=sys.stderr)
+
+    # Wszystkie liczniki naraz: macierz kWh x ceny jednostkowe taryf
+    hours, kwh = supla_pge.stack_hourly(households)
+    del households
+    _, t, m = measure(supla_pge.batch_tariff_costs, kwh, hours, tge_prices)
+    record("batch_tariff_costs", kwh.size, t, m)
+    stages["batch_tariff_costs"]["meters"] = meters
+
+    return list(stages.values())
+
+
+def run_tge_fetch(days: int, delay: float) -> list:
+    """
+    Pobieranie notowań TGE z lokalnego zastępcy strony PGE (pge_tge_standin):
+    ścieżka HTTP i - jeśli dostępna - Selenium, na tych samych dniach.
+    """
+    import pge_tge_standin
+
+    server = pge_tge_standin.start(delay=delay)
+    supla_pge.PGE_TGE_URL = pge_tge_standin.url(server)
+    dates = [str(d.date()) for d in pd.date_range("2015-01-01", periods=days, freq="D")]
+
+    results = []
+    try:
+        for method in ("http", "selenium"):
+            t0 = time.perf_counter()
+            fetched = supla_pge.scrape_tge_prices_range(dates, method=method)
+            elapsed = time.perf_counter() - t0
+            if not fetched:
+                print(f"  tge: metoda {method} niedostępna - pomijam", file=sys.stderr)
+                continue
+            results.append({"scenario": "tge", "stage": f"tge_fetch_{method}", "meters": 0,
+                            "rows": len(fetched), "seconds": elapsed, "peak_mb": None})
+    finally:
+        server.shutdown()
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(current: list, baseline_file: str):
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = {(r["scenario"], r["stage"]): r for r in json.load(f)["results"]}
+    print(f"\n{'scenariusz':<10} {'etap':<30} {'czas [s]':>10} {'poprz. [s]':>10} {'x':>7}")
+    for r in current:
+        old = baseline.get((r["scenario"], r["stage"]))
+        if old is None:
+            continue
+        ratio = r["seconds"] / old["seconds"] if old["seconds"] else float('nan')
+        print(f"{r['scenario']:<10} {r['stage']:<30} {r['seconds']:>10.3f} {old['seconds']:>10.3f} {ratio:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark potoku SUPLA/TGE na danych syntetycznych")
+    parser.add_argument("--scenarios", nargs="+", default=["1m", "1y"], choices=sorted(SCENARIOS))
+    parser.add_argument("--interval", type=int, default=600, help="krok próbkowania licznika [s]")
+    parser.add_argument("--no-charts", action="store_true", help="pomiń create_visualizations")
+    parser.add_argument("--no-memory", action="store_true", help="nie mierz pamięci (szybciej)")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), '..', 'output',
+                                                         'benchmark_results.json'))
+    parser.add_argument("--compare", help="poprzedni plik wyników do porównania")
+    parser.add_argument("--tge-days", type=int, default=0,
+                        help="porównaj pobieranie cen TGE (HTTP vs Selenium) dla N dni z lokalnego zastępcy PGE")
+    parser.add_argument("--tge-delay", type=float, default=0.05, help="opóźnienie odpowiedzi zastępcy PGE [s]")
+    args = parser.parse_args()
+
+    global MEASURE_MEMORY
+    MEASURE_MEMORY = not args.no_memory
+
+    results = []
+    for name in args.scenarios:
+        results.extend(run_scenario(name, args.interval, charts=not args.no_charts))
+    if args.tge_days:
+        results.extend(run_tge_fetch(args.tge_days, args.tge_delay))
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "interval_s": args.interval,
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'scenariusz':<10} {'etap':<30} {'wiersze':>10} {'czas [s]':>10} {'pamięć [MB]':>12}")
+    for r in results:
+        print(f"{r['scenario']:<10} {r['stage']:<30} {r['rows']:>10} {r['seconds']:>10.3f} {r['peak_mb'] or 0.0:>12.1f}")
+    print(f"\n💾 Zapisano wyniki: {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
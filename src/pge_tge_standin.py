@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Lokalny zastępca strony PGE z notowaniami TGE (formularz tge_quotes_form).
+
+Pozwala testować i porównywać pobieranie cen bez dostępu do sieci:
+PgeTgeHttpClient (HTTP) i PgeTgeBrowser (Selenium) działają na nim tak
+samo jak na stronie PGE - wystarczy podmienić supla_pge.PGE_TGE_URL.
+
+Odpowiedzi dla dni nagranych poleceniem `record` (data/pge_tge_recorded/)
+odtwarzane są bez zmian; dla pozostałych dni generowany jest HTML w tym
+samym układzie z deterministycznymi cenami.
+
+    cd src
+    python pge_tge_standin.py record 2025-12-01 2025-12-02   # nagranie prawdziwych odpowiedzi PGE
+    python pge_tge_standin.py serve --port 8765               # http://127.0.0.1:8765/
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'pge_tge_recorded')
+PAGE_PATH = '/dla-domu/oferta/dynamiczna-energia-z-pge'
+DATE_FIELD = 'tge_quotes_form[dateTime]'
+
+
+# ----------------------------
+# ODPOWIEDZI
+# ----------------------------
+def synthetic_prices(date_str: str) -> np.ndarray:
+    """24 ceny PLN/MWh dla dnia - te same przy każdym wywołaniu."""
+    day = datetime.strptime(date_str, '%Y-%m-%d')
+    rng = np.random.default_rng(day.toordinal())
+    h = np.arange(24)
+    profile = 300 + 250 * np.exp(-((h - 8) ** 2) / 3) + 350 * np.exp(-((h - 19) ** 2) / 4)
+    return np.clip(profile + rng.normal(0, 40, 24), 50, 990).round(2)
+
+
+def quotes_fragment(date_str: str) -> str:
+    """Kontener z notowaniami (odpowiedź AJAX formularza)."""
+    recorded = os.path.join(RECORDINGS_DIR, f'{date_str}.html')
+    if os.path.exists(recorded):
+        with open(recorded, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    rows = ''.join(
+        f'<tr><td>{h}-{h + 1}</td><td>{mwh:.2f}</td><td>{mwh / 1000:.5f}</td></tr>'
+        for h, mwh in enumerate(synthetic_prices(date_str))
+    )
+    return (
+        '<div class="tge-quotes-element-container">'
+        f'<p>Notowania TGE z dnia {date_str}</p>'
+        '<table><tr><th>Godzina</th><th>Kurs (PLN/MWh)</th><th>Kurs (PLN/kWh)</th></tr>'
+        f'{rows}</table></div>'
+    )
+
+
+def page_html(date_str: str) -> str:
+    """Cała strona: formularz (jak na PGE) i notowania wybranego dnia."""
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Dynamiczna energia z PGE</title></head><body>'
+        f'<form name="tge_quotes_form" method="post" action="{PAGE_PATH}">'
+        f'<input type="date" id="tge_quotes_form_dateTime" name="{DATE_FIELD}" value="{date_str}">'
+        '<input type="hidden" id="tge_quotes_form__token" name="tge_quotes_form[_token]" value="standin">'
+        '<button type="submit" id="tge_quotes_form_submit" name="tge_quotes_form[submit]">Zastosuj</button>'
+        '</form>'
+        f'{quotes_fragment(date_str)}'
+        '</body></html>'
+    )
+
+
+class Handler(BaseHTTPRequestHandler):
+    delay = 0.0  # sztuczne opóźnienie odpowiedzi [s] - np. do benchmarku
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body: str):
+        data = body.encode('utf-8')
+        if self.delay:
+            time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _respond(self, fields: dict):
+        date_str = fields.get(DATE_FIELD, [datetime.now().strftime('%Y-%m-%d')])[-1]
+        try:
+            datetime.strptime(date_str, '%Y-%m-%d')
+        except ValueError:
+            self.send_error(400)
+            return
+        if self.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            self._send(quotes_fragment(date_str))
+        else:
+            self._send(page_html(date_str))
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path not in ('/', PAGE_PATH):
+            self.send_error(404)
+            return
+        self._respond(parse_qs(url.query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self._respond(parse_qs(self.rfile.read(length).decode('utf-8')))
+
+
+def start(port: int = 0, delay: float = 0.0) -> ThreadingHTTPServer:
+    """Uruchamia zastępcę w tle; adres strony: url(server)."""
+    handler = type('StandinHandler', (Handler,), {'delay': delay})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def url(server: ThreadingHTTPServer) -> str:
+    return f'http://127.0.0.1:{server.server_address[1]}{PAGE_PATH}'
+
+
+# ----------------------------
+# NAGRYWANIE
+# ----------------------------
+def record(dates: list):
+    """Zapisuje prawdziwe odpowiedzi strony PGE dla podanych dni."""
+    import supla_pge
+
+    os.makedirs(RECORDINGS_DIR, exist_ok=True)
+    with supla_pge.PgeTgeHttpClient(verbose=True) as client:
+        client.load_form()
+        for date_str in dates:
+            body = client._submit(date_str)
+            if supla_pge.parse_pge_tge_page(body, date_str) is None:
+                print(f"⚠️  {date_str}: odpowiedź bez notowań - pomijam")
+                continue
+            path = os.path.join(RECORDINGS_DIR, f'{date_str}.html')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(body)
+            print(f"💾 {date_str}: {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokalny zastępca strony PGE z notowaniami TGE")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("serve", help="uruchom serwer")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--delay", type=float, default=0.0, help="opóźnienie odpowiedzi [s]")
+    p = sub.add_parser("record", help="nagraj odpowiedzi strony PGE")
+    p.add_argument("dates", nargs="+", metavar="RRRR-MM-DD")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.dates)
+        return
+
+    server = start(args.port, args.delay)
+    print(f"🌐 Zastępca strony PGE: {url(server)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
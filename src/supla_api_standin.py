@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Lokalny zastępca API SUPLA Cloud (/api/v3/channels/...).
+
+Pozwala testować pobieranie logów, serwis HTTP (serve) i podgląd na żywo
+(watch) bez konta SUPLA i bez sieci. Obsługiwane są:
+
+    GET /api/v3/channels/{kanał}                   - kanał (sprawdzenie tokena)
+    GET /api/v3/channels/{kanał}/measurement-logs  - odczyty (dateFrom, dateTo, limit, order)
+
+Token ma format SUPLA (<sekret>.<base64url(adres API)>) - token(server, sekret)
+buduje go dla danego serwera. Nieznany sekret = HTTP 401, kanał spoza listy
+kanałów tokena = HTTP 404 (jak w SUPLA Cloud).
+
+Odczyty generowane są co STEP_SECONDS z analitycznego profilu dobowego, więc
+każdy zakres i każda strona zwracają te same wartości niezależnie od kolejności
+zapytań. Odczyty nowsze niż zegar serwera (server.clock) nie są zwracane.
+
+    cd src
+    python supla_api_standin.py --port 8766 --secret test   # wypisuje token do --token
+"""
+import argparse
+import base64
+import json
+import re
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+STEP_SECONDS = 600
+CHANNEL_PATH = re.compile(r'^/api/v3/channels/(\d+)(/measurement-logs)?$')
+
+
+# ----------------------------
+# ODCZYTY
+# ----------------------------
+def counter_kwh(channel_id: int, ts: np.ndarray) -> np.ndarray:
+    """
+    Stan licznika [kWh] w chwilach ts (sekundy epoch): średnio 0,3-0,5 kW
+    z szczytem wieczornym. Postać zamknięta - rosnąca i powtarzalna.
+    """
+    ts = np.asarray(ts, dtype=float)
+    mean_kw = 0.3 + 0.05 * (channel_id % 5)
+    swing_kw = 0.2
+    omega = 2 * np.pi / 86400
+    # moc = mean + swing * sin(omega * t): całka w kWh
+    return 1000.0 + mean_kw * ts / 3600 - swing_kw / (omega * 3600) * np.cos(omega * ts)
+
+
+def measurement_logs(channel_id: int, date_from: float, date_to: float, limit: int,
+                     descending: bool = False) -> list:
+    """Odczyty z zakresu [date_from, date_to] w formacie /measurement-logs."""
+    first = int(np.ceil(date_from / STEP_SECONDS)) * STEP_SECONDS
+    last = int(date_to // STEP_SECONDS) * STEP_SECONDS
+    if last < first:
+        return []
+    count = min((last - first) // STEP_SECONDS + 1, limit)
+    if descending:
+        ts = last - np.arange(count, dtype=np.int64) * STEP_SECONDS
+    else:
+        ts = first + np.arange(count, dtype=np.int64) * STEP_SECONDS
+    fae = np.round(counter_kwh(channel_id, ts) * 100000).astype(np.int64)  # setne Wh
+    return [{"date_timestamp": int(t), "fae_balanced": int(f), "rae_balanced": 0}
+            for t, f in zip(ts, fae)]
+
+
+def _timestamp(value: str) -> float:
+    if value.lstrip('-').isdigit():
+        return float(value)
+    return datetime.fromisoformat(value).timestamp()
+
+
+# ----------------------------
+# SERWER
+# ----------------------------
+class Handler(BaseHTTPRequestHandler):
+    tokens = {}  # sekret -> zbiór kanałów (None = wszystkie)
+    max_limit = None  # górny limit odczytów na stronę (niezależnie od ?limit=)
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self.server.requests.append(self.path)
+        match = CHANNEL_PATH.match(url.path)
+        if match is None:
+            return self._send(404, {"message": "Not found"})
+
+        auth = self.headers.get('Authorization', '')
+        secret = auth[7:].split('.')[0] if auth.startswith('Bearer ') else None
+        if secret not in self.tokens:
+            return self._send(401, {"message": "Invalid access token"})
+        channel_id = int(match.group(1))
+        channels = self.tokens[secret]
+        if channels is not None and channel_id not in channels:
+            return self._send(404, {"message": "Channel not found"})
+
+        if not match.group(2):
+            return self._send(200, {"id": channel_id, "function": {"name": "ELECTRICITYMETER"}})
+
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            date_from = _timestamp(query.get('dateFrom', '0'))
+            date_to = min(_timestamp(query['dateTo']) if 'dateTo' in query else float('inf'),
+                          self.server.clock())
+            limit = int(query.get('limit', 5000))
+            if self.max_limit is not None:
+                limit = min(limit, self.max_limit)
+        except ValueError as e:
+            return self._send(400, {"message": str(e)})
+        return self._send(200, measurement_logs(channel_id, date_from, date_to, limit,
+                                                descending=query.get('order', 'ASC').upper() == 'DESC'))
+
+
+def start(tokens: dict, port: int = 0, clock=None, max_limit: int = None) -> ThreadingHTTPServer:
+    """
+    Uruchamia zastępcę w tle. tokens: {sekret: kanały lub None}; clock: funkcja
+    zwracająca bieżący czas epoch (domyślnie time.time) - odczyty późniejsze
+    nie istnieją; max_limit: serwer zwraca najwyżej tyle odczytów na stronę,
+    nawet gdy zapytanie prosi o więcej. Ścieżki kolejnych zapytań: server.requests.
+    """
+    handler = type('StandinHandler', (Handler,), {'tokens': dict(tokens), 'max_limit': max_limit})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.clock = clock or time.time
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def url(server: ThreadingHTTPServer) -> str:
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def token(server: ThreadingHTTPServer, secret: str) -> str:
+    """Token w formacie SUPLA wskazujący na zastępcę."""
+    return f"{secret}.{base64.urlsafe_b64encode(url(server).encode()).decode().rstrip('=')}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokalny zastępca API SUPLA Cloud")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--secret", default="test", help="sekretna część tokena")
+    parser.add_argument("--channels", type=int, nargs="*", help="kanały dostępne dla tokena (domyślnie wszystkie)")
+    parser.add_argument("--max-limit", type=int, help="najwyżej tyle odczytów na stronę (niezależnie od ?limit=)")
+    args = parser.parse_args()
+
+    server = start({args.secret: set(args.channels) if args.channels else None}, args.port,
+                   max_limit=args.max_limit)
+    print(f"🌐 Zastępca API SUPLA: {url(server)}")
+    print(f"🔑 Token: {token(server, args.secret)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -71,3 +71,80 @@ DYNAMIC_TARIFF_FIXED_CHARGE = 29.98  # zł/msc netto (zamiast 12.48 w standardow
 # Cena = cena_tge + marża + koszty + obciążenia + podatki
 # Typowa marża dla taryf dynamicznych to 0.10-0.20 zł/kWh
 DYNAMIC_TARIFF_MARGIN = 0.15  # zł/kWh netto
+
+# Liczba równoległych przeglądarek (headless Chrome) przy scrapingu cen TGE ze strony PGE.
+# Każda przeglądarka pobiera kolejne dni bez ponownego uruchamiania.
+TGE_SCRAPER_WORKERS = 3
+# Sposób pobierania notowań ze strony PGE: "auto" - bezpośrednio przez HTTP,
+# a dni nieudane przez Selenium; "http" - bez przeglądarki; "selenium" - tylko Chrome.
+TGE_FETCH_METHOD = "auto"
+
+# Tryb floty: wiele liczników / kont SUPLA (python supla_pge.py fleet).
+# Lista krotek (token, channel_id) lub (token, channel_id, "nazwa").
+SUPLA_FLEET = [
+    # ("TOKEN_KONTA_1", 12345, "Dom"),
+    # ("TOKEN_KONTA_2", 67890, "Garaż"),
+]
+# Maksymalna liczba jednoczesnych pobrań z API SUPLA
+SUPLA_MAX_CONCURRENT_DOWNLOADS = 8
+
+# Zakres logów dzielony jest na okna (godziny; 0 = jedno żądanie na miesiąc)
+# pobierane równolegle. Błędy przejściowe (timeout, HTTP 429/5xx) ponawiane są
+# SUPLA_RETRIES razy z rosnącym odstępem (SUPLA_RETRY_BACKOFF s, potem x2, x4...).
+SUPLA_DOWNLOAD_WINDOW_HOURS = 24
+SUPLA_REQUEST_TIMEOUT = 60
+SUPLA_RETRIES = 3
+SUPLA_RETRY_BACKOFF = 1.0
+
+# Pobieranie logów SUPLA stronami (liczba odczytów na żądanie) i rozmiar paczki
+# przy liczeniu bilansu godzinowego - ograniczają zużycie pamięci dla dużych okresów.
+SUPLA_PAGE_SIZE = 5000
+HOURLY_CHUNK_SIZE = 100_000
+
+# Rozdzielczość bilansu: 60 (godzinowy) lub 15 minut (kwadransowy - zgodnie z
+# kwadransowym rozliczeniem rynku). Ceny TGE godzinowe i kwadransowe działają w obu trybach.
+INTERVAL_MINUTES = 60
+
+# Kostka zużycia i kosztów (python supla_pge.py cube): każde przeliczenie miesiąca
+# zapisuje jego godziny do data/consumption_cube*.npz (False = bez zapisu).
+CONSUMPTION_CUBE = True
+
+# Elastyczne odbiory do zaplanowania w najtańszych godzinach
+# (python supla_pge.py shift 2025-01 2025-12).
+# window_start/window_end - okno w godzinach lokalnych (end <= start = przez północ),
+# max_kw - maks. pobór na godzinę (odbiór podzielny), block_hours - ciągły blok godzin.
+FLEXIBLE_LOADS = [
+    # {"name": "Ładowanie EV", "kwh": 4.0, "window_start": 18, "window_end": 7, "max_kw": 3.7},
+    # {"name": "Zmywarka", "kwh": 1.2, "window_start": 8, "window_end": 22, "block_hours": 2},
+]
+
+# Komunikaty postępu na konsolę (False = tylko wyniki)
+VERBOSE = True
+# Pomiary etapów (czas, wiersze, bajty, cache hit/miss): None = wyłączone,
+# "output/metrics.jsonl" = zdarzenia JSON (linia na etap),
+# "output/supla_pge.prom" = sumy w formacie Prometheus (node_exporter textfile).
+METRICS_FILE = None
+
+# Wykresy: CHART_SHOW = False - bez okna (tryb bezobsługowy, np. cron/serwer),
+# formaty plików i rozdzielczość (np. CHART_DPI = 40 dla szybkich miniatur).
+CHART_SHOW = True
+CHART_FORMATS = ["png"]
+CHART_DPI = 150
+
+# Serwis HTTP (python supla_pge.py serve): adres, liczba miesięcy/kanałów
+# trzymanych w pamięci (LRU) i jak często odświeżać bieżący miesiąc [s].
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8080
+SERVICE_CACHE_SIZE = 64
+SERVICE_REFRESH_SECONDS = 300
+
+# Podgląd bieżącego miesiąca na żywo (python supla_pge.py watch): jak często
+# odpytywać SUPLA [s] i gdzie zapisywać stan (None = output/live_<kanał>.json).
+WATCH_INTERVAL_SECONDS = 300
+WATCH_STATE_FILE = None
+
+# Symulowane ceny TGE (gdy brak prawdziwych): "default" - wbudowane wzorce RDN,
+# "fitted" - profil dopasowany do zapisanych cen (data/tge_prices*.csv/.npz),
+# albo słownik {"base_mwh": [24 wartości], "spread_mwh": [24 wartości], "weekend_factor": 0.7}.
+SIMULATED_PRICE_PROFILE = "default"
+SIMULATED_PRICE_SEED = 0      # to samo ziarno = te same ceny w każdym uruchomieniu
@@ -1,26 +1,298 @@
 # -*- coding: utf-8 -*-
 import base64
+import contextvars
+import hashlib
 import calendar
 import io
 import zipfile
 import json
 import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from dataclasses import dataclass
+from functools import lru_cache, wraps
 from datetime import datetime, timezone, timedelta
-from typing import Optional, Tuple, Dict
+from typing import Optional, Tuple, Dict, List
+from urllib.parse import urlsplit
 
 import pandas as pd
 import requests
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib.patches import Rectangle
 import numpy as np
 from io import StringIO
 
 # ----------------------------
 # KONFIGURACJA
 # ----------------------------
-from supla_config import *
+# Wartości domyślne opcji, których może brakować w starszych supla_config.py
+TGE_SCRAPER_WORKERS = 3
+TGE_FETCH_METHOD = "auto"
+SIMULATED_PRICE_PROFILE = "default"
+SIMULATED_PRICE_SEED = 0
+SUPLA_FLEET = []
+SUPLA_MAX_CONCURRENT_DOWNLOADS = 8
+SUPLA_PAGE_SIZE = 5000
+SUPLA_DOWNLOAD_WINDOW_HOURS = 24
+SUPLA_REQUEST_TIMEOUT = 60
+SUPLA_RETRIES = 3
+SUPLA_RETRY_BACKOFF = 1.0
+HOURLY_CHUNK_SIZE = 100_000
+INTERVAL_MINUTES = 60
+CONSUMPTION_CUBE = True
+FLEXIBLE_LOADS = []
+VERBOSE = True
+METRICS_FILE = None
+CHART_SHOW = True
+CHART_FORMATS = ["png"]
+CHART_DPI = 150
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8080
+SERVICE_CACHE_SIZE = 64
+SERVICE_REFRESH_SECONDS = 300
+WATCH_INTERVAL_SECONDS = 300
+WATCH_STATE_FILE = None
+
+try:
+    from supla_config import *
+except ModuleNotFoundError as e:
+    if e.name != "supla_config":
+        raise
+    # Bez supla_config.py: ceny i opcje z przykładowego pliku, token i kanał
+    # z --config / --token / --channel
+    import runpy
+    globals().update({k: v for k, v in runpy.run_path(os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "supla_config.example.py")).items() if k.isupper()})
+
+# Nadpisania konfiguracji (argumenty CLI, --config) - przekazywane też procesom roboczym
+_CONFIG_OVERRIDES: Dict[str, object] = {}
+
+
+def configure(overrides: Dict[str, object]):
+    """Nadpisuje opcje konfiguracji (np. {"YEAR": 2025, "CHANNEL_ID": 123}) w tym module."""
+    _CONFIG_OVERRIDES.update(overrides)
+    globals().update(overrides)
+
+
+def load_config_file(path: str) -> Dict[str, object]:
+    """Opcje (nazwy WIELKIMI LITERAMI) z dowolnego pliku w formacie supla_config.py."""
+    import runpy
+    return {k: v for k, v in runpy.run_path(path).items() if k.isupper()}
+
+
+# ----------------------------
+# POMOCNICZE: PLIKI
+# ----------------------------
+def _data_dir() -> str:
+    """Katalog danych (data/ obok src/): ceny TGE, cache logów SUPLA, kostka zużycia."""
+    return os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+# umask odczytany raz: os.umask zmienia ustawienie całego procesu, więc
+# odczyt przy każdym zapisie ścigałby się z innymi wątkami
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = "w", **kwargs):
+    """
+    Zapis przez unikalny plik tymczasowy w katalogu docelowym i os.replace:
+    czytający nigdy nie widzi połowy pliku, a równoległe zapisy (wątki,
+    procesy puli) nie dzielą pliku tymczasowego - wygrywa ostatni kompletny.
+    Uprawnienia jak przy zwykłym open(): istniejącego pliku albo 0666 & ~umask
+    (mkstemp tworzy plik 0600).
+    """
+    import stat
+    import tempfile
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                               prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+        try:
+            perms = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            perms = 0o666 & ~_UMASK
+        os.chmod(tmp, perms)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+@contextmanager
+def file_lock(path: str):
+    """Wyłączna blokada między procesami i wątkami (plik path + ".lock")."""
+    with open(path + ".lock", "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # czeka do ~10 s
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+# ----------------------------
+# POMIARY ETAPÓW I ZDARZENIA
+# ----------------------------
+_METRICS_LOCK = threading.Lock()
+_STAGE_TOTALS: Dict[Tuple[str, str], Dict[str, float]] = {}
+# Proces roboczy puli: sumy do pliku .prom zapisuje proces główny (merge_stage_totals)
+_METRICS_DEFERRED = False
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def log(*args, **kwargs):
+    """Komunikat postępu na konsolę - wyłączany przez VERBOSE = False."""
+    if VERBOSE:
+        print(*args, **kwargs)
+
+
+def span_add(**fields):
+    """Dopisuje pola (np. bytes=..., rows=...) do bieżącego etapu; liczby są sumowane."""
+    span = _current_span.get()
+    if span is None:
+        return
+    # Etap może być współdzielony przez wątki (np. okna pobierania SUPLA)
+    with _METRICS_LOCK:
+        for key, value in fields.items():
+            if isinstance(value, (int, float)) and isinstance(span.get(key), (int, float)):
+                span[key] += value
+            else:
+                span[key] = value
+
+
+@contextmanager
+def stage(name: str, **fields):
+    """
+    Etap potoku mierzony jako zdarzenie: czas trwania oraz pola dopisane
+    w trakcie (rows, bytes, cache = hit/miss/delta, source ...).
+
+    Zdarzenie trafia do METRICS_FILE: *.prom - tekst w formacie Prometheus
+    (sumy per etap, nadpisywany po każdym etapie), inne - linie JSON.
+    """
+    span = {"stage": name, **fields}
+    token = _current_span.set(span)
+    t0 = time.perf_counter()
+    try:
+        yield span
+        span.setdefault("status", "ok")
+    except BaseException as e:
+        span["status"] = "error"
+        span["error"] = str(e)[:200]
+        raise
+    finally:
+        span["seconds"] = round(time.perf_counter() - t0, 6)
+        _current_span.reset(token)
+        record_event(span)
+
+
+def staged(name: str):
+    """Dekorator: całe wywołanie funkcji jako etap `name` (rows = długość wyniku)."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name) as span:
+                result = fn(*args, **kwargs)
+                if isinstance(result, (pd.DataFrame, list)):
+                    span.setdefault("rows", len(result))
+                elif isinstance(result, dict) and "date_timestamp" in result:
+                    span.setdefault("rows", len(result["date_timestamp"]))
+                return result
+        return wrapper
+    return decorator
+
+
+def record_event(event: Dict):
+    if not METRICS_FILE:
+        return
+    event = {"ts": datetime.now(timezone.utc).isoformat(), "pid": os.getpid(), **event}
+    with _METRICS_LOCK:
+        key = (event["stage"], str(event.get("cache", "")))
+        totals = _STAGE_TOTALS.setdefault(key, {"runs": 0, "seconds": 0.0, "rows": 0, "bytes": 0})
+        totals["runs"] += 1
+        for field in ("seconds", "rows", "bytes"):
+            if isinstance(event.get(field), (int, float)):
+                totals[field] += event[field]
+
+        try:
+            if METRICS_FILE.endswith(".prom"):
+                if not _METRICS_DEFERRED:
+                    write_prometheus_metrics(METRICS_FILE)
+            else:
+                with open(METRICS_FILE, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+        except Exception as e:
+            print(f"⚠️  Błąd zapisu metryk: {e}", file=sys.stderr)
+
+
+def take_stage_totals() -> Dict[Tuple[str, str], Dict[str, float]]:
+    """Sumy etapów od ostatniego wywołania (proces roboczy oddaje je procesowi głównemu)."""
+    with _METRICS_LOCK:
+        totals = {key: dict(values) for key, values in _STAGE_TOTALS.items()}
+        _STAGE_TOTALS.clear()
+    return totals
+
+
+def merge_stage_totals(totals: Dict[Tuple[str, str], Dict[str, float]]):
+    """Dolicza sumy etapów z procesu roboczego i odświeża plik .prom."""
+    with _METRICS_LOCK:
+        for key, values in totals.items():
+            mine = _STAGE_TOTALS.setdefault(key, {"runs": 0, "seconds": 0.0, "rows": 0, "bytes": 0})
+            for field, value in values.items():
+                mine[field] += value
+        if METRICS_FILE and METRICS_FILE.endswith(".prom") and not _METRICS_DEFERRED:
+            try:
+                write_prometheus_metrics(METRICS_FILE)
+            except Exception as e:
+                print(f"⚠️  Błąd zapisu metryk: {e}", file=sys.stderr)
+
+
+def init_metrics_worker(overrides: Dict[str, object]):
+    """Inicjalizacja procesu roboczego: konfiguracja jak w procesie głównym, własne sumy od zera."""
+    global _METRICS_DEFERRED
+    configure(overrides)
+    _METRICS_DEFERRED = True
+    take_stage_totals()  # po fork: sumy odziedziczone z procesu głównego
+
+
+def write_prometheus_metrics(path: str):
+    """Sumy per etap w formacie tekstowym Prometheus (node_exporter textfile)."""
+    lines = []
+    for metric, field, help_text in (
+        ("supla_pge_stage_runs_total", "runs", "Liczba wykonań etapu"),
+        ("supla_pge_stage_seconds_total", "seconds", "Łączny czas etapu w sekundach"),
+        ("supla_pge_stage_rows_total", "rows", "Liczba przetworzonych wierszy"),
+        ("supla_pge_stage_bytes_total", "bytes", "Liczba przesłanych bajtów"),
+    ):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for (name, cache), totals in sorted(_STAGE_TOTALS.items()):
+            labels = f'stage="{name}"' + (f',cache="{cache}"' if cache else "")
+            lines.append(f"{metric}{{{labels}}} {totals[field]}")
+    with atomic_write(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
 
 
 # ----------------------------
@@ -32,6 +304,7 @@ from supla_config import *
 # ----------------------------
 # GIEŁDA TGE - RYNEK DNIA NASTĘPNEGO
 # ----------------------------
+@staged("tge_pse")
 def scrape_tge_from_pse_website(year: int, month: int) -> Optional[pd.DataFrame]:
     """
     Pobiera dane RDN z PSE (Polskie Sieci Elektroenergetyczne).
@@ -145,11 +418,7 @@ def load_tge_prices_from_csv(year: int, month: int) -> Optional[pd.DataFrame]:
     Returns:
         DataFrame z cenami lub None jeśli plik nie istnieje
     """
-    import os
-    
-    # Ścieżka do katalogu data (względem katalogu src)
-    data_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
-    filename = os.path.join(data_dir, f"tge_prices_{year}_{month:02d}.csv")
+    filename = os.path.join(_data_dir(), f"tge_prices_{year}_{month:02d}.csv")
     
     if not os.path.exists(filename):
         return None
@@ -158,7 +427,7 @@ def load_tge_prices_from_csv(year: int, month: int) -> Optional[pd.DataFrame]:
         df = pd.read_csv(filename, parse_dates=['timestamp'])
         
         if 'timestamp' not in df.columns or 'price_kwh' not in df.columns:
-            print(f"    ⚠️  Błędny format CSV: wymagane kolumny 'timestamp' i 'price_kwh'")
+            log(f"    ⚠️  Błędny format CSV: wymagane kolumny 'timestamp' i 'price_kwh'")
             return None
         
         # Konwertuj timestamp na UTC i local
@@ -166,46 +435,490 @@ def load_tge_prices_from_csv(year: int, month: int) -> Optional[pd.DataFrame]:
         df['timestamp_local'] = df['timestamp_utc'].dt.tz_convert('Europe/Warsaw')
         df['price_per_kwh_netto'] = df['price_kwh']
         
-        print(f"    ✅ Wczytano {len(df)} rekordów z {filename}")
+        log(f"    ✅ Wczytano {len(df)} rekordów z {filename}")
         return df[['timestamp_utc', 'timestamp_local', 'price_per_kwh_netto']]
         
     except Exception as e:
-        print(f"    ⚠️  Błąd wczytywania CSV: {e}")
+        log(f"    ⚠️  Błąd wczytywania CSV: {e}")
         return None
 
 
-def scrape_tge_prices_from_pge(date_str: str, verbose: bool = False) -> Optional[pd.DataFrame]:
+# ----------------------------
+# ARCHIWUM CEN TGE
+# ----------------------------
+@dataclass
+class TgePriceArchive:
     """
-    Scraping cen TGE ze strony PGE używając Selenium (renderowanie JavaScript).
-    
-    Wymaga instalacji:
-        pip install selenium webdriver-manager
-    
-    Strona PGE ładuje dane dynamicznie przez JavaScript, więc używamy
-    headless Chrome do renderowania strony i wyciągania danych z kontenera.
-    
+    Wspólne archiwum cen TGE dla dowolnej liczby lat.
+
+    hours - posortowane, unikalne początki godzin UTC (epoch, int64),
+    prices - cena netto zł/kWh dla każdej godziny,
+    sources - zaimportowane pliki miesięczne CSV {nazwa: mtime}.
+    Zakres godzin wyszukiwany jest przez searchsorted (bez skanowania całości).
+    """
+    hours: np.ndarray
+    prices: np.ndarray
+    sources: Dict[str, float]
+
+    def upsert(self, hours: np.ndarray, prices: np.ndarray):
+        """Dodaje/nadpisuje ceny dla podanych godzin (nowe wartości wygrywają)."""
+        hours = np.asarray(hours, dtype=np.int64)
+        prices = np.asarray(prices, dtype=float)
+        all_hours = np.concatenate([hours, self.hours])
+        all_prices = np.concatenate([prices, self.prices])
+        # np.unique zwraca pierwsze wystąpienie -> nowe wartości mają pierwszeństwo
+        self.hours, first = np.unique(all_hours, return_index=True)
+        self.prices = all_prices[first]
+
+    def slice(self, start_utc: datetime, end_utc: datetime) -> pd.DataFrame:
+        """Ceny dla godzin w [start_utc, end_utc) w formacie fetch_tge_prices."""
+        lo = np.searchsorted(self.hours, int(start_utc.timestamp()), side='left')
+        hi = np.searchsorted(self.hours, int(end_utc.timestamp()), side='left')
+        df = pd.DataFrame({
+            'timestamp_utc': pd.to_datetime(self.hours[lo:hi], unit='s', utc=True),
+            'price_per_kwh_netto': self.prices[lo:hi],
+        })
+        df['timestamp_local'] = df['timestamp_utc'].dt.tz_convert('Europe/Warsaw')
+        return df[['timestamp_utc', 'timestamp_local', 'price_per_kwh_netto']]
+
+
+def tge_archive_path() -> str:
+    return os.path.join(_data_dir(), "tge_prices.npz")
+
+
+def read_tge_csv_hours(filename: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Czyta plik tge_prices_YYYY_MM.csv jako (godziny UTC epoch, ceny)."""
+    df = pd.read_csv(filename)
+    if 'timestamp' not in df.columns or 'price_kwh' not in df.columns:
+        raise ValueError("wymagane kolumny 'timestamp' i 'price_kwh'")
+    hours = pd.to_datetime(df['timestamp']).to_numpy().astype('datetime64[s]').astype(np.int64)
+    return hours, df['price_kwh'].to_numpy(dtype=float)
+
+
+def save_tge_archive(archive: TgePriceArchive):
+    names = np.array(sorted(archive.sources), dtype=str)
+    mtimes = np.array([archive.sources[n] for n in names], dtype=float)
+    with atomic_write(tge_archive_path(), 'wb') as f:
+        np.savez_compressed(f, hours=archive.hours, prices=archive.prices,
+                            source_names=names, source_mtimes=mtimes)
+
+
+def tge_csv_sources() -> Dict[str, Tuple[str, float]]:
+    """Miesięczne pliki CSV cen: {nazwa: (ścieżka, mtime)}."""
+    import glob
+
+    sources = {}
+    for filename in sorted(glob.glob(os.path.join(_data_dir(), "tge_prices_*_*.csv"))):
+        sources[os.path.basename(filename)] = (filename, os.path.getmtime(filename))
+    return sources
+
+
+def read_tge_archive() -> TgePriceArchive:
+    """Archiwum cen z pliku .npz (puste, gdy brak pliku lub jest uszkodzony)."""
+    path = tge_archive_path()
+    if os.path.exists(path):
+        try:
+            with np.load(path) as npz:
+                return TgePriceArchive(
+                    npz['hours'], npz['prices'],
+                    dict(zip(npz['source_names'].tolist(), npz['source_mtimes'].tolist())),
+                )
+        except Exception as e:
+            log(f"    ⚠️  Błąd odczytu archiwum cen TGE: {e}. Odbudowuję z CSV...")
+    return TgePriceArchive(np.empty(0, dtype=np.int64), np.empty(0), {})
+
+
+def _stale_tge_sources(archive: TgePriceArchive, sources: Dict[str, Tuple[str, float]]) -> List[str]:
+    return [name for name, (_, mtime) in sources.items() if archive.sources.get(name) != mtime]
+
+
+# Ostatnio wczytane archiwum i wersje plików, z których powstało (npz i CSV)
+_TGE_ARCHIVE_MEMO: Dict[str, object] = {}
+_TGE_ARCHIVE_MEMO_LOCK = threading.Lock()
+
+
+def _tge_archive_version(sources: Dict[str, Tuple[str, float]]) -> Tuple:
+    path = tge_archive_path()
+    npz_mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    return npz_mtime, tuple((name, mtime) for name, (_, mtime) in sources.items())
+
+
+@staged("tge_archive")
+def load_tge_archive() -> TgePriceArchive:
+    """
+    Wczytuje archiwum cen i dołącza do niego miesięczne pliki CSV,
+    których jeszcze nie zawiera (lub które zmieniły się od importu).
+    Przy pierwszym użyciu buduje archiwum ze wszystkich istniejących CSV.
+
+    Przebudowa odbywa się pod blokadą pliku archiwum - równoległe procesy
+    (zakres miesięcy) i wątki serwisu nie nadpisują sobie nawzajem zmian:
+    kolejny czeka, wczytuje archiwum zapisane przez poprzedniego i dołącza
+    tylko to, czego jeszcze brakuje.
+
+    Archiwum trzymane jest w pamięci: dopóki pliki (npz i CSV) mają te same
+    mtime, zwracany jest ten sam obiekt bez ponownego czytania npz.
+    Zwrócone archiwum jest tylko do odczytu.
+    """
+    sources = tge_csv_sources()
+    version = _tge_archive_version(sources)
+    with _TGE_ARCHIVE_MEMO_LOCK:
+        if _TGE_ARCHIVE_MEMO.get("version") == version:
+            archive = _TGE_ARCHIVE_MEMO["archive"]
+            span_add(cache="memory", rows=len(archive.hours))
+            return archive
+
+    archive = read_tge_archive()
+    if not _stale_tge_sources(archive, sources):
+        span_add(cache="hit", rows=len(archive.hours))
+        return _remember_tge_archive(archive, version)
+
+    os.makedirs(_data_dir(), exist_ok=True)
+    with file_lock(tge_archive_path()):
+        archive = read_tge_archive()
+        sources = tge_csv_sources()
+        changed = False
+        for name in _stale_tge_sources(archive, sources):
+            filename, mtime = sources[name]
+            try:
+                hours, prices = read_tge_csv_hours(filename)
+            except Exception as e:
+                log(f"    ⚠️  Pomijam {name}: {e}")
+                continue
+            archive.upsert(hours, prices)
+            archive.sources[name] = mtime
+            changed = True
+
+        span_add(cache="miss" if changed else "hit", rows=len(archive.hours))
+        if changed:
+            try:
+                save_tge_archive(archive)
+            except Exception as e:
+                log(f"    ⚠️  Błąd zapisu archiwum cen TGE: {e}")
+                return archive
+        return _remember_tge_archive(archive, _tge_archive_version(sources))
+
+
+def _remember_tge_archive(archive: TgePriceArchive, version: Tuple) -> TgePriceArchive:
+    with _TGE_ARCHIVE_MEMO_LOCK:
+        _TGE_ARCHIVE_MEMO.update(version=version, archive=archive)
+    return archive
+
+
+def load_tge_prices_range(start_utc: datetime, end_utc: datetime) -> Optional[pd.DataFrame]:
+    """Ceny TGE z archiwum dla [start_utc, end_utc) lub None, jeśli brak danych."""
+    df = load_tge_archive().slice(start_utc, end_utc)
+    return df if not df.empty else None
+
+
+# ----------------------------
+# SYMULACJA CEN TGE
+# ----------------------------
+@dataclass(frozen=True)
+class PriceProfile:
+    """
+    Profil symulowanych cen RDN: dla każdej godziny lokalnej (0-23) cena
+    bazowa dnia roboczego i szerokość rozrzutu (zł/MWh), cena w weekend
+    mnożona przez weekend_factor.
+    """
+    base_mwh: Tuple[float, ...]
+    spread_mwh: Tuple[float, ...]
+    weekend_factor: float = 0.70
+
+
+def _hourly_bands(bands: List[Tuple[int, int, float]]) -> Tuple[float, ...]:
+    """[(od, do, wartość)] -> 24 wartości godzinowe."""
+    values = [0.0] * 24
+    for start, end, value in bands:
+        for h in range(start, end):
+            values[h] = float(value)
+    return tuple(values)
+
+
+# Wzorce cen RDN (zł/MWh) - bazowane na danych historycznych 2024:
+# - Noc (22-6): 200-400 zł/MWh
+# - Dzień (6-22): 350-650 zł/MWh
+# - Szczyty (7-9, 17-20): 500-900 zł/MWh
+DEFAULT_PRICE_PROFILE = PriceProfile(
+    base_mwh=_hourly_bands([(0, 6, 300), (6, 7, 450), (7, 10, 700), (10, 15, 500),
+                            (15, 17, 550), (17, 21, 750), (21, 22, 600), (22, 24, 350)]),
+    spread_mwh=_hourly_bands([(0, 6, 60), (6, 7, 90), (7, 10, 120), (10, 15, 80),
+                              (15, 17, 90), (17, 21, 130), (21, 22, 100), (22, 24, 70)]),
+)
+
+
+def fit_price_profile(prices: pd.DataFrame) -> PriceProfile:
+    """
+    Profil dopasowany do historycznych cen (format fetch_tge_prices): średnia
+    i rozrzut per godzina lokalna w dni robocze, stosunek cen weekend/robocze.
+    Rozrzut dobrany tak, by szum jednostajny miał odchylenie jak w danych.
+    """
+    local = prices['timestamp_utc'].dt.tz_convert('Europe/Warsaw')
+    hour = local.dt.hour.to_numpy()
+    weekend = local.dt.dayofweek.to_numpy() >= 5
+    mwh = prices['price_per_kwh_netto'].to_numpy(dtype=float) * 1000
+
+    workday = pd.Series(mwh[~weekend]).groupby(hour[~weekend])
+    base = workday.mean().reindex(range(24))
+    spread = (workday.std() * np.sqrt(12)).reindex(range(24))
+    if base.isna().any():
+        raise ValueError("Za mało historycznych cen do dopasowania profilu (brak niektórych godzin)")
+
+    weekend_factor = DEFAULT_PRICE_PROFILE.weekend_factor
+    if weekend.any():
+        weekend_mean = pd.Series(mwh[weekend]).groupby(hour[weekend]).mean().reindex(range(24))
+        ratio = (weekend_mean / base).mean()
+        if np.isfinite(ratio):
+            weekend_factor = float(ratio)
+
+    return PriceProfile(
+        base_mwh=tuple(base.round(2).tolist()),
+        spread_mwh=tuple(spread.fillna(0.0).round(2).tolist()),
+        weekend_factor=round(weekend_factor, 4),
+    )
+
+
+@lru_cache(maxsize=None)
+def _fitted_price_profile() -> PriceProfile:
+    archive = load_tge_archive()
+    if not len(archive.hours):
+        log("       ⚠️  Brak historycznych cen TGE - używam domyślnego profilu symulacji")
+        return DEFAULT_PRICE_PROFILE
+    df = archive.slice(datetime.fromtimestamp(int(archive.hours[0]), tz=timezone.utc),
+                       datetime.fromtimestamp(int(archive.hours[-1]) + 3600, tz=timezone.utc))
+    return fit_price_profile(df)
+
+
+def price_profile() -> PriceProfile:
+    """Profil z SIMULATED_PRICE_PROFILE: "default", "fitted" (z archiwum cen) lub słownik pól PriceProfile."""
+    if isinstance(SIMULATED_PRICE_PROFILE, PriceProfile):
+        return SIMULATED_PRICE_PROFILE
+    if isinstance(SIMULATED_PRICE_PROFILE, dict):
+        return PriceProfile(**SIMULATED_PRICE_PROFILE)
+    if SIMULATED_PRICE_PROFILE == "fitted":
+        return _fitted_price_profile()
+    if SIMULATED_PRICE_PROFILE == "default":
+        return DEFAULT_PRICE_PROFILE
+    raise ValueError(f"Nieznany profil symulacji cen: {SIMULATED_PRICE_PROFILE}")
+
+
+def _uniform_noise(hours: np.ndarray, seed: int) -> np.ndarray:
+    """
+    Szum jednostajny [-0.5, 0.5) jako funkcja (godzina, seed) - mieszanie splitmix64.
+    Ta sama godzina daje tę samą wartość niezależnie od zakresu i uruchomienia.
+    """
+    x = hours.astype(np.uint64) + np.uint64(seed & 0xFFFFFFFFFFFFFFFF) * np.uint64(0x9E3779B97F4A7C15)
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x = x ^ (x >> np.uint64(31))
+    return (x >> np.uint64(11)).astype(np.float64) / float(1 << 53) - 0.5
+
+
+def simulate_tge_prices(start_utc: datetime, end_utc: datetime, profile: PriceProfile = None,
+                        seed: int = None) -> pd.DataFrame:
+    """
+    Symulowane godzinowe ceny TGE dla [start_utc, end_utc) - jeden przebieg NumPy,
+    także dla zakresów wieloletnich.
+
     Args:
-        date_str: Data w formacie YYYY-MM-DD
-        verbose: Jeśli True, wypisuje logi diagnostyczne
-    
+        profile: Profil cen (domyślnie price_profile() z konfiguracji)
+        seed: Ziarno szumu (domyślnie SIMULATED_PRICE_SEED) - te same parametry
+              dają te same ceny w każdym uruchomieniu
+
     Returns:
-        DataFrame z cenami godzinowymi [timestamp_local, price_per_kwh_netto] lub None
+        DataFrame [timestamp_utc, timestamp_local, price_per_kwh_netto]
     """
-    try:
+    profile = profile or price_profile()
+    seed = SIMULATED_PRICE_SEED if seed is None else seed
+
+    hours_utc = pd.date_range(pd.Timestamp(start_utc).ceil('h'), pd.Timestamp(end_utc), freq='h',
+                              inclusive='left')
+    local = hours_utc.tz_convert('Europe/Warsaw')
+    hour = local.hour.to_numpy()
+
+    base = np.asarray(profile.base_mwh, dtype=float)[hour]
+    spread = np.asarray(profile.spread_mwh, dtype=float)[hour]
+    base = np.where(local.dayofweek.to_numpy() >= 5, base * profile.weekend_factor, base)
+
+    epoch_hours = hours_utc.as_unit('s').asi8 // 3600
+    price_mwh = base + _uniform_noise(epoch_hours, seed) * spread
+
+    return pd.DataFrame({
+        'timestamp_utc': hours_utc,
+        'timestamp_local': local,
+        'price_per_kwh_netto': price_mwh / 1000,  # zł/MWh -> zł/kWh
+    })
+
+
+PGE_TGE_URL = 'https://www.gkpge.pl/dla-domu/oferta/dynamiczna-energia-z-pge'
+
+
+_CHROMEDRIVER_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _install_chromedriver() -> str:
+    from webdriver_manager.chrome import ChromeDriverManager
+    return ChromeDriverManager().install()
+
+
+def _chromedriver_path() -> str:
+    """
+    Ścieżka do chromedrivera - ChromeDriverManager().install() wywoływany raz
+    na proces. lru_cache nie chroni przed równoczesnym pierwszym wywołaniem
+    z kilku wątków przeglądarek (TGE_SCRAPER_WORKERS), stąd blokada.
+    """
+    with _CHROMEDRIVER_LOCK:
+        return _install_chromedriver()
+
+
+def pge_quotes_date(text: str) -> Optional[str]:
+    """Data notowań z nagłówka "Notowania TGE z dnia ..." (YYYY-MM-DD lub DD.MM.YYYY) lub None."""
+    import re
+
+    match = re.search(r'z\s+dnia\s+(\d{4})-(\d{2})-(\d{2})', text)
+    if match:
+        year, month, day = match.groups()
+    else:
+        match = re.search(r'z\s+dnia\s+(\d{1,2})[./](\d{1,2})[./](\d{4})', text)
+        if not match:
+            return None
+        day, month, year = match.groups()
+    return f"{int(year):04d}-{int(month):02d}-{int(day):02d}"
+
+
+def parse_pge_tge_page(page_source: str, date_str: str) -> Optional[pd.DataFrame]:
+    """
+    Wyciąga ceny godzinowe (lub kwadransowe) z wyrenderowanego HTML strony PGE.
+
+    Gdy odpowiedź ma nagłówek "Notowania TGE z dnia ..." wskazujący inny
+    dzień niż date_str (np. strona zignorowała wysłaną datę i pokazała
+    domyślny dzień), zwracane jest None. Odpowiedź bez nagłówka jest
+    przyjmowana jako notowania z date_str (z ostrzeżeniem) - zmiana układu
+    strony nie może zablokować pobierania.
+
+    Args:
+        page_source: HTML strony po załadowaniu notowań
+        date_str: Data notowań w formacie YYYY-MM-DD
+
+    Returns:
+        DataFrame [timestamp_local, price_per_kwh_netto] lub None
+    """
+    from bs4 import BeautifulSoup
+    import re
+    import pytz
+
+    # Sprawdź czy dane załadowane
+    if 'PLN/kWh' not in page_source and 'PLN/MWh' not in page_source:
+        return None
+
+    soup = BeautifulSoup(page_source, 'html.parser')
+
+    # Znajdź kontener z danymi TGE
+    tge_container = soup.find('div', class_='tge-quotes-element-container')
+    if not tge_container:
+        tge_container = soup.find('div', {'id': 'application-143455'})
+
+    if not tge_container:
+        # Odpowiedź AJAX formularza może zawierać sam fragment z notowaniami
+        if 'Kurs (PLN/kWh)' not in page_source:
+            return None
+        tge_container = soup
+
+    # Wyciągnij cały tekst z kontenera
+    container_text = tge_container.get_text(separator='\n', strip=True)
+
+    quotes_date = pge_quotes_date(container_text) or pge_quotes_date(soup.get_text(separator=' '))
+    if quotes_date is None:
+        log(f"    ⚠️  Brak daty notowań na stronie PGE - przyjmuję {date_str}")
+    elif quotes_date != date_str:
+        log(f"    ⚠️  Notowania PGE z dnia {quotes_date} zamiast {date_str} - pomijam")
+        return None
+
+    # Parse tekst szukając cen po nagłówku "Kurs (PLN/kWh)"
+    # Format z nowymi liniami: "0-1\n295.50\n0.29550\n1-2\n300.00\n0.30000..."
+    parts = container_text.split('Kurs (PLN/kWh)')
+    if len(parts) < 2:
+        return None
+
+    data_section = parts[1]
+
+    # Wzorzec: początek-koniec \n liczba_MWh \n cena_kWh, okres godzinowy lub kwadransowy
+    # Pattern dopasowuje: "0-1\n295.50\n0.29550" -> ('0', '', '1', '', '0.29550')
+    # oraz "0:15-0:30\n295.50\n0.29550" -> ('0', '15', '0', '30', '0.29550')
+    pattern = r'(\d{1,2})(?::(\d{2}))?\s*-\s*(\d{1,2})(?::(\d{2}))?\s*[\d.]+\s*(0\.\d+)'
+    matches = re.findall(pattern, data_section)
+
+    prices = []
+    for match in matches:
+        try:
+            hour_start = int(match[0])
+            minute_start = int(match[1] or 0)
+            price_kwh = float(match[4])  # Już w PLN/kWh
+
+            if 0 <= hour_start < 24 and minute_start in (0, 15, 30, 45) and 0.01 <= price_kwh <= 10:
+                prices.append((hour_start, minute_start, price_kwh))
+        except:
+            continue
+
+    if not prices:
+        return None
+
+    # Konwertuj na DataFrame
+    date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+    warsaw_tz = pytz.timezone('Europe/Warsaw')
+
+    data = []
+    for hour, minute, price in prices:
+        try:
+            timestamp_local = warsaw_tz.localize(
+                datetime(date_obj.year, date_obj.month, date_obj.day, hour, minute, 0)
+            )
+            data.append({
+                'timestamp_local': timestamp_local,
+                'price_per_kwh_netto': price
+            })
+        except Exception as e:
+            continue
+
+    if not data:
+        return None
+
+    return pd.DataFrame(data)
+
+
+class PgeTgeBrowser:
+    """
+    Jedna przeglądarka (headless Chrome) z załadowaną stroną PGE,
+    używana wielokrotnie do pobierania notowań kolejnych dni.
+
+    Zamiast stałego time.sleep czeka, aż zawartość kontenera z notowaniami
+    zmieni się po wysłaniu formularza.
+
+    Użycie:
+        with PgeTgeBrowser() as browser:
+            df = browser.fetch_day("2025-12-01")
+    """
+
+    CONTAINER_CSS = 'div.tge-quotes-element-container, div#application-143455'
+
+    def __init__(self, verbose: bool = False, timeout: float = 15):
+        self.verbose = verbose
+        self.timeout = timeout
+        self.driver = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self):
         from selenium import webdriver
         from selenium.webdriver.chrome.service import Service
         from selenium.webdriver.chrome.options import Options
-        from selenium.webdriver.common.by import By
-        from selenium.webdriver.common.keys import Keys
-        from selenium.webdriver.support.ui import WebDriverWait
-        from selenium.webdriver.support import expected_conditions as EC
-        from webdriver_manager.chrome import ChromeDriverManager
-        from bs4 import BeautifulSoup
-        import time
-        import re
-        import pytz
-        from datetime import datetime
-        
+
         # Konfiguracja headless Chrome
         chrome_options = Options()
         chrome_options.add_argument('--headless=new')
@@ -213,134 +926,326 @@ def scrape_tge_prices_from_pge(date_str: str, verbose: bool = False) -> Optional
         chrome_options.add_argument('--disable-dev-shm-usage')
         chrome_options.add_argument('--disable-gpu')
         chrome_options.add_argument('--log-level=3')
-        
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-        
+
+        service = Service(_chromedriver_path())
+        self.driver = webdriver.Chrome(service=service, options=chrome_options)
+        self.driver.get(PGE_TGE_URL)
+
+    def close(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            finally:
+                self.driver = None
+
+    def _container_text(self) -> str:
+        from selenium.webdriver.common.by import By
+        try:
+            return self.driver.find_element(By.CSS_SELECTOR, self.CONTAINER_CSS).text
+        except Exception:
+            return ''
+
+    @staged("tge_scrape_day")
+    def fetch_day(self, date_str: str) -> Optional[pd.DataFrame]:
+        """Pobiera notowania dla jednego dnia (YYYY-MM-DD) lub None."""
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.common.exceptions import TimeoutException
+
         try:
-            # Załaduj stronę PGE
-            url = 'https://www.gkpge.pl/dla-domu/oferta/dynamiczna-energia-z-pge'
-            driver.get(url)
-            
-            # Czekaj na załadowanie strony
-            wait = WebDriverWait(driver, 15)
-            
+            wait = WebDriverWait(self.driver, self.timeout)
+
             # Znajdź input daty i ustaw datę
             try:
                 date_input = wait.until(EC.presence_of_element_located((By.ID, "tge_quotes_form_dateTime")))
-                
+                before = self._container_text()
+
                 # Ustaw datę przez JS (omija problem element not interactable)
-                driver.execute_script("arguments[0].value = arguments[1];", date_input, date_str)
-                driver.execute_script("arguments[0].dispatchEvent(new Event('change'));", date_input)
-                
+                self.driver.execute_script("arguments[0].value = arguments[1];", date_input, date_str)
+                self.driver.execute_script("arguments[0].dispatchEvent(new Event('change'));", date_input)
+
                 # Znajdź przycisk "Zastosuj" i kliknij
-                submit_btn = driver.find_element(By.ID, "tge_quotes_form_submit")
-                driver.execute_script("arguments[0].click();", submit_btn)
-                
-                # Czekaj na przeładowanie danych (np. aż zniknie loader lub pojawi się tabela)
-                # Proste czekanie 5s powinno wystarczyć na AJAX
-                time.sleep(5)
-                
+                submit_btn = self.driver.find_element(By.ID, "tge_quotes_form_submit")
+                self.driver.execute_script("arguments[0].click();", submit_btn)
+
+                # Czekaj aż AJAX podmieni notowania w kontenerze
+                try:
+                    wait.until(lambda d: (lambda t: t != before and 'PLN/kWh' in t)(self._container_text()))
+                except TimeoutException:
+                    # Treść się nie zmieniła - np. strona już pokazywała żądany dzień
+                    if self.verbose:
+                        log(f"         [DEBUG] ⚠️  Brak zmiany notowań po wysłaniu formularza ({date_str})")
+
+            except TimeoutException:
+                raise
             except Exception as e:
-                if verbose:
-                    print(f"         [DEBUG] ⚠️  Problem z ustawianiem daty: {e}")
+                if self.verbose:
+                    log(f"         [DEBUG] ⚠️  Problem z ustawianiem daty: {e}")
                 # Kontynuuj, może domyślna data jest OK (dla dzisiaj/jutro)
-            
-            # Pobierz wyrenderowany HTML
-            page_source = driver.page_source
-            
-            # Sprawdź czy dane załadowane
-            if 'PLN/kWh' not in page_source and 'PLN/MWh' not in page_source:
-                driver.quit()
-                return None
-            
-            # Parse HTML
-            soup = BeautifulSoup(page_source, 'html.parser')
-            
-            # Znajdź kontener z danymi TGE
-            tge_container = soup.find('div', class_='tge-quotes-element-container')
-            if not tge_container:
-                tge_container = soup.find('div', {'id': 'application-143455'})
-            
-            if not tge_container:
-                driver.quit()
-                return None
-            
-            # Wyciągnij cały tekst z kontenera
-            container_text = tge_container.get_text(separator='\n', strip=True)
-            
-            # Parse tekst szukając cen po nagłówku "Kurs (PLN/kWh)"
-            # Format z nowymi liniami: "0-1\n295.50\n0.29550\n1-2\n300.00\n0.30000..."
-            parts = container_text.split('Kurs (PLN/kWh)')
-            if len(parts) < 2:
-                driver.quit()
-                return None
-            
-            data_section = parts[1]
-            
-            # Wzorzec: godzina_start-godzina_koniec \n liczba_MWh \n cena_kWh
-            # Pattern dopasowuje: "0-1\n295.50\n0.29550" -> ('0', '1', '0.29550')
-            pattern = r'(\d+)-(\d+)\s*[\d.]+\s*(0\.\d+)'
-            matches = re.findall(pattern, data_section)
-            
-            prices = []
-            for match in matches:
-                try:
-                    hour_start = int(match[0])
-                    price_kwh = float(match[2])  # Już w PLN/kWh
-                    
-                    if 0 <= hour_start < 24 and 0.01 <= price_kwh <= 10:
-                        prices.append((hour_start, price_kwh))
-                except:
-                    continue
-            
-            driver.quit()
-            
-            if not prices:
-                return None
-            
-            # Konwertuj na DataFrame
-            date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-            warsaw_tz = pytz.timezone('Europe/Warsaw')
-            
-            data = []
-            for hour, price in prices:
-                try:
-                    timestamp_local = warsaw_tz.localize(
-                        datetime(date_obj.year, date_obj.month, date_obj.day, hour, 0, 0)
-                    )
-                    data.append({
-                        'timestamp_local': timestamp_local,
-                        'price_per_kwh_netto': price
-                    })
-                except Exception as e:
-                    continue
-            
-            if not data:
-                return None
-                
-            return pd.DataFrame(data)
-            
-        except Exception as e:
-            if verbose:
-                print(f"         [DEBUG] ❌ Wyjątek wewnętrzny: {e}")
-            driver.quit()
+
+            page_source = self.driver.page_source
+            span_add(date=date_str, bytes=len(page_source))
+            return parse_pge_tge_page(page_source, date_str)
+
+        except Exception as e:
+            if self.verbose:
+                log(f"         [DEBUG] ❌ Wyjątek wewnętrzny: {e}")
+            # Przeładuj stronę, żeby kolejny dzień zaczynał od czystego stanu
+            try:
+                self.driver.get(PGE_TGE_URL)
+            except Exception:
+                pass
             return None
-            
-    except ImportError as e:
-        # Selenium nie zainstalowany
-        if verbose:
-            print(f"         [DEBUG] ❌ ImportError: {e}")
-        return None
-    except Exception as e:
-        if verbose:
-            print(f"         [DEBUG] ❌ Wyjątek zewnętrzny: {e}")
-        return None
+
+
+class PgeTgeHttpClient:
+    """
+    Pobieranie notowań TGE ze strony PGE bez przeglądarki.
+
+    Wysyła to samo żądanie, które wysyła formularz tge_quotes_form: pola
+    formularza (w tym token CSRF) odczytywane są raz ze strony, a potem
+    dla każdego dnia podmieniana jest tylko data. Odpowiedź (cała strona
+    lub fragment HTML) parsowana jest przez parse_pge_tge_page.
+
+    Użycie:
+        with PgeTgeHttpClient() as client:
+            df = client.fetch_day("2025-12-01")
+    """
+
+    FORM_NAME = 'tge_quotes_form'
+
+    def __init__(self, verbose: bool = False, timeout: float = 15, url: str = None):
+        self.verbose = verbose
+        self.timeout = timeout
+        self.url = url or PGE_TGE_URL
+        self.session = None
+        self.form = None
+        self.form_loaded = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self):
+        self.form_loaded = False
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = 'Mozilla/5.0 (supla-pge)'
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def load_form(self) -> Dict:
+        """Akcja, metoda i pola formularza notowań ze strony PGE."""
+        from bs4 import BeautifulSoup
+        from urllib.parse import urljoin
+
+        r = self.session.get(self.url, timeout=self.timeout)
+        r.raise_for_status()
+        soup = BeautifulSoup(r.text, 'html.parser')
+        form = soup.find('form', attrs={'name': self.FORM_NAME})
+        if form is None:
+            date_input = soup.find(id=f'{self.FORM_NAME}_dateTime')
+            form = date_input.find_parent('form') if date_input is not None else None
+        if form is None:
+            raise RuntimeError("Nie znaleziono formularza notowań TGE na stronie PGE")
+
+        fields = {}
+        for field in form.find_all(['input', 'select']):
+            name = field.get('name')
+            if not name or field.get('type') in ('submit', 'button'):
+                continue
+            fields[name] = field.get('value', '')
+
+        date_field = next((n for n in fields if n.endswith('[dateTime]')), f'{self.FORM_NAME}[dateTime]')
+        self.form = {
+            'action': urljoin(r.url, form.get('action') or r.url),
+            'method': (form.get('method') or 'get').lower(),
+            'fields': fields,
+            'date_field': date_field,
+        }
+        return self.form
+
+    def _submit(self, date_str: str) -> str:
+        data = dict(self.form['fields'])
+        data[self.form['date_field']] = date_str
+        headers = {'X-Requested-With': 'XMLHttpRequest', 'Referer': self.url}
+        if self.form['method'] == 'post':
+            r = self.session.post(self.form['action'], data=data, headers=headers, timeout=self.timeout)
+        else:
+            r = self.session.get(self.form['action'], params=data, headers=headers, timeout=self.timeout)
+        r.raise_for_status()
+        span_add(bytes=len(r.content))
+
+        if 'json' in r.headers.get('Content-Type', ''):
+            # Odpowiedź JSON z fragmentem HTML w jednym z pól
+            payload = r.json()
+            values = payload.values() if isinstance(payload, dict) else payload
+            return '\n'.join(v for v in values if isinstance(v, str))
+        return r.text
+
+    @staged("tge_http_day")
+    def fetch_day(self, date_str: str) -> Optional[pd.DataFrame]:
+        """
+        Pobiera notowania dla jednego dnia (YYYY-MM-DD) lub None.
+
+        Strona z formularzem pobierana jest najwyżej raz na sesję - dzień,
+        którego nie udało się pobrać, trafia do zapasowego Selenium zamiast
+        kolejnych pobrań całej strony.
+        """
+        span_add(date=date_str)
+        try:
+            if not self.form_loaded:
+                self.form_loaded = True
+                self.load_form()
+            if self.form is None:
+                return None
+            df = parse_pge_tge_page(self._submit(date_str), date_str)
+            if df is not None and not df.empty:
+                return df
+        except Exception as e:
+            if self.verbose:
+                log(f"         [DEBUG] ⚠️  HTTP {date_str}: {e}")
         return None
+
+
+def scrape_tge_prices_from_pge(date_str: str, verbose: bool = False) -> Optional[pd.DataFrame]:
+    """
+    Pobieranie cen TGE ze strony PGE: bezpośrednio przez HTTP
+    (PgeTgeHttpClient), a gdy to się nie uda - przez Selenium
+    (headless Chrome renderujący stronę), zgodnie z TGE_FETCH_METHOD.
+    
+    Selenium (tylko jako zapasowy sposób) wymaga instalacji:
+        pip install selenium webdriver-manager
+    
+    Dla wielu dni użyj scrape_tge_prices_range (jedna sesja / przeglądarka na wiele dni).
+    
+    Args:
+        date_str: Data w formacie YYYY-MM-DD
+        verbose: Jeśli True, wypisuje logi diagnostyczne
     
-    return None
+    Returns:
+        DataFrame z cenami godzinowymi [timestamp_local, price_per_kwh_netto] lub None
+    """
+    return scrape_tge_prices_range([date_str], workers=1, verbose=verbose).get(date_str)
+
+
+def _fetch_days_pool(dates: List[str], workers: int, make_fetcher, verbose: bool = False,
+                     progress=None) -> Dict[str, pd.DataFrame]:
+    """
+    Pobiera dni ze wspólnej kolejki na puli wątków; każdy wątek tworzy raz
+    własny fetcher (PgeTgeBrowser / PgeTgeHttpClient) i używa go dla kolejnych dni.
+    """
+    import queue
+
+    workers = max(1, min(workers or TGE_SCRAPER_WORKERS, len(dates)))
+    pending = queue.Queue()
+    for date_str in dates:
+        pending.put(date_str)
+
+    results = {}
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            with make_fetcher() as fetcher:
+                while True:
+                    try:
+                        date_str = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    df = fetcher.fetch_day(date_str)
+                    with lock:
+                        if df is not None and not df.empty:
+                            results[date_str] = df
+                        if progress is not None:
+                            progress(date_str, df)
+        except Exception as e:
+            if verbose:
+                log(f"         [DEBUG] ❌ Wyjątek zewnętrzny: {e}")
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return results
 
 
+@staged("tge_scrape")
+def scrape_tge_prices_range(dates: List[str], workers: int = None, verbose: bool = False,
+                            progress=None, method: str = None) -> Dict[str, pd.DataFrame]:
+    """
+    Pobiera notowania wielu dni równolegle ze strony PGE.
+
+    Najpierw bezpośrednio przez HTTP (PgeTgeHttpClient), a dni, których
+    nie udało się tak pobrać - na ograniczonej puli przeglądarek Selenium
+    (każda przeglądarka obsługuje kolejne dni bez ponownego uruchamiania).
+
+    Args:
+        dates: Lista dat w formacie YYYY-MM-DD
+        workers: Liczba równoległych sesji / przeglądarek (domyślnie TGE_SCRAPER_WORKERS)
+        verbose: Jeśli True, wypisuje logi diagnostyczne
+        progress: Opcjonalna funkcja progress(date_str, df) wołana raz dla każdego dnia
+        method: "auto" (HTTP, potem Selenium), "http" lub "selenium"
+                (domyślnie TGE_FETCH_METHOD)
+
+    Returns:
+        Słownik {data: DataFrame} tylko dla dni, które udało się pobrać
+    """
+    method = method or TGE_FETCH_METHOD
+    if method not in ("auto", "http", "selenium"):
+        raise ValueError(f"Nieznana metoda pobierania cen TGE: {method}")
+    if not dates:
+        return {}
+    try:
+        import bs4  # noqa: F401
+    except ImportError as e:
+        if verbose:
+            log(f"         [DEBUG] ❌ ImportError: {e}")
+        return {}
+
+    results = {}
+    reported = set()
+
+    def report_success(date_str, df):
+        # Nieudane dni zgłaszane są dopiero po ostatniej próbie
+        if df is not None and not df.empty and progress is not None:
+            reported.add(date_str)
+            progress(date_str, df)
+
+    if method in ("auto", "http"):
+        results.update(_fetch_days_pool(dates, workers, lambda: PgeTgeHttpClient(verbose=verbose),
+                                        verbose, report_success))
+
+    missing = [d for d in dates if d not in results]
+    if missing and method in ("auto", "selenium"):
+        try:
+            import selenium  # noqa: F401
+        except ImportError as e:
+            # Selenium nie zainstalowany
+            if verbose:
+                log(f"         [DEBUG] ❌ ImportError: {e}")
+        else:
+            if method == "auto" and verbose:
+                log(f"         [DEBUG] {len(missing)} dni przez Selenium (HTTP nieudane)")
+            results.update(_fetch_days_pool(missing, workers, lambda: PgeTgeBrowser(verbose=verbose),
+                                            verbose, report_success))
+
+    if progress is not None:
+        for date_str in dates:
+            if date_str not in reported:
+                progress(date_str, results.get(date_str))
+    return results
+
+
+@staged("tge_prices")
 def fetch_tge_prices(year: int, month: int, verbose: bool = False) -> pd.DataFrame:
     """
     Pobiera ceny z TGE (Towarowa Giełda Energii) - Rynek Dnia Następnego.
@@ -357,48 +1262,42 @@ def fetch_tge_prices(year: int, month: int, verbose: bool = False) -> pd.DataFra
     - price_per_kwh_netto: Cena netto w zł/kWh
     """
     try:
-        print(f"📡 Pobieranie cen giełdowych TGE za {year}-{month:02d}...")
+        log(f"📡 Pobieranie cen giełdowych TGE za {year}-{month:02d}...")
         
-        # METODA 1: Sprawdź plik CSV (cache)
-        print(f"    1. Sprawdzam plik CSV tge_prices_{year}_{month:02d}.csv...")
-        csv_prices = load_tge_prices_from_csv(year, month)
-        if csv_prices is not None and not csv_prices.empty:
-            print(f"       ✅ Wczytano dane z pliku CSV")
-            return csv_prices
+        # METODA 1: Archiwum cen (zawiera też wszystkie pliki CSV tge_prices_YYYY_MM.csv)
+        log(f"    1. Sprawdzam archiwum cen TGE (data/tge_prices.npz + pliki CSV)...")
+        # Ten sam zakres godzin UTC co bilans zużycia (month_range_utc) - inaczej
+        # skrajne godziny miesiąca brałyby ceny z innego źródła lub zostały bez ceny
+        start_utc, end_utc = month_range_utc(year, month)
+        end_utc += timedelta(seconds=1)
+        archive_prices = load_tge_prices_range(start_utc, end_utc)
+        if archive_prices is not None:
+            log(f"       ✅ Wczytano {len(archive_prices)} godzin z archiwum")
+            span_add(source="archive")
+            return archive_prices
         else:
-            print(f"       ✗ Plik nie istnieje lub jest pusty")
+            log(f"       ✗ Brak danych za ten miesiąc")
         
-        # METODA 2: Web scraping PGE (Selenium)
-        print(f"    2. Próba web scrapingu PGE (Selenium)...")
+        # METODA 2: Strona PGE (HTTP, Selenium jako zapasowy)
+        log(f"    2. Próba pobrania notowań ze strony PGE (HTTP / Selenium)...")
         
         # Generuj listę dat dla całego miesiąca
         last_day = calendar.monthrange(year, month)[1]
-        all_prices = []
-        
-        # Spróbuj pobrać pierwszy dzień jako test
-        first_date = f"{year}-{month:02d}-01"
-        first_day_prices = scrape_tge_prices_from_pge(first_date, verbose=verbose)
-        
-        if first_day_prices is not None and not first_day_prices.empty:
-            all_prices.append(first_day_prices)
-            print(f"       ✅ {first_date} - pobrano {len(first_day_prices)} godzin")
-            
-            # Kontynuuj dla pozostałych dni
-            for day in range(2, last_day + 1):
-                date_str = f"{year}-{month:02d}-{day:02d}"
-                day_prices = scrape_tge_prices_from_pge(date_str, verbose=verbose)
-                
-                if day_prices is not None and not day_prices.empty:
-                    all_prices.append(day_prices)
-                    if day % 7 == 0:  # Progress co tydzień
-                        print(f"       ✓ Pobrano {day}/{last_day} dni")
-                else:
-                    print(f"       ⚠️  Brak danych dla {date_str}")
-                    # Nie przerywamy, może brakować jednego dnia, ale próbujemy dalej?
-                    # Zwykle jak brakuje jednego, to może być problem z siecią.
-                    # Ale w oryginalnym kodzie był break. Zostawmy break.
-                    break
-            
+        dates = [f"{year}-{month:02d}-{day:02d}" for day in range(1, last_day + 1)]
+        done = []
+
+        def report(date_str, day_prices):
+            done.append(date_str)
+            if day_prices is None or day_prices.empty:
+                log(f"       ⚠️  Brak danych dla {date_str}")
+            elif len(done) % 7 == 0:  # Progress co tydzień
+                log(f"       ✓ Pobrano {len(done)}/{last_day} dni")
+
+        # Dni pobierane równolegle (TGE_SCRAPER_WORKERS sesji HTTP / przeglądarek)
+        scraped = scrape_tge_prices_range(dates, verbose=verbose, progress=report)
+        all_prices = [scraped[d] for d in dates if d in scraped]
+
+        if all_prices:
             # Jeśli udało się pobrać większość dni
             if len(all_prices) >= last_day * 0.8:  # Minimum 80% dni
                 df_real = pd.concat(all_prices, ignore_index=True)
@@ -406,8 +1305,7 @@ def fetch_tge_prices(year: int, month: int, verbose: bool = False) -> pd.DataFra
                 
                 # ZAPIS DO CSV
                 try:
-                    # Ścieżka do katalogu data (względem katalogu src)
-                    data_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
+                    data_dir = _data_dir()
                     os.makedirs(data_dir, exist_ok=True)
                     csv_filename = os.path.join(data_dir, f"tge_prices_{year}_{month:02d}.csv")
                     df_to_save = df_real.copy()
@@ -415,101 +1313,56 @@ def fetch_tge_prices(year: int, month: int, verbose: bool = False) -> pd.DataFra
                     df_to_save['timestamp'] = df_to_save['timestamp_utc'].dt.tz_convert(None)
                     df_to_save['price_kwh'] = df_to_save['price_per_kwh_netto']
                     df_to_save[['timestamp', 'price_kwh']].to_csv(csv_filename, index=False)
-                    print(f"       💾 Zapisano pobrane dane do pliku {csv_filename}")
+                    log(f"       💾 Zapisano pobrane dane do pliku {csv_filename}")
+                    # Dołącz nowy miesiąc do archiwum cen i zwróć ten sam zakres co przy
+                    # kolejnych uruchomieniach (z godzinami sąsiednich miesięcy, jeśli są)
+                    archive_prices = load_tge_prices_range(start_utc, end_utc)
                 except Exception as e:
-                    print(f"       ⚠️  Błąd zapisu do CSV: {e}")
+                    log(f"       ⚠️  Błąd zapisu do CSV: {e}")
                 
-                print(f"       ✅ Pobrano rzeczywiste ceny TGE dla {len(all_prices)}/{last_day} dni")
+                log(f"       ✅ Pobrano rzeczywiste ceny TGE dla {len(all_prices)}/{last_day} dni")
+                span_add(source="scrape", days=len(all_prices))
+                if archive_prices is not None:
+                    return archive_prices
                 return df_real[['timestamp_utc', 'timestamp_local', 'price_per_kwh_netto']]
         
-        print(f"       ✗ Web scraping nieudany (brak Selenium lub błąd)")
+        log(f"       ✗ Pobieranie ze strony PGE nieudane (HTTP i Selenium)")
         
         # METODA 3: Spróbuj pobrać z PSE
-        print(f"    3. Próba pobrania danych z PSE...")
+        log(f"    3. Próba pobrania danych z PSE...")
         pse_prices = scrape_tge_from_pse_website(year, month)
         if pse_prices is not None and not pse_prices.empty:
-            print(f"       ✅ Pobrano dane z PSE")
+            log(f"       ✅ Pobrano dane z PSE")
+            span_add(source="pse")
             return pse_prices
         else:
-            print(f"       ✗ Dane PSE niedostępne")
+            log(f"       ✗ Dane PSE niedostępne")
         
         # METODA 4: Użyj symulowanych danych
-        print(f"    4. Używam danych symulowanych (wzorce rynkowe)")
-        print(f"       💡 Aby użyć rzeczywistych cen:")
-        print(f"          - Zainstaluj Selenium: pip install selenium webdriver-manager")
-        print(f"          - Lub zapisz CSV jako: data/tge_prices_{year}_{month:02d}.csv")
+        log(f"    4. Używam danych symulowanych (wzorce rynkowe)")
+        span_add(source="simulated")
+        log(f"       💡 Aby użyć rzeczywistych cen:")
+        log(f"          - Zainstaluj Selenium: pip install selenium webdriver-manager")
+        log(f"          - Lub zapisz CSV jako: data/tge_prices_{year}_{month:02d}.csv")
         
-        # Generuj godzinowe timestampy dla całego miesiąca
+        # Godziny całego miesiąca (UTC), ceny z profilu SIMULATED_PRICE_PROFILE
         start = datetime(year, month, 1, 0, 0, 0, tzinfo=timezone.utc)
         last_day = calendar.monthrange(year, month)[1]
         end = datetime(year, month, last_day, 23, 0, 0, tzinfo=timezone.utc)
-        
-        hours = []
-        current = start
-        while current <= end:
-            hours.append(current)
-            current += timedelta(hours=1)
-        
-        df = pd.DataFrame({'timestamp_utc': hours})
-        df['timestamp_local'] = df['timestamp_utc'].dt.tz_convert('Europe/Warsaw')
-        
-        # Symuluj ceny bazując na rzeczywistych wzorcach z polskiego rynku energii
-        # Wzorce cen RDN (zł/MWh) - bazowane na danych historycznych 2024:
-        # - Noc (22-6): 200-400 zł/MWh
-        # - Dzień (6-22): 350-650 zł/MWh  
-        # - Szczyty (7-9, 17-20): 500-900 zł/MWh
-        
-        def simulate_tge_price(ts):
-            hour = ts.hour
-            day_of_week = ts.dayofweek
-            
-            # Bazowa cena zależy od pory doby
-            if 0 <= hour < 6:  # Noc
-                base = 300
-                variance = 60
-            elif 6 <= hour < 7:  # Ranek
-                base = 450
-                variance = 90
-            elif 7 <= hour < 10:  # Poranny szczyt
-                base = 700
-                variance = 120
-            elif 10 <= hour < 15:  # Dzień
-                base = 500
-                variance = 80
-            elif 15 <= hour < 17:  # Popołudnie
-                base = 550
-                variance = 90
-            elif 17 <= hour < 21:  # Wieczorny szczyt
-                base = 750
-                variance = 130
-            elif 21 <= hour < 22:  # Późny wieczór
-                base = 600
-                variance = 100
-            else:  # 22-24 - Noc
-                base = 350
-                variance = 70
-            
-            # Weekend - niższe ceny (60-75% cen z dni roboczych)
-            if day_of_week >= 5:
-                base *= 0.70
-            
-            # Dodaj losową zmienność (deterministyczną bazując na dniu miesiąca)
-            variation = (hash(str(ts)) % 100 - 50) / 100 * variance
-            price_mwh = base + variation
-            
-            # Konwertuj z zł/MWh na zł/kWh
-            return price_mwh / 1000
-        
-        df['price_per_kwh_netto'] = df['timestamp_local'].apply(simulate_tge_price)
-        
-        return df[['timestamp_utc', 'timestamp_local', 'price_per_kwh_netto']]
+        return simulate_tge_prices(start, end + timedelta(hours=1))
         
     except Exception as e:
-        print(f"❌ Błąd pobierania cen TGE: {e}")
-        print(f"    Kontynuuję bez taryfy dynamicznej...")
+        log(f"❌ Błąd pobierania cen TGE: {e}")
+        log(f"    Kontynuuję bez taryfy dynamicznej...")
         return None
 
 
+# Średnia dystrybucja (przyjmujemy średnią ważoną z dystrybucji dziennej i nocnej)
+# W taryfie dynamicznej dystrybucja naliczana jest według standardowej taryfy G11/G12
+DYNAMIC_AVG_DISTRIBUTION = (0.43360 + 0.10860) / 2  # 0.27110 zł/kWh
+
+
+@staged("dynamic_cost")
 def compute_dynamic_tariff_cost(hourly: pd.DataFrame, tge_prices: pd.DataFrame) -> Dict:
     """
     Oblicza koszt dla taryfy dynamicznej (giełdowej) PGE.
@@ -525,21 +1378,14 @@ def compute_dynamic_tariff_cost(hourly: pd.DataFrame, tge_prices: pd.DataFrame)
     if tge_prices is None or tge_prices.empty:
         return None
     
-    # Połącz dane zużycia z cenami TGE
+    # Połącz dane zużycia z cenami TGE (godzinowymi lub kwadransowymi)
     hourly_merged = hourly.copy()
-    hourly_merged = hourly_merged.merge(
-        tge_prices[['timestamp_utc', 'price_per_kwh_netto']], 
-        left_on='hour_utc', 
-        right_on='timestamp_utc',
-        how='left'
-    )
+    hourly_merged['price_per_kwh_netto'] = interval_prices(hourly['hour_utc'], tge_prices)
     
     # Dla taryfy dynamicznej PGE:
     # Cena końcowa = cena_tge + marża + dystrybucja + OZE/kogeneracja
     
-    # Średnia dystrybucja (przyjmujemy średnią ważoną z dystrybucji dziennej i nocnej)
-    # W taryfie dynamicznej dystrybucja naliczana jest według standardowej taryfy G11/G12
-    avg_distribution = (0.43360 + 0.10860) / 2  # 0.27110 zł/kWh
+    avg_distribution = DYNAMIC_AVG_DISTRIBUTION
     
     # Całkowita cena za kWh
     hourly_merged['total_price'] = (
@@ -612,62 +1458,433 @@ def decode_supla_api_base_from_token(token: str) -> str:
         raise RuntimeError(f"Nie udało się wyciągnąć adresu API z tokena: {e}")
 
 
+_SUPLA_SESSIONS: Dict[str, requests.Session] = {}
+_SUPLA_SESSIONS_LOCK = threading.Lock()
+
+
+def supla_session(api_base: str) -> requests.Session:
+    """
+    Współdzielona sesja HTTP (pula połączeń keep-alive) dla danego adresu API.
+    Tokeny przekazywane są w nagłówku każdego żądania, więc jedna sesja
+    obsługuje wiele kont na tym samym serwerze SUPLA.
+    """
+    with _SUPLA_SESSIONS_LOCK:
+        session = _SUPLA_SESSIONS.get(api_base)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(10, SUPLA_MAX_CONCURRENT_DOWNLOADS))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _SUPLA_SESSIONS[api_base] = session
+        return session
+
+
+_SUPLA_SLOTS: Optional[threading.BoundedSemaphore] = None
+
+# Odpowiedzi HTTP uznawane za przejściowe (ponawiane po odczekaniu)
+SUPLA_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def supla_slots() -> threading.BoundedSemaphore:
+    """Limit jednoczesnych żądań do API SUPLA w procesie (flota i okna pobierania razem)."""
+    global _SUPLA_SLOTS
+    with _SUPLA_SESSIONS_LOCK:
+        if _SUPLA_SLOTS is None:
+            _SUPLA_SLOTS = threading.BoundedSemaphore(max(1, SUPLA_MAX_CONCURRENT_DOWNLOADS))
+        return _SUPLA_SLOTS
+
+
+def _is_transient(error: Exception) -> bool:
+    """Timeout lub zerwane połączenie - tak; brak połączenia z serwerem (offline, DNS) - nie."""
+    from urllib3.exceptions import NewConnectionError
+
+    if isinstance(error, requests.Timeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return not isinstance(reason, NewConnectionError)
+
+
+def _retry_delay(attempt: int, response: Optional[requests.Response] = None) -> float:
+    """Odczekanie przed ponowieniem: Retry-After z odpowiedzi lub wykładniczo z rozrzutem."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.strip().isdigit():
+        return float(retry_after)
+    return SUPLA_RETRY_BACKOFF * (2 ** attempt) * (0.5 + np.random.random())
+
+
 def supla_request_get(url: str, token: str, **kwargs) -> requests.Response:
+    """
+    GET do API SUPLA przez współdzieloną sesję. Błędy przejściowe (timeout,
+    zerwane połączenie, HTTP 429/5xx) ponawiane są do SUPLA_RETRIES razy
+    z wykładniczym odczekaniem; po ostatniej próbie zwracana jest odpowiedź
+    (lub zgłaszany wyjątek połączenia).
+    """
     headers = kwargs.pop("headers", {})
     headers["Authorization"] = f"Bearer {token}"
-    return requests.get(url, headers=headers, timeout=60, **kwargs)
+    parts = urlsplit(url)
+    session = supla_session(f"{parts.scheme}://{parts.netloc}")
+
+    for attempt in range(SUPLA_RETRIES + 1):
+        response = None
+        try:
+            with supla_slots():
+                response = session.get(url, headers=headers, timeout=SUPLA_REQUEST_TIMEOUT, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == SUPLA_RETRIES or not _is_transient(e):
+                raise
+            reason = type(e).__name__
+        else:
+            if response.status_code not in SUPLA_RETRY_STATUSES or attempt == SUPLA_RETRIES:
+                return response
+            reason = f"HTTP {response.status_code}"
+
+        delay = _retry_delay(attempt, response)
+        span_add(retries=1)
+        log(f"    🔁 SUPLA: {reason} - ponawiam za {delay:.1f} s ({attempt + 1}/{SUPLA_RETRIES})")
+        time.sleep(delay)
+
 
+def verify_supla_token(token: str, channel_id: int):
+    """
+    Sprawdza w SUPLA, czy token ma dostęp do kanału (GET /channels/{kanał}).
+    Brak dostępu (HTTP 401/403/404, token bez adresu API) = PermissionError.
+    """
+    try:
+        api_base = decode_supla_api_base_from_token(token)
+    except RuntimeError as e:
+        raise PermissionError(str(e))
+    r = supla_request_get(f"{api_base}/api/v3/channels/{channel_id}", token)
+    if r.status_code in (401, 403, 404):
+        raise PermissionError(f"Token nie ma dostępu do kanału {channel_id} (HTTP {r.status_code})")
+    if r.status_code != 200:
+        raise RuntimeError(f"Nie udało się sprawdzić tokena: HTTP {r.status_code}")
+
+
+# Ile po końcu zakresu uznajemy miesiąc za kompletny (spóźnione odczyty z urządzeń)
+SUPLA_SYNC_GRACE = timedelta(days=1)
+
+
+def _sync_state_path(data_dir: str, channel_id: int, key: str) -> str:
+    return os.path.join(data_dir, f"supla_sync_{channel_id}_{key}.json")
+
+
+def load_sync_state(data_dir: str, channel_id: int, key: str) -> Dict[str, int]:
+    """
+    Stan synchronizacji cache kanału dla miesiąca key (YYYY_MM):
+    {"last_timestamp": ..., "synced_at": ...} - ostatni zapisany
+    date_timestamp i czas ostatniego pobrania z API.
+    """
+    path = _sync_state_path(data_dir, channel_id, key)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def save_sync_state(data_dir: str, channel_id: int, key: str, state: Dict[str, int]):
+    with atomic_write(_sync_state_path(data_dir, channel_id, key), 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+
+
+# Kolumny logów SUPLA przechowywane w cache (reszta pól odpowiedzi jest pomijana)
+SUPLA_CACHE_COLUMNS = ("date_timestamp", "fae_balanced", "rae_balanced")
+
+
+def logs_to_columns(records: list) -> Dict[str, np.ndarray]:
+    """
+    Zamienia listę odczytów (słowników z API) na kolumny NumPy.
+    date_timestamp -> int64, liczniki energii -> float64 (brak wartości = NaN).
+    """
+    present = [c for c in SUPLA_CACHE_COLUMNS if any(c in r for r in records[:1000])]
+    columns = {}
+    for c in present:
+        dtype = np.int64 if c == "date_timestamp" else np.float64
+        columns[c] = np.array([r.get(c) for r in records], dtype=dtype)
+    return columns
+
+
+def _columns_len(columns: Dict[str, np.ndarray]) -> int:
+    return len(columns["date_timestamp"]) if "date_timestamp" in columns else 0
+
+
+def merge_log_columns(chunks: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """
+    Łączy paczki kolumn logów w jedną, posortowaną po date_timestamp, bez
+    powtórzonych odczytów (przy powtórzeniu wygrywa wcześniejsza paczka).
+    Zostają kolumny obecne we wszystkich paczkach.
+    """
+    chunks = [chunk for chunk in chunks if _columns_len(chunk)]
+    if not chunks:
+        return {}
+    if len(chunks) == 1:
+        return chunks[0]
+    common = [c for c in chunks[0] if all(c in chunk for chunk in chunks)]
+    merged = {c: np.concatenate([chunk[c] for chunk in chunks]) for c in common}
+    _, first = np.unique(merged["date_timestamp"], return_index=True)
+    return {c: v[first] for c, v in merged.items()}
+
+
+def load_logs_cache(filename: str) -> Dict[str, np.ndarray]:
+    """Wczytuje kolumnowy cache logów (.npz) bezpośrednio do tablic."""
+    with np.load(filename) as npz:
+        return {c: npz[c] for c in npz.files}
+
+
+def save_logs_cache(filename: str, columns: Dict[str, np.ndarray]):
+    """Zapisuje kolumny do skompresowanego pliku .npz (atomowo przez plik tymczasowy)."""
+    with atomic_write(filename, 'wb') as f:
+        np.savez_compressed(f, **columns)
 
-def download_measurement_logs_json(api_base: str, token: str, channel_id: int, date_from: datetime, date_to: datetime) -> list:
+
+def fetch_measurement_log_pages(api_base: str, token: str, channel_id: int, date_from: datetime,
+                                date_to: datetime, page_size: int = None):
+    """
+    Pobiera logi stronami (limit=page_size, rosnąco po czasie) i zwraca
+    generator kolumn dla każdej strony. Kolejna strona zaczyna się od
+    sekundy po ostatnim odczycie poprzedniej, więc w pamięci jest naraz
+    tylko jedna odpowiedź JSON.
+
+    Koniec danych to pusta strona albo odczyt z date_to - nie krótka strona:
+    serwer może zwracać mniej odczytów niż limit (własny, niższy limit).
+    """
+    page_size = page_size or SUPLA_PAGE_SIZE
+    url = f"{api_base}/api/v3/channels/{channel_id}/measurement-logs"
+    cursor = date_from
+    while cursor <= date_to:
+        params = {
+            "dateFrom": cursor.isoformat(),
+            "dateTo": date_to.isoformat(),
+            "limit": page_size,
+            "order": "ASC",
+        }
+        r = supla_request_get(url, token, params=params)
+        if r.status_code != 200:
+            raise RuntimeError(f"Nie udało się pobrać logów: HTTP {r.status_code}\n{r.text[:1000]}")
+
+        span_add(bytes=len(r.content), requests=1)
+        records = r.json()
+        records.sort(key=lambda d: int(d['date_timestamp']))
+        page = logs_to_columns(records)
+        del records
+        if not _columns_len(page):
+            return
+        yield page
+
+        last = int(page["date_timestamp"][-1])
+        if last >= date_to.timestamp():
+            return
+        cursor = datetime.fromtimestamp(last + 1, tz=timezone.utc)
+
+
+def supla_download_windows(date_from: datetime, date_to: datetime, hours: int = None) -> List[Tuple[datetime, datetime]]:
+    """Podział zakresu [date_from, date_to] (włącznie) na okna po `hours` godzin (0 = jedno okno)."""
+    hours = SUPLA_DOWNLOAD_WINDOW_HOURS if hours is None else hours
+    if not hours:
+        return [(date_from, date_to)]
+    step = timedelta(hours=hours)
+    windows = []
+    start = date_from
+    while start <= date_to:
+        end = min(start + step - timedelta(seconds=1), date_to)
+        windows.append((start, end))
+        start = end + timedelta(seconds=1)
+    return windows
+
+
+class SuplaPartialDownload(RuntimeError):
+    """Pobieranie przerwane błędem; columns - odczyty z okien przed pierwszym nieudanym."""
+
+    def __init__(self, message: str, columns: Dict[str, np.ndarray]):
+        super().__init__(message)
+        self.columns = columns
+
+
+def fetch_measurement_logs_range(api_base: str, token: str, channel_id: int, date_from: datetime,
+                                 date_to: datetime, window_hours: int = None) -> Dict[str, np.ndarray]:
+    """
+    Logi z zakresu pobierane oknami (SUPLA_DOWNLOAD_WINDOW_HOURS) współbieżnie
+    przez współdzieloną sesję (limit SUPLA_MAX_CONCURRENT_DOWNLOADS żądań
+    naraz), scalane i bez powtórzeń po date_timestamp.
+
+    Raises:
+        SuplaPartialDownload: gdy okno nie dało się pobrać mimo ponowień -
+            z odczytami ciągłego początku zakresu (do zapisania w cache)
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    windows = supla_download_windows(date_from, date_to, window_hours)
+    if not windows:
+        return {}
+
+    def fetch(window):
+        return list(fetch_measurement_log_pages(api_base, token, channel_id, *window))
+
+    results: List[Optional[list]] = [None] * len(windows)
+    errors = {}
+    if len(windows) == 1:
+        try:
+            results[0] = fetch(windows[0])
+        except Exception as e:
+            errors[0] = e
+    else:
+        with ThreadPoolExecutor(max_workers=min(len(windows), max(1, SUPLA_MAX_CONCURRENT_DOWNLOADS))) as executor:
+            # Każde okno we własnej kopii kontekstu - bajty i żądania trafiają do bieżącego etapu
+            futures = {executor.submit(contextvars.copy_context().run, fetch, w): i for i, w in enumerate(windows)}
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    errors[futures[future]] = e
+                    # Okna jeszcze nieuruchomione nie są potrzebne - i tak zostanie tylko początek zakresu
+                    for pending in futures:
+                        pending.cancel()
+
+    if errors:
+        first = min(errors)
+        done = merge_log_columns([page for pages in results[:first] for page in pages])
+        start, end = windows[first]
+        raise SuplaPartialDownload(
+            f"okno {start:%Y-%m-%d %H:%M} - {end:%Y-%m-%d %H:%M}: {errors[first]}", done) from errors[first]
+    return merge_log_columns([page for pages in results for page in pages])
+
+
+@staged("supla_download")
+def download_measurement_logs_json(api_base: str, token: str, channel_id: int, date_from: datetime, date_to: datetime) -> Dict[str, np.ndarray]:
     """
     Endpoint w SUPLA: /channels/{channel}/measurement-logs zwraca JSON z pomiarami
+
+    Cache jest kolumnowy (data/supla_logs_{kanał}_{YYYY_MM}.npz): tylko pola
+    z SUPLA_CACHE_COLUMNS jako typowane tablice, bez dekodowania JSON przy
+    odczycie. Stary cache .json jest automatycznie konwertowany.
+
+    Synchronizacja przyrostowa: jeśli cache miesiąca istnieje, pobierane są
+    tylko odczyty nowsze niż ostatni zapisany date_timestamp i dopisywane
+    do cache. Miesiąc zsynchronizowany po swoim końcu (+ SUPLA_SYNC_GRACE)
+    nie jest już odpytywany.
+
+    Zakres pobierany jest oknami (fetch_measurement_logs_range); gdy któreś
+    okno zawiedzie, odczyty z okien przed nim i tak trafiają do cache,
+    więc kolejne uruchomienie kontynuuje od miejsca przerwania.
+
+    Returns:
+        Słownik {kolumna: tablica} posortowany po date_timestamp
     """
     # Generuj nazwę pliku cache na podstawie parametrów
     year = date_from.year
     month = date_from.month
+    key = f"{year}_{month:02d}"
     
-    # Ścieżka do katalogu data (względem katalogu src)
-    data_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
+    data_dir = _data_dir()
     os.makedirs(data_dir, exist_ok=True)
-    cache_filename = os.path.join(data_dir, f"supla_logs_{channel_id}_{year}_{month:02d}.json")
+    cache_filename = os.path.join(data_dir, f"supla_logs_{channel_id}_{key}.npz")
+    legacy_filename = os.path.join(data_dir, f"supla_logs_{channel_id}_{key}.json")
     
     # Sprawdź czy plik cache istnieje
+    cached = None
     if os.path.exists(cache_filename):
-        print(f"📦 Wczytuję dane SUPLA z pliku cache: {cache_filename}")
         try:
-            with open(cache_filename, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            cached = load_logs_cache(cache_filename)
         except Exception as e:
-            print(f"⚠️  Błąd odczytu cache SUPLA: {e}. Pobieram z API...")
-    
-    print(f"📡 Pobieranie danych z API SUPLA...")
-    url = f"{api_base}/api/v3/channels/{channel_id}/measurement-logs"
-    params = {
-        "dateFrom": date_from.isoformat(),
-        "dateTo": date_to.isoformat(),
-    }
-    r = supla_request_get(url, token, params=params)
-    if r.status_code != 200:
-        raise RuntimeError(f"Nie udało się pobrać logów: HTTP {r.status_code}\n{r.text[:1000]}")
-    
-    data = r.json()
+            log(f"⚠️  Błąd odczytu cache SUPLA: {e}. Pobieram z API...")
+    elif os.path.exists(legacy_filename):
+        # Migracja starego cache JSON do formatu kolumnowego
+        try:
+            with open(legacy_filename, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+            records.sort(key=lambda d: int(d['date_timestamp']))
+            cached = logs_to_columns(records)
+            save_logs_cache(cache_filename, cached)
+            os.remove(legacy_filename)
+            log(f"🔄 Skonwertowano cache SUPLA {legacy_filename} -> {cache_filename}")
+        except Exception as e:
+            log(f"⚠️  Błąd konwersji cache SUPLA: {e}. Pobieram z API...")
+            cached = None
+
+    entry = load_sync_state(data_dir, channel_id, key)
+    last_ts = None
+    fetch_from = date_from
+
+    if cached is not None:
+        if entry and entry.get("synced_at", 0) > (date_to + SUPLA_SYNC_GRACE).timestamp():
+            log(f"📦 Wczytuję dane SUPLA z pliku cache: {cache_filename}")
+            span_add(cache="hit", channel=channel_id)
+            return cached
+        if _columns_len(cached):
+            last_ts = int(cached["date_timestamp"][-1])
+        elif entry:
+            last_ts = entry.get("last_timestamp")
+        if last_ts is not None:
+            fetch_from = datetime.fromtimestamp(last_ts + 1, tz=timezone.utc)
+        log(f"📦 Cache SUPLA: {cache_filename} ({_columns_len(cached)} odczytów), pobieram tylko nowsze...")
+    else:
+        log(f"📡 Pobieranie danych z API SUPLA...")
+
+    span_add(cache="miss" if cached is None else "delta", channel=channel_id)
+    synced_at = int(datetime.now(timezone.utc).timestamp())
+    error = None
+    try:
+        # Okna z przyszłości (bieżący miesiąc) nie są odpytywane
+        fetch_to = min(date_to, datetime.now(timezone.utc))
+        fresh = fetch_measurement_logs_range(api_base, token, channel_id, fetch_from, fetch_to)
+    except Exception as e:
+        error = e
+        fresh = getattr(e, "columns", {})
+
+    if last_ts is not None and _columns_len(fresh):
+        fresh = {c: v[fresh["date_timestamp"] > last_ts] for c, v in fresh.items()}
+    new_count = _columns_len(fresh)
+
+    if error is not None and not new_count:
+        if cached is None:
+            raise error
+        # Brak połączenia nie blokuje analizy danych, które już są w cache
+        log(f"⚠️  Nie udało się pobrać nowych odczytów SUPLA ({error}). Używam cache.")
+        span_add(cache="stale")
+        return cached
+
+    data = merge_log_columns([cached or {}, fresh])
+    if not data:
+        data = cached if cached is not None else {c: np.empty(0) for c in ("date_timestamp", "fae_balanced")}
+    if cached is not None:
+        log(f"📥 Nowych odczytów SUPLA: {new_count}")
     
     # Zapisz do cache
     try:
-        with open(cache_filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False)
-        print(f"💾 Zapisano dane SUPLA do pliku: {cache_filename}")
+        if cached is None or new_count:
+            save_logs_cache(cache_filename, data)
+            log(f"💾 Zapisano dane SUPLA do pliku: {cache_filename}")
+        save_sync_state(data_dir, channel_id, key, {
+            "last_timestamp": int(data["date_timestamp"][-1]) if _columns_len(data) else last_ts,
+            # Po przerwanym pobieraniu miesiąc nie może zostać uznany za kompletny
+            "synced_at": synced_at if error is None else entry.get("synced_at", 0),
+        })
     except Exception as e:
-        print(f"⚠️  Błąd zapisu cache SUPLA: {e}")
-    
+        log(f"⚠️  Błąd zapisu cache SUPLA: {e}")
+
+    if error is not None:
+        resume = datetime.fromtimestamp(int(data["date_timestamp"][-1]) + 1, tz=timezone.utc)
+        log(f"⚠️  Pobieranie SUPLA przerwane ({error}). Zapisano {new_count} odczytów - "
+            f"kolejne uruchomienie kontynuuje od {resume:%Y-%m-%d %H:%M:%S} UTC.")
+        if cached is None:
+            raise error
+        span_add(cache="stale")
     return data
 
 
-def parse_json_to_dataframe(data: list) -> pd.DataFrame:
+def parse_json_to_dataframe(data) -> pd.DataFrame:
     """
-    Parsuje JSON z API SUPLA do DataFrame.
+    Parsuje dane z API SUPLA do DataFrame.
+    Przyjmuje listę odczytów (JSON) lub kolumny z cache ({kolumna: tablica}).
     Dane zawierają kumulatywne odczyty energii (FAE - Forward Active Energy) w setnych Wh (0.01 Wh).
     """
+    if isinstance(data, dict):
+        if not _columns_len(data):
+            raise RuntimeError("API zwróciło pustą listę pomiarów")
+        return pd.DataFrame(data, copy=False)
+
     if not data:
         raise RuntimeError("API zwróciło pustą listę pomiarów")
     
@@ -718,31 +1935,80 @@ def pge_g12_windows(month: int, supports_summer_winter: bool) -> Tuple[TimeWindo
     return day, night
 
 
+# ----------------------------
+# KALENDARZ TYPÓW DNI
+# ----------------------------
+DAY_WORKDAY = 0
+DAY_SATURDAY = 1
+DAY_SUNDAY = 2
+DAY_HOLIDAY = 3
+
+
+@dataclass(frozen=True)
+class DayCalendar:
+    """
+    Indeks typów dni dla zakresu lat: jeden bajt na dzień
+    (DAY_WORKDAY / DAY_SATURDAY / DAY_SUNDAY / DAY_HOLIDAY).
+    Święto ma pierwszeństwo przed sobotą i niedzielą.
+    """
+    first_day: np.datetime64
+    day_types: np.ndarray
+
+    def lookup(self, dates: np.ndarray) -> np.ndarray:
+        """Typy dni dla tablicy dat (datetime64[D])."""
+        idx = (dates.astype('datetime64[D]') - self.first_day).astype(np.int64)
+        return self.day_types[idx]
+
+
+@lru_cache(maxsize=16)
+def build_day_calendar(first_year: int, last_year: int, use_holidays: bool) -> DayCalendar:
+    """
+    Buduje (raz na zakres lat) kompaktową tablicę typów dni.
+    Bez biblioteki holidays lub przy use_holidays=False – tylko weekendy.
+    """
+    first_day = np.datetime64(f"{first_year}-01-01", 'D')
+    days = np.arange(first_day, np.datetime64(f"{last_year + 1}-01-01", 'D'))
+    # 1970-01-01 był czwartkiem -> poniedziałek=0 ... niedziela=6
+    weekday = (days.astype(np.int64) + 3) % 7
+
+    day_types = np.full(len(days), DAY_WORKDAY, dtype=np.uint8)
+    day_types[weekday == 5] = DAY_SATURDAY
+    day_types[weekday == 6] = DAY_SUNDAY
+
+    if use_holidays:
+        try:
+            import holidays
+            pl_holidays = holidays.Poland(years=range(first_year, last_year + 1))
+            holiday_days = np.array(sorted(pl_holidays.keys()), dtype='datetime64[D]')
+            day_types[np.isin(days, holiday_days)] = DAY_HOLIDAY
+        except Exception:
+            # jeśli nie ma biblioteki holidays – traktuj tylko weekend
+            pass
+
+    return DayCalendar(first_day=first_day, day_types=day_types)
+
+
+def day_types_for(dates: np.ndarray) -> np.ndarray:
+    """Typy dni dla tablicy dat (datetime64[D]) z indeksu pokrywającego ich lata."""
+    if len(dates) == 0:
+        return np.empty(0, dtype=np.uint8)
+    years = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+    cal = build_day_calendar(int(years.min()), int(years.max()), bool(USE_POLISH_HOLIDAYS))
+    return cal.lookup(dates)
+
+
+def day_type(ts_local: pd.Timestamp) -> int:
+    """Typ dnia dla pojedynczego znacznika czasu lokalnego."""
+    cal = build_day_calendar(ts_local.year, ts_local.year, bool(USE_POLISH_HOLIDAYS))
+    return int(cal.lookup(np.array([ts_local.date()], dtype='datetime64[D]'))[0])
+
+
 def is_weekend_or_holiday(ts_local: pd.Timestamp) -> bool:
-    if ts_local.weekday() >= 5:  # sobota=5, niedziela=6
-        return True
-    if not USE_POLISH_HOLIDAYS:
-        return False
-    try:
-        import holidays
-        pl_holidays = holidays.Poland(years=[ts_local.year])
-        return ts_local.date() in pl_holidays
-    except Exception:
-        # jeśli nie ma biblioteki holidays – traktuj tylko weekend
-        return False
+    return day_type(ts_local) != DAY_WORKDAY
 
 
 def is_sunday_or_holiday(ts_local: pd.Timestamp) -> bool:
-    if ts_local.weekday() == 6:  # niedziela=6
-        return True
-    if not USE_POLISH_HOLIDAYS:
-        return False
-    try:
-        import holidays
-        pl_holidays = holidays.Poland(years=[ts_local.year])
-        return ts_local.date() in pl_holidays
-    except Exception:
-        return False
+    return day_type(ts_local) in (DAY_SUNDAY, DAY_HOLIDAY)
 
 
 def classify_zone(ts_local: pd.Timestamp, tariff: str, supports_summer_winter: bool) -> str:
@@ -783,27 +2049,108 @@ def classify_zone(ts_local: pd.Timestamp, tariff: str, supports_summer_winter: b
 
 
 # ----------------------------
-# GŁÓWNA ANALIZA
+# STREFY - WERSJA WEKTOROWA
 # ----------------------------
-def month_range_utc(year: int, month: int) -> Tuple[datetime, datetime]:
-    start = datetime(year, month, 1, 0, 0, 0, tzinfo=timezone.utc)
-    last_day = calendar.monthrange(year, month)[1]
-    end = datetime(year, month, last_day, 23, 59, 59, tzinfo=timezone.utc)
-    return start, end
+def g12_night_table(supports_summer_winter: bool) -> np.ndarray:
+    """
+    Tablica [miesiąc, godzina] -> czy godzina należy do strefy nocnej G12.
+    Indeks miesiąca 1-12 (wiersz 0 nieużywany), budowana z pge_g12_windows,
+    więc definicja stref pozostaje w jednym miejscu.
+    """
+    table = np.zeros((13, 24), dtype=bool)
+    for m in range(1, 13):
+        _, night_w = pge_g12_windows(m, supports_summer_winter)
+        for h in range(24):
+            table[m, h] = night_w.contains(h)
+    return table
 
 
-def normalize_logs_to_hourly_kwh(df_raw: pd.DataFrame, start_date: datetime = None, end_date: datetime = None) -> pd.DataFrame:
-    """
-    Konwertuje dane z API SUPLA na godzinowy bilans energii w kWh.
+_DAY_NIGHT_LABELS = np.array(["day", "night"], dtype=object)
+
+
+def classify_zones(hour_local: pd.Series, tariffs, supports_summer_winter: bool) -> Dict[str, np.ndarray]:
+    """
+    Wektorowy odpowiednik classify_zone dla wielu godzin i taryf naraz.
+
+    Jedno przejście po godzinie doby, miesiącu i typie dnia, bez wywołań
+    Pythona per wiersz. Etykiety stref są identyczne jak w classify_zone.
+
+    Args:
+        hour_local: Seria znaczników czasu w strefie Europe/Warsaw
+        tariffs: Nazwy taryf (np. klucze PRICES)
+        supports_summer_winter: Czy licznik obsługuje strefy lato/zima
+
+    Returns:
+        Słownik {taryfa: tablica etykiet stref ('all' / 'day' / 'night')}
+    """
+    hours = hour_local.dt.hour.to_numpy()
+    months = hour_local.dt.month.to_numpy()
+    dates = hour_local.dt.tz_localize(None).to_numpy().astype('datetime64[D]')
+
+    g12_night = g12_night_table(supports_summer_winter)[months, hours]
+    dtypes = day_types_for(dates)
+
+    zones = {}
+    for tariff in tariffs:
+        if tariff == "G11":
+            night = None
+        elif tariff == "G12":
+            night = g12_night
+        elif tariff == "G12w":
+            night = g12_night | (dtypes != DAY_WORKDAY)
+        elif tariff == "G12n":
+            night = (dtypes == DAY_SUNDAY) | (dtypes == DAY_HOLIDAY) | ((hours >= 1) & (hours < 5))
+        else:
+            raise ValueError(f"Nieznana taryfa: {tariff}")
+
+        if night is None:
+            zones[tariff] = np.full(len(hours), "all", dtype=object)
+        else:
+            zones[tariff] = _DAY_NIGHT_LABELS[night.astype(np.intp)]
+    return zones
+
+
+def zone_prices(zones: np.ndarray, tariff_prices: Dict[str, float]) -> np.ndarray:
+    """Zamienia tablicę etykiet stref na tablicę cen (zł/kWh)."""
+    p = np.full(len(zones), np.nan)
+    for zone, price in tariff_prices.items():
+        p[zones == zone] = price
+    if np.isnan(p).any():
+        raise KeyError(zones[np.isnan(p)][0])
+    return p
+
+
+# ----------------------------
+# GŁÓWNA ANALIZA
+# ----------------------------
+def month_range_utc(year: int, month: int) -> Tuple[datetime, datetime]:
+    start = datetime(year, month, 1, 0, 0, 0, tzinfo=timezone.utc)
+    last_day = calendar.monthrange(year, month)[1]
+    end = datetime(year, month, last_day, 23, 59, 59, tzinfo=timezone.utc)
+    return start, end
+
+
+def normalize_logs_to_hourly_kwh(df_raw: pd.DataFrame, start_date: datetime = None, end_date: datetime = None,
+                                 interval_minutes: int = None) -> pd.DataFrame:
+    """
+    Konwertuje dane z API SUPLA na godzinowy bilans energii w kWh
+    (lub kwadransowy - interval_minutes / INTERVAL_MINUTES = 15; kolumna
+    hour_utc to wtedy początek kwadransu).
     
     API zwraca kumulatywne odczyty energii (FAE - Forward Active Energy) w setnych Wh (0.01 Wh).
     Funkcja oblicza różnice między kolejnymi odczytami, co daje faktyczne zużycie (bilans godzinowy).
     """
-    df = df_raw.copy()
-    
-    # Konwertuj timestamp na datetime UTC
-    df['ts_utc'] = pd.to_datetime(df['date_timestamp'], unit='s', utc=True)
-    df = df.sort_values('ts_utc')
+    # Użyj fae_balanced (suma energii ze wszystkich faz)
+    if 'fae_balanced' not in df_raw.columns:
+        raise RuntimeError(f"Brak kolumny fae_balanced. Dostępne kolumny: {list(df_raw.columns)}")
+
+    # Tylko potrzebne kolumny (bez kopiowania całego df_raw)
+    df = pd.DataFrame({
+        'ts_utc': pd.to_datetime(df_raw['date_timestamp'], unit='s', utc=True),
+        'total_wh': df_raw['fae_balanced'],
+    })
+    # Sortowanie stabilne: odczyty z tą samą chwilą zostają w kolejności z API
+    df = df.sort_values('ts_utc', kind='stable')
     
     # Filtruj dane do podanego zakresu dat
     if start_date is not None:
@@ -811,12 +2158,6 @@ def normalize_logs_to_hourly_kwh(df_raw: pd.DataFrame, start_date: datetime = No
     if end_date is not None:
         df = df[df['ts_utc'] <= end_date]
     
-    # Użyj fae_balanced (suma energii ze wszystkich faz)
-    if 'fae_balanced' not in df.columns:
-        raise RuntimeError(f"Brak kolumny fae_balanced. Dostępne kolumny: {list(df.columns)}")
-    
-    df['total_wh'] = df['fae_balanced']
-    
     # Konwertuj z setnych Wh (0.01 Wh) na kWh
     # API SUPLA zwraca wartości w setnych Wh, więc dzielimy przez 100000 (100 * 1000)
     df['total_kwh'] = df['total_wh'] / 100000.0
@@ -828,8 +2169,8 @@ def normalize_logs_to_hourly_kwh(df_raw: pd.DataFrame, start_date: datetime = No
     # Usuń pierwszy wiersz (diff daje NaN) i ujemne wartości (reset licznika)
     df = df[df['kwh_consumed'] > 0]
     
-    # Agreguj do godzin (sumuj zużycie w ramach każdej godziny)
-    df['hour_utc'] = df['ts_utc'].dt.floor('h')
+    # Agreguj do interwałów (sumuj zużycie w ramach każdej godziny / kwadransa)
+    df['hour_utc'] = df['ts_utc'].dt.floor(f'{interval_seconds(interval_minutes)}s')
     hourly = df.groupby('hour_utc', as_index=False)['kwh_consumed'].sum()
     hourly = hourly.rename(columns={'kwh_consumed': 'kwh'})
     
@@ -837,6 +2178,300 @@ def normalize_logs_to_hourly_kwh(df_raw: pd.DataFrame, start_date: datetime = No
 
 
 
+# ----------------------------
+# ROZDZIELCZOŚĆ INTERWAŁÓW (15 / 60 MIN)
+# ----------------------------
+def interval_seconds(minutes: int = None) -> int:
+    """Długość interwału bilansu w sekundach (domyślnie INTERVAL_MINUTES)."""
+    minutes = INTERVAL_MINUTES if minutes is None else minutes
+    if minutes not in (15, 60):
+        raise ValueError(f"Obsługiwane interwały: 15 lub 60 minut, podano: {minutes}")
+    return minutes * 60
+
+
+def _epoch_seconds(values) -> np.ndarray:
+    """Kolumna/indeks czasu UTC -> sekundy epoch (int64)."""
+    return pd.DatetimeIndex(values).tz_convert(None).as_unit('s').asi8
+
+
+def _series_step(epoch: np.ndarray, default: int) -> int:
+    """Krok szeregu czasowego = najmniejsza dodatnia różnica (odporne na luki)."""
+    diffs = np.diff(epoch)
+    if (diffs < 0).any():
+        diffs = np.diff(np.sort(epoch))
+    diffs = diffs[diffs > 0]
+    return int(diffs.min()) if len(diffs) else default
+
+
+def resample_prices(tge_prices: pd.DataFrame, interval_s: int) -> pd.DataFrame:
+    """
+    Ceny (format fetch_tge_prices) uśrednione do interwałów interval_s, jeśli
+    są gęstsze (np. kwadransowe -> godzinowe). Rzadsze ceny zwracane bez zmian.
+    """
+    epoch = _epoch_seconds(tge_prices['timestamp_utc'])
+    if _series_step(epoch, interval_s) >= interval_s:
+        return tge_prices
+    values = tge_prices['price_per_kwh_netto'].to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+    buckets, inverse = np.unique(epoch[valid] // interval_s * interval_s, return_inverse=True)
+    means = np.bincount(inverse, weights=values[valid]) / np.bincount(inverse)
+    timestamp_utc = pd.to_datetime(buckets, unit='s', utc=True)
+    return pd.DataFrame({
+        'timestamp_utc': timestamp_utc,
+        'timestamp_local': timestamp_utc.tz_convert('Europe/Warsaw'),
+        'price_per_kwh_netto': means,
+    })
+
+
+def interval_prices(interval_utc, tge_prices: pd.DataFrame, interval_s: int = None) -> np.ndarray:
+    """
+    Cena TGE dla każdego interwału bilansu (wektorowo, searchsorted).
+
+    Długość interwału bilansu to interval_s (domyślnie INTERVAL_MINUTES) -
+    nie jest zgadywana z danych, bo luki w rzadkim szeregu wyglądałyby jak
+    dłuższe interwały. Z danych wyznaczany jest tylko krok cen. Przy cenach
+    godzinowych i bilansie kwadransowym każdy kwadrans dostaje cenę swojej
+    godziny, przy cenach kwadransowych i bilansie godzinowym - średnią
+    z kwadransów godziny. Interwał bez ceny = NaN.
+    """
+    return lookup_prices(_epoch_seconds(interval_utc), price_table(tge_prices, interval_s))
+
+
+def price_table(tge_prices: Optional[pd.DataFrame], interval_s: int = None) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Ceny przygotowane do wyszukiwania (lookup_prices): posortowane początki
+    okresów cen (epoch), ceny i krok cen - raz dla wielu wyszukiwań.
+    """
+    if tge_prices is None or tge_prices.empty:
+        return np.empty(0, dtype=np.int64), np.empty(0), 3600
+    prices = resample_prices(tge_prices, interval_seconds() if interval_s is None else interval_s)
+
+    price_ts = _epoch_seconds(prices['timestamp_utc'])
+    values = prices['price_per_kwh_netto'].to_numpy(dtype=float)
+    order = np.argsort(price_ts, kind='stable')
+    price_ts, values = price_ts[order], values[order]
+    return price_ts, values, _series_step(price_ts, 3600)
+
+
+def lookup_prices(t: np.ndarray, table: Tuple[np.ndarray, np.ndarray, int]) -> np.ndarray:
+    """Cena dla interwałów zaczynających się w t (epoch) lub NaN - searchsorted w price_table."""
+    price_ts, values, price_step = table
+    if not len(price_ts):
+        return np.full(len(t), np.nan)
+    idx = np.searchsorted(price_ts, t, side='right') - 1
+    found = idx >= 0
+    idx = np.where(found, idx, 0)
+    found &= (t - price_ts[idx]) < price_step
+    return np.where(found, values[idx], np.nan)
+
+
+def iter_column_chunks(columns: Dict[str, np.ndarray], chunk_size: int = None):
+    """Dzieli kolumny na paczki stałego rozmiaru (widoki tablic, bez kopiowania)."""
+    chunk_size = chunk_size or HOURLY_CHUNK_SIZE
+    n = _columns_len(columns)
+    for i in range(0, n, chunk_size):
+        yield {c: v[i:i + chunk_size] for c, v in columns.items()}
+
+
+class HourlyEnergyAggregator:
+    """
+    Przyrostowy (online) bilans godzinowy z kumulatywnego licznika fae_balanced.
+
+    Przyjmuje odczyty w kolejności czasu - pojedynczo (add) lub paczkami
+    (add_batch). Pamięta ostatni stan licznika i otwartą godzinę; godzina jest
+    zamykana i zwracana, gdy pojawi się odczyt z późniejszej godziny.
+    Różnice <= 0 (reset licznika, brak zużycia) są pomijane, tak jak w
+    normalize_logs_to_hourly_kwh. Odczyty starsze niż ostatni są ignorowane.
+
+    Zwracane godziny to początki godzin UTC w sekundach (epoch); przy
+    interval=900 - początki kwadransów.
+    """
+
+    def __init__(self, interval: int = 3600):
+        self.interval = interval
+        self.last_ts = None
+        self.last_kwh = None
+        self.open_hour = None
+        self.open_kwh = 0.0
+
+    def add(self, ts: int, fae_balanced: float) -> List[Tuple[int, float]]:
+        """Dodaje jeden odczyt (O(1)). Zwraca listę zamkniętych godzin [(godzina, kWh)]."""
+        if self.last_ts is not None and ts < self.last_ts:
+            return []
+
+        total_kwh = fae_balanced / 100000.0
+        hour = int(ts) // self.interval * self.interval
+        finished = []
+        if self.open_hour is not None and hour > self.open_hour:
+            finished.append((self.open_hour, self.open_kwh))
+            self.open_hour, self.open_kwh = None, 0.0
+
+        if self.last_kwh is not None:
+            consumed = total_kwh - self.last_kwh
+            if consumed > 0:  # NaN również odpada
+                if self.open_hour is None:
+                    self.open_hour = hour
+                self.open_kwh += consumed
+
+        self.last_ts = ts
+        self.last_kwh = total_kwh
+        return finished
+
+    def add_batch(self, ts: np.ndarray, fae_balanced: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Dodaje paczkę odczytów posortowanych rosnąco po czasie (wektorowo).
+
+        Returns:
+            (godziny, kWh) - tablice zamkniętych godzin
+        """
+        if self.last_ts is not None:
+            newer = ts >= self.last_ts
+            ts, fae_balanced = ts[newer], fae_balanced[newer]
+        if len(ts) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        total_kwh = fae_balanced / 100000.0
+        prev = np.nan if self.last_kwh is None else self.last_kwh
+        consumed = np.diff(total_kwh, prepend=prev)
+
+        keep = consumed > 0
+        hours = ts[keep].astype(np.int64) // self.interval * self.interval
+        kwh = consumed[keep]
+        if self.open_hour is not None:
+            hours = np.concatenate(([self.open_hour], hours))
+            kwh = np.concatenate(([self.open_kwh], kwh))
+
+        uniq, inverse = np.unique(hours, return_inverse=True)
+        sums = np.bincount(inverse, weights=kwh, minlength=len(uniq))
+
+        # Godzina ostatniego odczytu pozostaje otwarta
+        current_hour = int(ts[-1]) // self.interval * self.interval
+        done = uniq < current_hour
+        if (~done).any():
+            self.open_hour, self.open_kwh = int(uniq[-1]), float(sums[-1])
+        else:
+            self.open_hour, self.open_kwh = None, 0.0
+
+        self.last_ts = int(ts[-1])
+        self.last_kwh = float(total_kwh[-1])
+        return uniq[done], sums[done]
+
+    def flush(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Zamyka otwartą godzinę (koniec danych) i zwraca ją jako (godziny, kWh)."""
+        if self.open_hour is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        hours, kwh = np.array([self.open_hour], dtype=np.int64), np.array([self.open_kwh])
+        self.open_hour, self.open_kwh = None, 0.0
+        return hours, kwh
+
+
+def hourly_frame(hours: np.ndarray, kwh: np.ndarray) -> pd.DataFrame:
+    """DataFrame [hour_utc, kwh] (jak z normalize_logs_to_hourly_kwh) z tablic godzin epoch."""
+    return pd.DataFrame({
+        'hour_utc': pd.to_datetime(np.asarray(hours, dtype=np.int64), unit='s', utc=True),
+        'kwh': np.asarray(kwh, dtype=float),
+    })
+
+
+def normalize_chunks_to_hourly_kwh(chunks, start_date: datetime = None, end_date: datetime = None,
+                                   interval_minutes: int = None) -> pd.DataFrame:
+    """
+    Strumieniowy odpowiednik normalize_logs_to_hourly_kwh.
+
+    Przyjmuje paczki kolumn ({'date_timestamp', 'fae_balanced'}) uporządkowane
+    rosnąco po czasie i przepuszcza je przez HourlyEnergyAggregator, więc
+    pamięć zależy od rozmiaru paczki i liczby godzin, a nie liczby odczytów.
+    """
+    start_ts = start_date.timestamp() if start_date is not None else None
+    end_ts = end_date.timestamp() if end_date is not None else None
+
+    aggregator = HourlyEnergyAggregator(interval_seconds(interval_minutes))
+    hour_parts, kwh_parts = [], []
+    for chunk in chunks:
+        if 'fae_balanced' not in chunk:
+            raise RuntimeError(f"Brak kolumny fae_balanced. Dostępne kolumny: {list(chunk)}")
+        ts = chunk['date_timestamp']
+        fae = chunk['fae_balanced']
+
+        # Filtruj dane do podanego zakresu dat
+        mask = np.ones(len(ts), dtype=bool)
+        if start_ts is not None:
+            mask &= ts >= start_ts
+        if end_ts is not None:
+            mask &= ts <= end_ts
+
+        hours, kwh = aggregator.add_batch(ts[mask], fae[mask])
+        hour_parts.append(hours)
+        kwh_parts.append(kwh)
+
+    hours, kwh = aggregator.flush()
+    hour_parts.append(hours)
+    kwh_parts.append(kwh)
+    return hourly_frame(np.concatenate(hour_parts), np.concatenate(kwh_parts))
+
+
+@staged("hourly_kwh")
+def hourly_kwh_from_logs(columns: Dict[str, np.ndarray], start_date: datetime = None,
+                         end_date: datetime = None, interval_minutes: int = None) -> pd.DataFrame:
+    """Bilans godzinowy (lub kwadransowy) z kolumn logów SUPLA, liczony paczkami HOURLY_CHUNK_SIZE."""
+    if not _columns_len(columns):
+        raise RuntimeError("API zwróciło pustą listę pomiarów")
+    return normalize_chunks_to_hourly_kwh(iter_column_chunks(columns), start_date, end_date, interval_minutes)
+
+# Taryfy, których strefy pokazuje wykres porównania stref
+CHART_ZONE_TARIFFS = ('G12', 'G12w')
+
+
+@dataclass(frozen=True)
+class ChartData:
+    """
+    Podsumowanie zużycia potrzebne do wykresów, liczone przy okazji
+    compute_costs (czas lokalny i strefy są wtedy już policzone).
+    Dostępne jako res.attrs["chart_data"].
+    """
+    zone_hours: Dict[str, Dict[str, float]]   # {"G12": {"day": h, "night": h}, ...}
+    zone_kwh: Dict[str, Dict[str, float]]
+    hour_of_day_kwh: Tuple[float, ...]        # średnie zużycie na godzinę dla godzin 0-23 (NaN - brak)
+    total_kwh: float
+    mean_kwh: float                           # mean/max/min - na interwał bilansu
+    max_kwh: float
+    min_kwh: float
+    interval_s: int = 3600
+
+
+def chart_data_from(hour_local: pd.Series, zones: Dict[str, np.ndarray],
+                    kwh: np.ndarray, interval_s: int = 3600) -> ChartData:
+    """ChartData z gotowego czasu lokalnego i stref (bez ponownej klasyfikacji)."""
+    zone_hours, zone_kwh = {}, {}
+    for tariff in CHART_ZONE_TARIFFS:
+        if tariff not in zones:
+            continue
+        zone_hours[tariff], zone_kwh[tariff] = {}, {}
+        for zone in ('day', 'night'):
+            mask = zones[tariff] == zone
+            zone_hours[tariff][zone] = int(mask.sum()) * interval_s / 3600
+            zone_kwh[tariff][zone] = float(kwh[mask].sum())
+
+    hour_of_day = hour_local.dt.hour.to_numpy()
+    counts = np.bincount(hour_of_day, minlength=24)
+    sums = np.bincount(hour_of_day, weights=kwh, minlength=24)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        profile = np.where(counts > 0, sums / counts * (3600 / interval_s), np.nan)
+
+    empty = len(kwh) == 0
+    return ChartData(
+        zone_hours=zone_hours,
+        zone_kwh=zone_kwh,
+        hour_of_day_kwh=tuple(float(v) for v in profile),
+        total_kwh=float(kwh.sum()),
+        mean_kwh=float('nan') if empty else float(kwh.mean()),
+        max_kwh=float('nan') if empty else float(kwh.max()),
+        min_kwh=float('nan') if empty else float(kwh.min()),
+        interval_s=interval_s,
+    )
+
+
+@staged("compute_costs")
 def compute_costs(hourly: pd.DataFrame, prices: Dict[str, Dict[str, float]], supports_summer_winter: bool) -> pd.DataFrame:
     # Do stref potrzebujemy czasu lokalnego PL (Europe/Warsaw)
     hourly = hourly.copy()
@@ -851,13 +2486,16 @@ def compute_costs(hourly: pd.DataFrame, prices: Dict[str, Dict[str, float]], sup
     additional_per_kwh = sum(ADDITIONAL_CHARGES.values())
     additional_cost = total_kwh * additional_per_kwh
 
+    # Strefy dla wszystkich taryf w jednym przejściu (wektorowo)
+    all_zones = classify_zones(hourly["hour_local"], prices.keys(), supports_summer_winter)
+    kwh = hourly["kwh"].to_numpy(dtype=float)
+
     results = []
     for tariff in prices.keys():
-        zones = hourly["hour_local"].apply(lambda ts: classify_zone(ts, tariff, supports_summer_winter))
-        p = zones.map(lambda z: prices[tariff][z])
-        
+        p = zone_prices(all_zones[tariff], prices[tariff])
+
         # Koszt energii + dystrybucji zmiennej (netto)
-        energy_cost = (hourly["kwh"] * p).sum()
+        energy_cost = (kwh * p).sum()
         
         # Suma netto
         total_netto = energy_cost + fixed_monthly + additional_cost
@@ -879,18 +2517,777 @@ def compute_costs(hourly: pd.DataFrame, prices: Dict[str, Dict[str, float]], sup
 
     res = pd.DataFrame(results).sort_values("suma_brutto")
     res["roznica_do_najtanszej_zl"] = res["suma_brutto"] - res["suma_brutto"].min()
+
+    # Dane do wykresów z już policzonych stref (brakujące taryfy stref - osobno)
+    missing = [t for t in CHART_ZONE_TARIFFS if t not in all_zones]
+    if missing:
+        all_zones.update(classify_zones(hourly["hour_local"], missing, supports_summer_winter))
+    res.attrs["chart_data"] = chart_data_from(hourly["hour_local"], all_zones, kwh, interval_seconds())
     return res
 
 
-def create_visualizations(hourly: pd.DataFrame, res: pd.DataFrame, year: int, month: int, dynamic_result: Dict = None):
-    """Tworzy wykresy wizualizujące wyniki analizy."""
-    
+# ----------------------------
+# ANALIZA WARIANTÓW (WHAT-IF)
+# ----------------------------
+def zone_kwh_sums(hourly: pd.DataFrame, tariffs, supports_summer_winter: bool) -> Dict[str, Dict[str, float]]:
+    """Suma kWh w każdej strefie każdej taryfy: {taryfa: {strefa: kWh}}."""
+    hour_local = hourly["hour_utc"].dt.tz_convert("Europe/Warsaw")
+    all_zones = classify_zones(hour_local, tariffs, supports_summer_winter)
+    kwh = hourly["kwh"].to_numpy(dtype=float)
+    sums = {}
+    for tariff, zones in all_zones.items():
+        uniq, inverse = np.unique(zones, return_inverse=True)
+        totals = np.bincount(inverse, weights=kwh, minlength=len(uniq))
+        sums[tariff] = dict(zip(uniq.tolist(), totals.tolist()))
+    return sums
+
+
+def sweep_tariff_costs(hourly: pd.DataFrame, tge_prices: Optional[pd.DataFrame] = None,
+                       price_grid: Dict[Tuple[str, str], List[float]] = None,
+                       margins: List[float] = None,
+                       fixed_charge_grid: Dict[str, List[float]] = None,
+                       prices: Dict[str, Dict[str, float]] = None,
+                       supports_summer_winter: bool = None) -> pd.DataFrame:
+    """
+    Koszt brutto wszystkich taryf dla każdej kombinacji parametrów naraz.
+
+    Zużycie redukowane jest raz do sum kWh per strefa (i do sumy kWh x cena TGE),
+    a siatka parametrów liczona jest operacjami macierzowymi - bez ponownego
+    wywoływania compute_costs / compute_dynamic_tariff_cost.
+
+    Args:
+        hourly: Bilans godzinowy [hour_utc, kwh]
+        tge_prices: Ceny TGE (jak z fetch_tge_prices) - None pomija taryfę dynamiczną
+        price_grid: {(taryfa, strefa): wartości}, np. {("G12", "night"): np.linspace(0.4, 0.6, 20)}
+        margins: Wartości marży taryfy dynamicznej (domyślnie DYNAMIC_TARIFF_MARGIN)
+        fixed_charge_grid: {nazwa opłaty z FIXED_CHARGES: wartości}
+        prices: Ceny bazowe (domyślnie PRICES)
+        supports_summer_winter: Domyślnie METER_SUPPORTS_SUMMER_WINTER
+
+    Returns:
+        DataFrame z wierszem na kombinację: kolumny parametrów, suma_brutto
+        każdej taryfy, 'najtansza_stala' i (z cenami TGE) 'Dynamiczna' oraz
+        'marza_progowa' - marża, przy której taryfa dynamiczna kosztuje tyle
+        co najtańsza taryfa stała.
+    """
+    prices = prices or PRICES
+    if supports_summer_winter is None:
+        supports_summer_winter = METER_SUPPORTS_SUMMER_WINTER
+    price_grid = price_grid or {}
+    fixed_charge_grid = fixed_charge_grid or {}
+    margins = [DYNAMIC_TARIFF_MARGIN] if margins is None else margins
+
+    # Osie siatki: ceny stref, opłaty stałe, marża
+    axes = [(f"{t}.{z}", v) for (t, z), v in price_grid.items()]
+    axes += [(f"oplata.{name}", v) for name, v in fixed_charge_grid.items()]
+    axes.append(("marza", margins))
+    names = [name for name, _ in axes]
+    mesh = np.meshgrid(*[np.asarray(v, dtype=float) for _, v in axes], indexing='ij')
+    grid = {name: m.ravel() for name, m in zip(names, mesh)}
+    n = len(grid["marza"])
+
+    zone_sums = zone_kwh_sums(hourly, prices.keys(), supports_summer_winter)
+    total_kwh = float(hourly["kwh"].sum())
+    additional_per_kwh = sum(ADDITIONAL_CHARGES.values())
+
+    def charge(name):
+        key = f"oplata.{name}"
+        return grid[key] if key in grid else np.full(n, FIXED_CHARGES[name])
+
+    fixed_monthly = sum(charge(name) for name in FIXED_CHARGES)
+
+    result = pd.DataFrame(grid)
+    tariff_cols = []
+    for tariff, tariff_prices in prices.items():
+        energy = np.zeros(n)
+        for zone, zone_kwh in zone_sums[tariff].items():
+            key = f"{tariff}.{zone}"
+            energy += zone_kwh * (grid[key] if key in grid else tariff_prices[zone])
+        result[tariff] = (energy + fixed_monthly + total_kwh * additional_per_kwh) * (1 + VAT_RATE)
+        tariff_cols.append(tariff)
+
+    cost_matrix = result[tariff_cols].to_numpy()
+    cheapest = cost_matrix.min(axis=1)
+    result["najtansza_stala"] = np.array(tariff_cols)[cost_matrix.argmin(axis=1)]
+
+    if tge_prices is not None and not tge_prices.empty:
+        merged = hourly.assign(price_per_kwh_netto=interval_prices(hourly['hour_utc'], tge_prices))
+        priced = merged['price_per_kwh_netto'].notna().to_numpy()
+        kwh_priced = float(merged['kwh'].to_numpy()[priced].sum())
+        tge_energy = float((merged['kwh'] * merged['price_per_kwh_netto']).sum())
+
+        dynamic_fixed = DYNAMIC_TARIFF_FIXED_CHARGE + sum(
+            charge(name) for name in FIXED_CHARGES if name != 'handlowa')
+        per_kwh = DYNAMIC_AVG_DISTRIBUTION + additional_per_kwh
+        base_netto = tge_energy + kwh_priced * per_kwh + dynamic_fixed
+
+        result["Dynamiczna"] = (base_netto + kwh_priced * grid["marza"]) * (1 + VAT_RATE)
+        # Koszt dynamicznej jest liniowy w marży -> próg wprost z równania
+        result["marza_progowa"] = (
+            (cheapest / (1 + VAT_RATE) - base_netto) / kwh_priced if kwh_priced > 0 else np.nan
+        )
+
+    return result
+
+
+# ----------------------------
+# KOSZTY WIELU GOSPODARSTW (MACIERZOWO)
+# ----------------------------
+def dynamic_unit_prices(tge: np.ndarray) -> np.ndarray:
+    """Cena netto taryfy dynamicznej (zł/kWh): cena TGE + marża + dystrybucja + OZE i kogeneracja."""
+    return tge + DYNAMIC_TARIFF_MARGIN + DYNAMIC_AVG_DISTRIBUTION + sum(ADDITIONAL_CHARGES.values())
+
+
+def dynamic_fixed_monthly() -> float:
+    """Opłaty stałe taryfy dynamicznej (netto/msc) - opłata handlowa PGE Dynamiczna zamiast zwykłej."""
+    return DYNAMIC_TARIFF_FIXED_CHARGE + sum(v for k, v in FIXED_CHARGES.items() if k != 'handlowa')
+
+
+def tariff_unit_prices(hour_utc, tge_prices: Optional[pd.DataFrame] = None,
+                       prices: Dict[str, Dict[str, float]] = None,
+                       supports_summer_winter: bool = None) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Ceny jednostkowe netto (zł/kWh) każdej taryfy w każdym interwale -
+    wspólne dla wszystkich gospodarstw o tych samych interwałach.
+
+    Taryfy stałe: cena strefy + OZE i kogeneracja; taryfa dynamiczna:
+    cena TGE + marża + dystrybucja + OZE i kogeneracja (0 bez ceny TGE -
+    jak w compute_dynamic_tariff_cost).
+
+    Returns:
+        (nazwy taryf, macierz cen [interwały x taryfy], opłaty stałe netto [taryfy])
+    """
+    prices = prices or PRICES
+    if supports_summer_winter is None:
+        supports_summer_winter = METER_SUPPORTS_SUMMER_WINTER
+    hour_utc = pd.Series(pd.DatetimeIndex(hour_utc))
+    additional_per_kwh = sum(ADDITIONAL_CHARGES.values())
+
+    all_zones = classify_zones(hour_utc.dt.tz_convert("Europe/Warsaw"), prices.keys(), supports_summer_winter)
+    names = list(prices.keys())
+    columns = [zone_prices(all_zones[t], prices[t]) + additional_per_kwh for t in names]
+    fixed = [sum(FIXED_CHARGES.values())] * len(names)
+
+    if tge_prices is not None and not tge_prices.empty:
+        columns.append(np.nan_to_num(dynamic_unit_prices(interval_prices(hour_utc, tge_prices))))
+        fixed.append(dynamic_fixed_monthly())
+        names.append("Dynamiczna")
+    return names, np.column_stack(columns), np.array(fixed, dtype=float)
+
+
+def stack_hourly(frames: Dict[str, pd.DataFrame]) -> Tuple[pd.DatetimeIndex, np.ndarray]:
+    """
+    Bilanse wielu gospodarstw {nazwa: hourly} jako macierz kWh
+    [gospodarstwa x interwały] na wspólnych interwałach (brak danych = 0 kWh).
+    """
+    epochs = [_epoch_seconds(h["hour_utc"]) for h in frames.values()]
+    grid = np.unique(np.concatenate(epochs)) if epochs else np.empty(0, dtype=np.int64)
+    kwh = np.zeros((len(frames), len(grid)))
+    for row, (epoch, hourly) in enumerate(zip(epochs, frames.values())):
+        kwh[row] = np.bincount(np.searchsorted(grid, epoch), weights=hourly["kwh"].to_numpy(dtype=float),
+                               minlength=len(grid))
+    return pd.to_datetime(grid, unit='s', utc=True), kwh
+
+
+@staged("batch_costs")
+def batch_tariff_costs(kwh: np.ndarray, hour_utc, tge_prices: Optional[pd.DataFrame] = None,
+                       households: List[str] = None, prices: Dict[str, Dict[str, float]] = None,
+                       supports_summer_winter: bool = None) -> pd.DataFrame:
+    """
+    Koszt brutto wszystkich taryf dla wielu gospodarstw naraz: jedno mnożenie
+    macierzy kWh [gospodarstwa x interwały] przez ceny [interwały x taryfy].
+
+    Wynik dla każdego gospodarstwa jest taki sam jak suma_brutto
+    z compute_costs / compute_dynamic_tariff_cost dla jego bilansu
+    (opłaty stałe liczone raz - macierz obejmuje jeden okres rozliczeniowy).
+
+    Args:
+        kwh: Zużycie [gospodarstwa x interwały] (brak danych = 0 lub NaN)
+        hour_utc: Początki interwałów (kolumny kwh)
+        tge_prices: Ceny TGE - None pomija taryfę dynamiczną
+        households: Nazwy wierszy (domyślnie 0..n-1)
+
+    Returns:
+        DataFrame: wiersz na gospodarstwo, kolumny z kosztem brutto każdej
+        taryfy (i 'Dynamiczna'), 'kWh' i 'najtansza'
+    """
+    kwh = np.nan_to_num(np.atleast_2d(np.asarray(kwh, dtype=float)))
+    names, unit_prices, fixed = tariff_unit_prices(hour_utc, tge_prices, prices, supports_summer_winter)
+    if kwh.shape[1] != unit_prices.shape[0]:
+        raise ValueError(f"Macierz kWh ma {kwh.shape[1]} kolumn, a interwałów jest {unit_prices.shape[0]}")
+
+    brutto = (kwh @ unit_prices + fixed) * (1 + VAT_RATE)
+    span_add(rows=kwh.size)
+
+    table = pd.DataFrame(brutto, columns=names, index=households)
+    table["kWh"] = kwh.sum(axis=1)
+    table["najtansza"] = np.array(names, dtype=object)[brutto.argmin(axis=1)]
+    return table
+
+
+# ----------------------------
+# KOSTKA ZUŻYCIA I KOSZTÓW (PRE-AGREGACJA)
+# ----------------------------
+# Kody stref w kostce (kolumna zones) - indeksy w tej krotce
+CUBE_ZONES = ("all", "day", "night")
+# Wymiary kostki dostępne w ConsumptionCube.rollup (oprócz "zone:<taryfa>")
+CUBE_DIMENSIONS = ("meter", "date", "year", "month", "hour", "day_type", "weekday")
+
+
+@dataclass
+class ConsumptionCube:
+    """
+    Zużycie i koszty zagregowane do komórek (licznik, godzina) - raporty
+    i zapytania przekrojowe liczone są z kostki, bez ponownego czytania logów.
+
+    meters, hours - kanał SUPLA i początek godziny UTC (epoch, int64),
+    posortowane po (licznik, godzina); days - data lokalna (dni od 1970-01-01),
+    hour_of_day - godzina lokalna 0-23, day_types - DAY_WORKDAY / ... ,
+    zones - kody CUBE_ZONES [wiersz, taryfa], kwh - zużycie,
+    costs - koszt zmienny netto [wiersz, taryfa] (energia, dystrybucja,
+    OZE i kogeneracja), dynamic_costs - to samo dla taryfy dynamicznej
+    (NaN bez cen TGE), tariffs - nazwy kolumn zones/costs,
+    sources - zaimportowane partycje miesięczne {nazwa: mtime}.
+
+    Suma costs za miesiąc + opłaty stałe = suma_netto z compute_costs.
+    """
+    meters: np.ndarray
+    hours: np.ndarray
+    days: np.ndarray
+    hour_of_day: np.ndarray
+    day_types: np.ndarray
+    zones: np.ndarray
+    kwh: np.ndarray
+    costs: np.ndarray
+    dynamic_costs: np.ndarray
+    tariffs: Tuple[str, ...]
+    sources: Dict[str, float]
+
+    _COLUMNS = ("meters", "hours", "days", "hour_of_day", "day_types", "zones",
+                "kwh", "costs", "dynamic_costs")
+
+    @classmethod
+    def empty(cls, tariffs=()) -> "ConsumptionCube":
+        n = len(tariffs)
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32),
+                   np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.uint8), np.empty((0, n), dtype=np.uint8),
+                   np.empty(0), np.empty((0, n)), np.empty(0), tuple(tariffs), {})
+
+    def __len__(self) -> int:
+        return len(self.hours)
+
+    def replace(self, part: "ConsumptionCube", meter: int, start: int, end: int):
+        """
+        Zastępuje komórki licznika `meter` w zakresie godzin [start, end)
+        (epoch UTC) komórkami part - ponowne przeliczenie miesiąca nie
+        zostawia starych godzin.
+        """
+        if not len(self):
+            for c in self._COLUMNS:
+                setattr(self, c, getattr(part, c))
+            self.tariffs = tuple(part.tariffs)
+            return
+        if tuple(part.tariffs) != tuple(self.tariffs):
+            raise ValueError(f"taryfy {list(part.tariffs)} różne od kostki {list(self.tariffs)}")
+
+        stale = (self.meters == meter) & (self.hours >= start) & (self.hours < end)
+        keep = ~stale
+        columns = {c: np.concatenate([getattr(self, c)[keep], getattr(part, c)]) for c in self._COLUMNS}
+        order = np.lexsort((columns["hours"], columns["meters"]))
+        for c, values in columns.items():
+            setattr(self, c, values[order])
+
+    def dimension(self, name: str) -> np.ndarray:
+        """Wartości wymiaru dla każdej komórki (nazwy z CUBE_DIMENSIONS lub "zone:<taryfa>")."""
+        if name.startswith("zone:"):
+            return self.zones[:, self.tariffs.index(name[5:])]
+        if name == "meter":
+            return self.meters
+        if name == "date":
+            return self.days
+        if name == "hour":
+            return self.hour_of_day
+        if name == "day_type":
+            return self.day_types
+        if name == "weekday":
+            # 1970-01-01 był czwartkiem -> poniedziałek=0 ... niedziela=6
+            return (self.days + 3) % 7
+        if name in ("year", "month") and len(self):
+            # Tablica dla zakresu dni kostki zamiast konwersji każdej komórki
+            first = int(self.days.min())
+            dates = np.arange(first, int(self.days.max()) + 1).astype('datetime64[D]')
+            if name == "year":
+                table = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+            else:
+                table = dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+            return table[self.days - first]
+        if name in ("year", "month"):
+            return np.empty(0, dtype=np.int64)
+        raise ValueError(f"Nieznany wymiar kostki: {name} (dostępne: {', '.join(CUBE_DIMENSIONS)}, zone:<taryfa>)")
+
+    def _codes(self, name: str, values) -> np.ndarray:
+        """Wartości filtra w kodach wymiaru (etykiety stref, daty)."""
+        values = [values] if isinstance(values, (str, int, np.integer)) else list(values)
+        if name.startswith("zone:"):
+            return np.array([CUBE_ZONES.index(v) for v in values])
+        if name == "date":
+            return np.array(values, dtype='datetime64[D]').astype(np.int64)
+        return np.array(values, dtype=np.int64)
+
+    def rollup(self, by: List[str] = (), where: Dict[str, object] = None) -> pd.DataFrame:
+        """
+        Sumy kWh i kosztów w grupach wymiarów `by` dla komórek spełniających `where`.
+
+        Przykłady:
+            cube.rollup(["hour"], {"day_type": [DAY_SUNDAY], "month": [12, 1, 2], "hour": range(17, 22)})
+            cube.rollup(["year", "month", "zone:G12w"])
+
+        Returns:
+            DataFrame: kolumny `by`, 'godziny', 'kWh', koszt netto każdej taryfy
+            i 'Dynamiczna' (NaN, gdy żadna komórka grupy nie ma ceny TGE)
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for name, values in (where or {}).items():
+            mask &= np.isin(self.dimension(name), self._codes(name, values))
+
+        # Bez filtrów - widoki kolumn zamiast kopii
+        sel = slice(None) if mask.all() else mask
+        keys = [self.dimension(name)[sel].astype(np.int64) for name in by]
+        # Numery kanałów mogą być duże i rzadkie - do indeksu idą ich numery kolejne
+        meter_ids = None
+        if "meter" in by:
+            pos = list(by).index("meter")
+            meter_ids, keys[pos] = np.unique(keys[pos], return_inverse=True)
+        if keys:
+            lows = [k.min() if len(k) else 0 for k in keys]
+            dims = [int(k.max() - low) + 1 if len(k) else 1 for k, low in zip(keys, lows)]
+            flat = np.ravel_multi_index([k - low for k, low in zip(keys, lows)], dims)
+            size = int(np.prod(dims))
+            if size <= max(4 * len(flat), 1 << 16):
+                # Mało możliwych grup - sumy wprost po indeksie, bez sortowania
+                groups = np.flatnonzero(np.bincount(flat, minlength=size))
+            else:
+                groups, flat = np.unique(flat, return_inverse=True)
+                size = len(groups)
+            group_keys = np.unravel_index(groups, dims)
+        else:
+            lows, group_keys = [], []
+            size, groups, flat = 1, np.zeros(1, dtype=np.int64), np.zeros(int(mask.sum()), dtype=np.intp)
+
+        def total(weights):
+            sums = np.bincount(flat, weights=weights, minlength=size)
+            return sums[groups] if size > len(groups) else sums
+
+        result = {}
+        for name, codes, low in zip(by, group_keys, lows):
+            values = codes + low
+            if name == "meter":
+                values = meter_ids[values]
+            elif name.startswith("zone:"):
+                values = np.array(CUBE_ZONES, dtype=object)[values]
+            elif name == "date":
+                values = values.astype('datetime64[D]')
+            result[name] = values
+        result["godziny"] = total(None).astype(np.int64)
+        result["kWh"] = total(self.kwh[sel])
+        costs = self.costs[sel]
+        for i, tariff in enumerate(self.tariffs):
+            result[tariff] = total(costs[:, i])
+        dynamic = self.dynamic_costs[sel]
+        priced = total((~np.isnan(dynamic)).astype(float))
+        result["Dynamiczna"] = np.where(priced > 0, total(np.nan_to_num(dynamic)), np.nan)
+        return pd.DataFrame(result)
+
+
+def cube_cells(channel_id: int, hourly: pd.DataFrame, dynamic_result: Dict = None,
+               prices: Dict[str, Dict[str, float]] = None, supports_summer_winter: bool = None) -> ConsumptionCube:
+    """
+    Komórki kostki dla jednego licznika z bilansu (godzinowego lub kwadransowego)
+    i - opcjonalnie - wyniku compute_dynamic_tariff_cost (ceny per interwał).
+    """
+    prices = prices or PRICES
+    if supports_summer_winter is None:
+        supports_summer_winter = METER_SUPPORTS_SUMMER_WINTER
+    tariffs = tuple(prices.keys())
+    if hourly.empty:
+        return ConsumptionCube.empty(tariffs)
+
+    hour_local = hourly["hour_utc"].dt.tz_convert("Europe/Warsaw")
+    kwh = hourly["kwh"].to_numpy(dtype=float)
+    additional_per_kwh = sum(ADDITIONAL_CHARGES.values())
+    all_zones = classify_zones(hour_local, tariffs, supports_summer_winter)
+
+    # Interwały kwadransowe sumowane do godziny
+    hours, first, inverse = np.unique(_epoch_seconds(hourly["hour_utc"]) // 3600 * 3600,
+                                      return_index=True, return_inverse=True)
+
+    def per_hour(values):
+        return np.bincount(inverse, weights=values, minlength=len(hours))
+
+    zones = np.empty((len(hours), len(tariffs)), dtype=np.uint8)
+    costs = np.empty((len(hours), len(tariffs)))
+    for i, tariff in enumerate(tariffs):
+        labels = all_zones[tariff]
+        codes = np.zeros(len(labels), dtype=np.uint8)
+        for code, zone in enumerate(CUBE_ZONES):
+            codes[labels == zone] = code
+        zones[:, i] = codes[first]
+        costs[:, i] = per_hour(kwh * (zone_prices(labels, prices[tariff]) + additional_per_kwh))
+
+    dynamic_costs = np.full(len(hours), np.nan)
+    if dynamic_result is not None:
+        total_price = dynamic_result["hourly_data"]["total_price"].to_numpy(dtype=float)
+        priced = per_hour((~np.isnan(total_price)).astype(float)) > 0
+        dynamic_costs[priced] = per_hour(np.nan_to_num(kwh * total_price))[priced]
+
+    local = hour_local.iloc[first]
+    days = local.dt.tz_localize(None).to_numpy().astype('datetime64[D]')
+    return ConsumptionCube(
+        meters=np.full(len(hours), channel_id, dtype=np.int64),
+        hours=hours.astype(np.int64),
+        days=days.astype(np.int64).astype(np.int32),
+        hour_of_day=local.dt.hour.to_numpy().astype(np.uint8),
+        day_types=day_types_for(days).astype(np.uint8),
+        zones=zones,
+        kwh=per_hour(kwh),
+        costs=costs,
+        dynamic_costs=dynamic_costs,
+        tariffs=tariffs,
+        sources={},
+    )
+
+
+def consumption_cube_path() -> str:
+    return os.path.join(_data_dir(), "consumption_cube.npz")
+
+
+def cube_partition_path(channel_id: int, year: int, month: int) -> str:
+    return os.path.join(_data_dir(), f"consumption_cube_{channel_id}_{year}_{month:02d}.npz")
+
+
+def _save_cube_npz(path: str, cube: ConsumptionCube, **extra):
+    with atomic_write(path, 'wb') as f:
+        np.savez_compressed(f, **{c: getattr(cube, c) for c in ConsumptionCube._COLUMNS},
+                            tariffs=np.array(cube.tariffs, dtype=str), **extra)
+
+
+def _load_cube_npz(npz) -> ConsumptionCube:
+    return ConsumptionCube(**{c: npz[c] for c in ConsumptionCube._COLUMNS},
+                           tariffs=tuple(npz['tariffs'].tolist()), sources={})
+
+
+def save_cube_month(channel_id: int, year: int, month: int, hourly: pd.DataFrame, dynamic_result: Dict = None):
+    """
+    Zapisuje komórki miesiąca jako partycję kostki (jeden plik na kanał i miesiąc,
+    więc procesy robocze analyze_range nie piszą do wspólnego pliku).
+    Partycje dołączane są do kostki przy load_consumption_cube.
+    """
+    if not CONSUMPTION_CUBE:
+        return
+    try:
+        start_utc, end_utc = month_range_utc(year, month)
+        part = cube_cells(channel_id, hourly, dynamic_result)
+        os.makedirs(_data_dir(), exist_ok=True)
+        path = cube_partition_path(channel_id, year, month)
+        with file_lock(path):
+            _save_cube_npz(path, part, channel_id=channel_id,
+                           range_utc=np.array([int(start_utc.timestamp()), int(end_utc.timestamp()) + 1]))
+    except Exception as e:
+        log(f"    ⚠️  Błąd zapisu kostki zużycia: {e}")
+
+
+def _read_consumption_cube(path: str) -> ConsumptionCube:
+    """Zapisana kostka z listą zaimportowanych partycji (pusta, gdy brak pliku lub błąd)."""
+    if os.path.exists(path):
+        try:
+            with np.load(path) as npz:
+                cube = _load_cube_npz(npz)
+                cube.sources = dict(zip(npz['source_names'].tolist(), npz['source_mtimes'].tolist()))
+                return cube
+        except Exception as e:
+            log(f"    ⚠️  Błąd odczytu kostki zużycia: {e}. Odbudowuję z partycji...")
+    return ConsumptionCube.empty()
+
+
+def _stale_cube_partitions(cube: ConsumptionCube) -> List[Tuple[str, float]]:
+    """Partycje (plik, mtime), których kostka jeszcze nie zawiera lub które się zmieniły."""
+    import glob
+
+    stale = []
+    for filename in sorted(glob.glob(os.path.join(_data_dir(), "consumption_cube_*_*_*.npz"))):
+        mtime = os.path.getmtime(filename)
+        if cube.sources.get(os.path.basename(filename)) != mtime:
+            stale.append((filename, mtime))
+    return stale
+
+
+@staged("consumption_cube")
+def load_consumption_cube() -> ConsumptionCube:
+    """
+    Wczytuje kostkę i dołącza do niej partycje miesięczne, których jeszcze
+    nie zawiera (lub które zmieniły się od importu) - aktualizacja jest
+    przyrostowa, przeliczane są tylko nowe miesiące.
+
+    Aktualizacja (odczyt, dołączenie partycji, zapis) odbywa się pod blokadą
+    pliku kostki, jak przebudowa archiwum TGE - równoległe procesy nie
+    nadpisują sobie nawzajem dołączonych miesięcy.
+    """
+    path = consumption_cube_path()
+    cube = _read_consumption_cube(path)
+    if not _stale_cube_partitions(cube):
+        span_add(cache="hit", rows=len(cube))
+        return cube
+
+    os.makedirs(_data_dir(), exist_ok=True)
+    with file_lock(path):
+        cube = _read_consumption_cube(path)
+        changed = False
+        for filename, mtime in _stale_cube_partitions(cube):
+            name = os.path.basename(filename)
+            try:
+                with file_lock(filename), np.load(filename) as npz:
+                    part = _load_cube_npz(npz)
+                    start, end = (int(x) for x in npz['range_utc'])
+                    channel_id = int(npz['channel_id'])
+                    mtime = os.path.getmtime(filename)
+                cube.replace(part, channel_id, start, end)
+            except Exception as e:
+                log(f"    ⚠️  Pomijam {name}: {e}")
+                continue
+            cube.sources[name] = mtime
+            changed = True
+
+        span_add(cache="miss" if changed else "hit", rows=len(cube))
+        if changed:
+            try:
+                names = np.array(sorted(cube.sources), dtype=str)
+                _save_cube_npz(path, cube, source_names=names,
+                               source_mtimes=np.array([cube.sources[n] for n in names], dtype=float))
+            except Exception as e:
+                log(f"    ⚠️  Błąd zapisu kostki zużycia: {e}")
+    return cube
+
+
+# ----------------------------
+# PRZESUWANIE ODBIORÓW (LOAD SHIFTING)
+# ----------------------------
+@dataclass(frozen=True)
+class FlexibleLoad:
+    """
+    Elastyczny odbiór do zaplanowania raz na dobę.
+
+    name: nazwa odbioru
+    kwh: energia do pobrania na dobę
+    window_start, window_end: okno czasowe (godziny lokalne 0-24); end <= start
+        oznacza okno przez północ (np. 18 -> 7)
+    max_kw: maksymalny pobór w godzinie (odbiór podzielny, np. ładowanie EV);
+        domyślnie cała energia w jednej godzinie
+    block_hours: jeśli podane - odbiór niepodzielny, ciągły blok tylu godzin
+        z równym poborem (np. zmywarka 2h)
+    """
+    name: str
+    kwh: float
+    window_start: int
+    window_end: int
+    max_kw: Optional[float] = None
+    block_hours: Optional[int] = None
+
+    def __post_init__(self):
+        if self.kwh <= 0:
+            raise ValueError(f"{self.name}: kwh musi być dodatnie, podano {self.kwh}")
+        if self.max_kw is not None and self.max_kw <= 0:
+            raise ValueError(f"{self.name}: max_kw musi być dodatnie, podano {self.max_kw}")
+        hours = self.window_hours
+        needed = self.block_hours or int(np.ceil(self.kwh / (self.max_kw or self.kwh) - 1e-9))
+        if needed > hours:
+            raise ValueError(f"{self.name}: odbiór wymaga {needed} h, a okno "
+                             f"{self.window_start}-{self.window_end} ma {hours} h")
+
+    @property
+    def window_hours(self) -> int:
+        """Długość okna w godzinach (bez zmian czasu)."""
+        return (self.window_end - self.window_start) % 24 or 24
+
+
+def _load_window_matrix(load: FlexibleLoad, hours_utc: np.ndarray, price_columns: List[np.ndarray]):
+    """
+    Macierze cen [dzień, godzina okna] dla okien odbioru w kolejnych dobach.
+    Godziny bez ceny (oraz poza krótszym oknem przy zmianie czasu) = inf.
+    """
+    first, last = int(hours_utc[0]), int(hours_utc[-1])
+    dense_len = (last - first) // 3600 + 1
+    slot = (hours_utc - first) // 3600
+
+    local_days = pd.date_range(
+        pd.Timestamp(first, unit='s', tz='UTC').tz_convert('Europe/Warsaw').normalize().tz_localize(None),
+        pd.Timestamp(last, unit='s', tz='UTC').tz_convert('Europe/Warsaw').normalize().tz_localize(None),
+        freq='D')
+    span = load.window_hours
+    starts = (local_days + pd.Timedelta(hours=load.window_start)).tz_localize(
+        'Europe/Warsaw', ambiguous=True, nonexistent='shift_forward')
+    ends = (local_days + pd.Timedelta(hours=load.window_start + span)).tz_localize(
+        'Europe/Warsaw', ambiguous=True, nonexistent='shift_forward')
+    start_s, end_s = starts.as_unit('s').asi8, ends.as_unit('s').asi8
+    start_idx = (start_s - first) // 3600
+    lengths = (end_s - start_s) // 3600
+
+    width = int(lengths.max())
+    idx = start_idx[:, None] + np.arange(width)[None, :]
+    inside = (np.arange(width)[None, :] < lengths[:, None]) & (idx >= 0) & (idx < dense_len)
+    # Tylko pełne okna mieszczące się w zakresie cen
+    full = inside.sum(axis=1) == lengths
+    idx, inside = idx[full], inside[full]
+
+    matrices = []
+    for values in price_columns:
+        dense = np.full(dense_len, np.inf)
+        dense[slot] = np.where(np.isnan(values), np.inf, values)
+        m = np.full(idx.shape, np.inf)
+        m[inside] = dense[idx[inside]]
+        matrices.append(m)
+    return matrices
+
+
+def _schedule_costs(load: FlexibleLoad, m: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Koszt odbioru na dobę: (bazowy - start od początku okna, optymalny).
+    Odbiór podzielny: najtańsze godziny (sortowanie w wierszu); blokowy:
+    przesuwane okno sum (minimum po wszystkich pozycjach startu).
+    """
+    if load.block_hours:
+        b = int(load.block_hours)
+        if m.shape[1] < b:
+            nan = np.full(len(m), np.nan)
+            return nan, nan
+        sums = np.lib.stride_tricks.sliding_window_view(m, b, axis=1).sum(axis=2)
+        per_hour = load.kwh / b
+        baseline, best = sums[:, 0] * per_hour, sums.min(axis=1) * per_hour
+    else:
+        cap = load.max_kw or load.kwh
+        full_hours = int(load.kwh // cap)
+        rest = load.kwh - full_hours * cap
+        if full_hours + (rest > 1e-12) > m.shape[1]:
+            # Energia nie mieści się w oknie - koszt części odbioru byłby zaniżony
+            nan = np.full(len(m), np.nan)
+            return nan, nan
+
+        def fill(ordered):
+            cost = ordered[:, :full_hours].sum(axis=1) * cap
+            if rest > 1e-12:
+                cost = cost + ordered[:, full_hours] * rest
+            return cost
+
+        baseline, best = fill(m), fill(np.sort(m, axis=1))
+
+    # Doby bez wystarczającej liczby godzin z cenami pomijamy
+    baseline = np.where(np.isfinite(baseline), baseline, np.nan)
+    best = np.where(np.isfinite(best), best, np.nan)
+    return baseline, best
+
+
+def optimize_flexible_loads(loads: List[FlexibleLoad], tge_prices: pd.DataFrame,
+                            prices: Dict[str, Dict[str, float]] = None,
+                            margin: float = None, supports_summer_winter: bool = None) -> pd.DataFrame:
+    """
+    Planuje elastyczne odbiory w najtańszych godzinach i porównuje z
+    uruchomieniem od razu na początku okna - osobno dla taryfy dynamicznej
+    (cena TGE + marża + dystrybucja + OZE/kogeneracja) i dla G12.
+
+    Wszystkie doby danego odbioru liczone są naraz na macierzy
+    [doba, godzina okna], więc cały rok x wiele odbiorów to milisekundy.
+
+    Returns:
+        DataFrame z wierszem na odbiór: liczba dób, kWh, koszty brutto
+        (bazowy / optymalny) i oszczędność dla taryfy dynamicznej i G12
+    """
+    prices = prices or PRICES
+    margin = DYNAMIC_TARIFF_MARGIN if margin is None else margin
+    if supports_summer_winter is None:
+        supports_summer_winter = METER_SUPPORTS_SUMMER_WINTER
+
+    # Okna odbiorów planowane są w pełnych godzinach - ceny kwadransowe uśredniane
+    tge = resample_prices(tge_prices, 3600)
+    tge = tge.dropna(subset=['price_per_kwh_netto']).sort_values('timestamp_utc')
+    hours_utc = tge['timestamp_utc'].dt.tz_convert(None).to_numpy().astype('datetime64[s]').astype(np.int64)
+    per_kwh = DYNAMIC_AVG_DISTRIBUTION + sum(ADDITIONAL_CHARGES.values())
+    dynamic = (tge['price_per_kwh_netto'].to_numpy(dtype=float) + margin + per_kwh) * (1 + VAT_RATE)
+
+    g12_zones = classify_zones(tge['timestamp_utc'].dt.tz_convert('Europe/Warsaw'), ['G12'],
+                               supports_summer_winter)['G12']
+    g12 = (zone_prices(g12_zones, prices['G12']) + sum(ADDITIONAL_CHARGES.values())) * (1 + VAT_RATE)
+
+    rows = []
+    for load in loads:
+        m_dyn, m_g12 = _load_window_matrix(load, hours_utc, [dynamic, g12])
+        base_dyn, best_dyn = _schedule_costs(load, m_dyn)
+        base_g12, best_g12 = _schedule_costs(load, m_g12)
+        # Porównujemy tylko doby, dla których oba warianty są wykonalne
+        valid = np.isfinite(base_dyn) & np.isfinite(best_dyn) & np.isfinite(base_g12) & np.isfinite(best_g12)
+        days = int(valid.sum())
+        rows.append({
+            "odbior": load.name,
+            "doby": days,
+            "kWh": load.kwh * days,
+            "dyn_bazowy": float(base_dyn[valid].sum()),
+            "dyn_optymalny": float(best_dyn[valid].sum()),
+            "dyn_oszczednosc": float((base_dyn - best_dyn)[valid].sum()),
+            "G12_bazowy": float(base_g12[valid].sum()),
+            "G12_optymalny": float(best_g12[valid].sum()),
+            "G12_oszczednosc": float((base_g12 - best_g12)[valid].sum()),
+        })
+    return pd.DataFrame(rows)
+
+
+@staged("charts")
+def create_visualizations(hourly: pd.DataFrame, res: pd.DataFrame, year: int, month: int, dynamic_result: Dict = None,
+                          formats: List[str] = None, dpi: int = None, show: bool = None) -> List[str]:
+    """
+    Tworzy wykresy wizualizujące wyniki analizy.
+
+    Rysuje wyłącznie z gotowych danych: res.attrs["chart_data"] z compute_costs
+    (strefy, profil dobowy) i hourly_data z compute_dynamic_tariff_cost - bez
+    ponownego tz_convert i klasyfikacji stref. Przy show=False figura powstaje
+    bez backendu GUI (nie wymaga ekranu ani nie blokuje), więc nadaje się do
+    generowania wykresów dla wielu miesięcy / liczników.
+
+    Args:
+        formats: Formaty plików, np. ["png", "svg"] (domyślnie CHART_FORMATS)
+        dpi: Rozdzielczość (domyślnie CHART_DPI; np. 40 = miniatura)
+        show: Czy wyświetlić okno wykresu (domyślnie CHART_SHOW)
+
+    Returns:
+        Lista zapisanych plików
+    """
+    # matplotlib ładowany dopiero tutaj - obliczenia bez wykresów startują szybciej
+    import matplotlib.dates as mdates
+    from matplotlib import style
+    from matplotlib.artist import setp
+    from matplotlib.figure import Figure
+
+    formats = CHART_FORMATS if formats is None else formats
+    dpi = CHART_DPI if dpi is None else dpi
+    show = CHART_SHOW if show is None else show
+
+    data = res.attrs.get("chart_data")
+    if data is None:
+        # res spoza compute_costs (np. złożony ręcznie) - policz podsumowanie raz
+        hour_local = hourly['hour_utc'].dt.tz_convert('Europe/Warsaw')
+        data = chart_data_from(hour_local,
+                               classify_zones(hour_local, CHART_ZONE_TARIFFS, METER_SUPPORTS_SUMMER_WINTER),
+                               hourly['kwh'].to_numpy(dtype=float), interval_seconds())
+
     # Ustaw styl wykresów
-    plt.style.use('seaborn-v0_8-darkgrid')
-    fig = plt.figure(figsize=(16, 10))
+    style.use('seaborn-v0_8-darkgrid')
+    # Bez show figura nie jest rejestrowana w pyplot - rysowanie bez GUI
+    if show:
+        import matplotlib.pyplot as plt
+        fig = plt.figure(figsize=(16, 10))
+    else:
+        fig = Figure(figsize=(16, 10))
+    local_dates = mdates.DateFormatter('%d.%m', tz='Europe/Warsaw')
     
     # 1. Wykres słupkowy kosztów dla różnych taryf
-    ax1 = plt.subplot(2, 3, 1)
+    ax1 = fig.add_subplot(2, 3, 1)
     
     # Dodaj taryfa dynamiczną do porównania jeśli dostępna
     tariffs_to_plot = res.copy()
@@ -907,7 +3304,7 @@ def create_visualizations(hourly: pd.DataFrame, res: pd.DataFrame, year: int, mo
     ax1.set_ylabel('Koszt brutto (zł)', fontsize=11, fontweight='bold')
     ax1.set_title(f'Porównanie kosztów taryf\n{year}-{month:02d}', fontsize=12, fontweight='bold')
     ax1.grid(axis='y', alpha=0.3)
-    plt.setp(ax1.xaxis.get_majorticklabels(), rotation=15, ha='right')
+    setp(ax1.xaxis.get_majorticklabels(), rotation=15, ha='right')
     
     # Dodaj wartości na słupkach
     for bar in bars:
@@ -916,7 +3313,7 @@ def create_visualizations(hourly: pd.DataFrame, res: pd.DataFrame, year: int, mo
                 f'{height:.2f} zł', ha='center', va='bottom', fontsize=9, fontweight='bold')
     
     # 2. Wykres struktury kosztów dla najtańszej taryfy
-    ax2 = plt.subplot(2, 3, 2)
+    ax2 = fig.add_subplot(2, 3, 2)
     best = res.iloc[0]
     costs = [best['koszt_energia_netto'], best['oplaty_stale'], 
              best['oze_kogeneracja'], best['vat_23']]
@@ -933,57 +3330,50 @@ def create_visualizations(hourly: pd.DataFrame, res: pd.DataFrame, year: int, mo
                   fontsize=12, fontweight='bold')
     
     # 3. Ceny TGE (jeśli dostępne) vs zużycie
-    ax3 = plt.subplot(2, 3, 3)
+    ax3 = fig.add_subplot(2, 3, 3)
     
+    # Oś czasu w UTC, etykiety w czasie lokalnym (formatter) - bez kopii i tz_convert
     if dynamic_result and 'hourly_data' in dynamic_result:
         tge_data = dynamic_result['hourly_data']
-        tge_data_local = tge_data.copy()
-        tge_data_local['hour_local'] = tge_data_local['hour_utc'].dt.tz_convert('Europe/Warsaw')
         
         # Dwie osie Y
         ax3_twin = ax3.twinx()
         
         # Ceny TGE (linia)
-        ax3.plot(tge_data_local['hour_local'], tge_data_local['price_per_kwh_netto'], 
+        ax3.plot(tge_data['hour_utc'], tge_data['price_per_kwh_netto'], 
                  color='#e74c3c', linewidth=2, alpha=0.8, label='Cena TGE')
         ax3.set_ylabel('Cena TGE (zł/kWh)', fontsize=11, fontweight='bold', color='#e74c3c')
         ax3.tick_params(axis='y', labelcolor='#e74c3c')
         
         # Zużycie (słupki)
-        ax3_twin.bar(tge_data_local['hour_local'], tge_data_local['kwh'], 
-                     alpha=0.3, color='#3498db', width=0.03, label='Zużycie')
+        ax3_twin.bar(tge_data['hour_utc'], tge_data['kwh'], 
+                     alpha=0.3, color='#3498db', width=0.03 * data.interval_s / 3600, label='Zużycie')
         ax3_twin.set_ylabel('Zużycie (kWh)', fontsize=11, fontweight='bold', color='#3498db')
         ax3_twin.tick_params(axis='y', labelcolor='#3498db')
         
         ax3.set_xlabel('Data', fontsize=11, fontweight='bold')
         ax3.set_title('Ceny TGE vs Zużycie energii', fontsize=12, fontweight='bold')
         ax3.grid(True, alpha=0.3)
-        ax3.xaxis.set_major_formatter(mdates.DateFormatter('%d.%m'))
-        plt.setp(ax3.xaxis.get_majorticklabels(), rotation=45)
+        ax3.xaxis.set_major_formatter(local_dates)
+        setp(ax3.xaxis.get_majorticklabels(), rotation=45)
     else:
         # Jeśli nie ma danych TGE, pokaż zwykłe zużycie
-        hourly_local = hourly.copy()
-        hourly_local['hour_local'] = hourly_local['hour_utc'].dt.tz_convert('Europe/Warsaw')
-        
-        ax3.plot(hourly_local['hour_local'], hourly_local['kwh'], 
+        ax3.plot(hourly['hour_utc'], hourly['kwh'], 
                  color='#3498db', linewidth=1.5, alpha=0.7)
-        ax3.fill_between(hourly_local['hour_local'], hourly_local['kwh'], 
+        ax3.fill_between(hourly['hour_utc'], hourly['kwh'], 
                           alpha=0.3, color='#3498db')
         ax3.set_ylabel('Zużycie (kWh)', fontsize=11, fontweight='bold')
         ax3.set_xlabel('Data', fontsize=11, fontweight='bold')
         ax3.set_title('Zużycie energii w czasie', fontsize=12, fontweight='bold')
         ax3.grid(True, alpha=0.3)
-        ax3.xaxis.set_major_formatter(mdates.DateFormatter('%d.%m'))
-        plt.setp(ax3.xaxis.get_majorticklabels(), rotation=45)
+        ax3.xaxis.set_major_formatter(local_dates)
+        setp(ax3.xaxis.get_majorticklabels(), rotation=45)
     
     # 4. Histogram zużycia godzinowego - rozkład według godziny doby
-    ax4 = plt.subplot(2, 3, 4)
-    hourly_local = hourly.copy()
-    hourly_local['hour_local'] = hourly_local['hour_utc'].dt.tz_convert('Europe/Warsaw')
-    hourly_local['hour_of_day'] = hourly_local['hour_local'].dt.hour
+    ax4 = fig.add_subplot(2, 3, 4)
     
-    # Agreguj zużycie według godziny doby (0-23)
-    hourly_avg = hourly_local.groupby('hour_of_day')['kwh'].mean().sort_index()
+    # Średnie zużycie według godziny doby (0-23) - policzone w compute_costs
+    hourly_avg = pd.Series(data.hour_of_day_kwh).dropna()
     
     bars = ax4.bar(hourly_avg.index, hourly_avg.values, color='#2ecc71', alpha=0.7, edgecolor='black')
     ax4.set_xlabel('Godzina doby', fontsize=11, fontweight='bold')
@@ -1002,36 +3392,27 @@ def create_visualizations(hourly: pd.DataFrame, res: pd.DataFrame, year: int, mo
             bar.set_alpha(0.7)
     
     # 5. Analiza stref czasowych (G12 vs G12w)
-    ax5 = plt.subplot(2, 3, 5)
-    
-    # Oblicz statystyki dla G12
-    hourly_local['zone_g12'] = hourly_local['hour_local'].apply(
-        lambda ts: classify_zone(ts, 'G12', METER_SUPPORTS_SUMMER_WINTER))
-    stats_g12 = hourly_local.groupby('zone_g12')['kwh'].agg(['sum', 'count'])
+    ax5 = fig.add_subplot(2, 3, 5)
     
-    # Oblicz statystyki dla G12w
-    hourly_local['zone_g12w'] = hourly_local['hour_local'].apply(
-        lambda ts: classify_zone(ts, 'G12w', METER_SUPPORTS_SUMMER_WINTER))
-    stats_g12w = hourly_local.groupby('zone_g12w')['kwh'].agg(['sum', 'count'])
-    
-    # Przygotuj dane do wykresu
+    # Przygotuj dane do wykresu (sumy stref z compute_costs)
     categories = ['G12 Dzień', 'G12 Noc', 'G12w Dzień', 'G12w Noc']
     
-    def get_stat(stats, zone, col):
-        return stats.loc[zone, col] if zone in stats.index else 0
+    def get_stat(tariff, zone, col):
+        stats = data.zone_hours if col == 'count' else data.zone_kwh
+        return stats.get(tariff, {}).get(zone, 0)
         
     hours_data = [
-        get_stat(stats_g12, 'day', 'count'),
-        get_stat(stats_g12, 'night', 'count'),
-        get_stat(stats_g12w, 'day', 'count'),
-        get_stat(stats_g12w, 'night', 'count')
+        get_stat('G12', 'day', 'count'),
+        get_stat('G12', 'night', 'count'),
+        get_stat('G12w', 'day', 'count'),
+        get_stat('G12w', 'night', 'count')
     ]
     
     kwh_data = [
-        get_stat(stats_g12, 'day', 'sum'),
-        get_stat(stats_g12, 'night', 'sum'),
-        get_stat(stats_g12w, 'day', 'sum'),
-        get_stat(stats_g12w, 'night', 'sum')
+        get_stat('G12', 'day', 'sum'),
+        get_stat('G12', 'night', 'sum'),
+        get_stat('G12w', 'day', 'sum'),
+        get_stat('G12w', 'night', 'sum')
     ]
     
     x = np.arange(len(categories))
@@ -1064,7 +3445,7 @@ def create_visualizations(hourly: pd.DataFrame, res: pd.DataFrame, year: int, mo
                 f'{height:.1f}', ha='center', va='bottom', fontsize=8, fontweight='bold')
     
     # 6. Statystyki tekstowe
-    ax6 = plt.subplot(2, 3, 6)
+    ax6 = fig.add_subplot(2, 3, 6)
     ax6.axis('off')
     
     if dynamic_result:
@@ -1072,14 +3453,14 @@ def create_visualizations(hourly: pd.DataFrame, res: pd.DataFrame, year: int, mo
     STATYSTYKI {year}-{month:02d}
     
     Zużycie energii:
-       • Całkowite: {hourly['kwh'].sum():.2f} kWh
-       • Średnie godz.: {hourly['kwh'].mean():.3f} kWh
-       • Max godz.: {hourly['kwh'].max():.3f} kWh
-       • Min godz.: {hourly['kwh'].min():.3f} kWh
+       • Całkowite: {data.total_kwh:.2f} kWh
+       • Średnie godz.: {data.mean_kwh:.3f} kWh
+       • Max godz.: {data.max_kwh:.3f} kWh
+       • Min godz.: {data.min_kwh:.3f} kWh
     
     Strefy G12:
-       • Dzień: {get_stat(stats_g12, 'day', 'count'):.0f}h ({get_stat(stats_g12, 'day', 'sum'):.1f} kWh)
-       • Noc: {get_stat(stats_g12, 'night', 'count'):.0f}h ({get_stat(stats_g12, 'night', 'sum'):.1f} kWh)
+       • Dzień: {get_stat('G12', 'day', 'count'):.0f}h ({get_stat('G12', 'day', 'sum'):.1f} kWh)
+       • Noc: {get_stat('G12', 'night', 'count'):.0f}h ({get_stat('G12', 'night', 'sum'):.1f} kWh)
     
     Porównanie kosztów:
        • Najtańsza: {res.iloc[0]['taryfa']} ({res.iloc[0]['suma_brutto']:.2f} zł)
@@ -1096,14 +3477,14 @@ def create_visualizations(hourly: pd.DataFrame, res: pd.DataFrame, year: int, mo
     STATYSTYKI {year}-{month:02d}
     
     Zużycie energii:
-       • Całkowite: {hourly['kwh'].sum():.2f} kWh
-       • Średnie godz.: {hourly['kwh'].mean():.3f} kWh
-       • Max godz.: {hourly['kwh'].max():.3f} kWh
-       • Min godz.: {hourly['kwh'].min():.3f} kWh
+       • Całkowite: {data.total_kwh:.2f} kWh
+       • Średnie godz.: {data.mean_kwh:.3f} kWh
+       • Max godz.: {data.max_kwh:.3f} kWh
+       • Min godz.: {data.min_kwh:.3f} kWh
     
     Strefy G12:
-       • Dzień: {get_stat(stats_g12, 'day', 'count'):.0f}h ({get_stat(stats_g12, 'day', 'sum'):.1f} kWh)
-       • Noc: {get_stat(stats_g12, 'night', 'count'):.0f}h ({get_stat(stats_g12, 'night', 'sum'):.1f} kWh)
+       • Dzień: {get_stat('G12', 'day', 'count'):.0f}h ({get_stat('G12', 'day', 'sum'):.1f} kWh)
+       • Noc: {get_stat('G12', 'night', 'count'):.0f}h ({get_stat('G12', 'night', 'sum'):.1f} kWh)
     
     Oszczędności:
        • G12w vs G12: {res.iloc[1]['roznica_do_najtanszej_zl']:.2f} zł
@@ -1116,39 +3497,75 @@ def create_visualizations(hourly: pd.DataFrame, res: pd.DataFrame, year: int, mo
              fontsize=11, verticalalignment='top', fontfamily='monospace',
              bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.3))
     
-    plt.tight_layout()
+    fig.tight_layout()
     
     # Ścieżka do katalogu output (względem katalogu src)
     output_dir = os.path.join(os.path.dirname(__file__), '..', 'output')
     os.makedirs(output_dir, exist_ok=True)
-    filename = os.path.join(output_dir, f'analiza_energii_{year}_{month:02d}.png')
-    
-    plt.savefig(filename, dpi=150, bbox_inches='tight')
-    print(f"\n✅ Zapisano wykres: {filename}")
-    plt.show()
 
+    filenames = []
+    for fmt in formats:
+        filename = os.path.join(output_dir, f'analiza_energii_{year}_{month:02d}.{fmt}')
+        fig.savefig(filename, dpi=dpi, bbox_inches='tight')
+        log(f"\n✅ Zapisano wykres: {filename}")
+        filenames.append(filename)
+
+    span_add(rows=len(hourly))
+    if show:
+        plt.show()
+        plt.close(fig)
+    return filenames
+
+
+def compute_month(year: int, month: int, dynamic: bool = True) -> Tuple[pd.DataFrame, pd.DataFrame, Optional[Dict]]:
+    """
+    Pobranie -> bilans godzinowy -> taryfy stałe -> taryfa dynamiczna
+    dla jednego miesiąca (kanał CHANNEL_ID).
+
+    Ceny TGE pobierane są w osobnym wątku równolegle z logami SUPLA i taryfami
+    stałymi - oba pobrania czekają głównie na sieć, więc całość trwa tyle,
+    co dłuższe z nich, a nie ich suma.
+
+    Returns:
+        (hourly, res z compute_costs, wynik compute_dynamic_tariff_cost lub None)
+    """
+    from concurrent.futures import ThreadPoolExecutor
 
-def main():
     api_base = decode_supla_api_base_from_token(SUPLA_TOKEN)
-    start_utc, end_utc = month_range_utc(YEAR, MONTH)
+    start_utc, end_utc = month_range_utc(year, month)
 
-    json_data = download_measurement_logs_json(api_base, SUPLA_TOKEN, CHANNEL_ID, start_utc, end_utc)
-    df_raw = parse_json_to_dataframe(json_data)
-    
-    # Przefiltruj dane do żądanego miesiąca i oblicz bilans godzinowy
-    hourly = normalize_logs_to_hourly_kwh(df_raw, start_utc, end_utc)
+    executor = prices_future = None
+    if dynamic:
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tge")
+        prices_future = executor.submit(contextvars.copy_context().run, fetch_tge_prices, year, month, False)
+    try:
+        json_data = download_measurement_logs_json(api_base, SUPLA_TOKEN, CHANNEL_ID, start_utc, end_utc)
 
-    # Oblicz koszty dla standardowych taryf
-    res = compute_costs(hourly, PRICES, METER_SUPPORTS_SUMMER_WINTER)
-    
-    # Pobierz ceny TGE i oblicz koszt dla taryfy dynamicznej
-    tge_prices = fetch_tge_prices(YEAR, MONTH, verbose=False)
-    dynamic_result = None
-    if tge_prices is not None:
-        dynamic_result = compute_dynamic_tariff_cost(hourly, tge_prices)
-    
+        # Przefiltruj dane do żądanego miesiąca i oblicz bilans godzinowy (paczkami)
+        hourly = hourly_kwh_from_logs(json_data, start_utc, end_utc)
+
+        # Oblicz koszty dla standardowych taryf (ceny TGE mogą się jeszcze pobierać)
+        res = compute_costs(hourly, PRICES, METER_SUPPORTS_SUMMER_WINTER)
+
+        # Poczekaj na ceny TGE i oblicz koszt dla taryfy dynamicznej
+        dynamic_result = None
+        if prices_future is not None:
+            tge_prices = prices_future.result()
+            if tge_prices is not None:
+                dynamic_result = compute_dynamic_tariff_cost(hourly, tge_prices)
+    finally:
+        # Po błędzie SUPLA nie czekamy na dokończenie pobierania cen
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    save_cube_month(CHANNEL_ID, year, month, hourly, dynamic_result)
+    return hourly, res, dynamic_result
+
+
+def print_report(year: int, month: int, hourly: pd.DataFrame, res: pd.DataFrame, dynamic_result: Dict = None):
+    """Raport tekstowy porównania taryf dla jednego miesiąca."""
     print(f"\n{'='*60}")
-    print(f"  ANALIZA TARYF ENERGII ELEKTRYCZNEJ - {YEAR}-{MONTH:02d}")
+    print(f"  ANALIZA TARYF ENERGII ELEKTRYCZNEJ - {year}-{month:02d}")
     print(f"{'='*60}\n")
     print(f"📊 Liczba godzin z danymi: {len(hourly)}")
     print(f"⚡ Całkowite zużycie: {hourly['kwh'].sum():.2f} kWh\n")
@@ -1185,10 +3602,966 @@ def main():
     print(f"  {'─'*56}")
     print(f"  💰 SUMA BRUTTO:                    {res.iloc[0]['suma_brutto']:>8.2f} zł")
     print(f"\n{'='*60}\n")
+
+
+@staged("main")
+def main():
+    hourly, res, dynamic_result = compute_month(YEAR, MONTH)
+    print_report(YEAR, MONTH, hourly, res, dynamic_result)
     
     # Generuj wykresy
     create_visualizations(hourly, res, YEAR, MONTH, dynamic_result)
 
 
+# ----------------------------
+# ANALIZA ZAKRESU MIESIĘCY
+# ----------------------------
+def months_in_range(start: str, end: str) -> List[Tuple[int, int]]:
+    """Lista (rok, miesiąc) od start do end włącznie (format YYYY-MM)."""
+    y, m = (int(x) for x in start.split("-"))
+    end_y, end_m = (int(x) for x in end.split("-"))
+    months = []
+    while (y, m) <= (end_y, end_m):
+        months.append((y, m))
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    if not months:
+        raise ValueError(f"Pusty zakres miesięcy: {start} - {end}")
+    return months
+
+
+@staged("analyze_month")
+def analyze_month(year: int, month: int, dynamic: bool = True) -> pd.DataFrame:
+    """
+    Pełny przebieg dla jednego miesiąca (compute_month) jako tabela.
+    Wywoływane w procesach roboczych.
+
+    Returns:
+        DataFrame z wierszem na taryfę i kolumną 'miesiac'
+    """
+    _, res, dynamic_result = compute_month(year, month, dynamic)
+    rows = res.drop(columns=["roznica_do_najtanszej_zl"])
+
+    if dynamic_result:
+        rows = pd.concat([rows, pd.DataFrame([{c: dynamic_result[c] for c in rows.columns}])],
+                         ignore_index=True)
+
+    rows.insert(0, "miesiac", f"{year}-{month:02d}")
+    return rows
+
+
+def _analyze_month_worker(year: int, month: int, dynamic: bool) -> Tuple[pd.DataFrame, Dict]:
+    table = analyze_month(year, month, dynamic)
+    return table, take_stage_totals()
+
+
+def analyze_range(start: str, end: str, workers: int = None, dynamic: bool = True) -> pd.DataFrame:
+    """
+    Analiza wielu miesięcy równolegle w procesach roboczych
+    (domyślnie tyle procesów, ile rdzeni CPU).
+
+    Returns:
+        Tabela z wierszami per miesiąc i taryfa oraz wierszami 'SUMA' per taryfa
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    months = months_in_range(start, end)
+    workers = workers or min(os.cpu_count() or 1, len(months))
+
+    # Procesy robocze dostają te same nadpisania konfiguracji co proces główny (CLI),
+    # a sumy etapów (metryki .prom) oddają razem z wynikiem
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_metrics_worker,
+                             initargs=(dict(_CONFIG_OVERRIDES),)) as executor:
+        parts = []
+        for table, totals in executor.map(_analyze_month_worker, *zip(*months), [dynamic] * len(months)):
+            parts.append(table)
+            merge_stage_totals(totals)
+
+    combined = pd.concat(parts, ignore_index=True)
+    value_cols = [c for c in combined.columns if c not in ("miesiac", "taryfa")]
+
+    totals = combined.groupby("taryfa", as_index=False)[value_cols].sum()
+    totals.insert(0, "miesiac", "SUMA")
+
+    combined = pd.concat([combined, totals], ignore_index=True)
+    combined["roznica_do_najtanszej_zl"] = (
+        combined["suma_brutto"] - combined.groupby("miesiac")["suma_brutto"].transform("min")
+    )
+    # "SUMA" sortuje się po miesiącach YYYY-MM
+    return combined.sort_values(["miesiac", "suma_brutto"]).reset_index(drop=True)
+
+
+def main_range(start: str, end: str, dynamic: bool = True, workers: int = None):
+    combined = analyze_range(start, end, workers=workers, dynamic=dynamic)
+
+    print(f"\n{'='*60}")
+    print(f"  ANALIZA TARYF ENERGII ELEKTRYCZNEJ - {start} .. {end}")
+    print(f"{'='*60}\n")
+    print(combined[["miesiac", "taryfa", "suma_brutto", "kWh", "roznica_do_najtanszej_zl"]].to_string(index=False))
+    print(f"\n{'='*60}\n")
+    return combined
+
+
+# ----------------------------
+# TRYB FLOTY (WIELE LICZNIKÓW)
+# ----------------------------
+@staged("analyze_channel")
+def analyze_channel(token: str, channel_id: int, year: int, month: int,
+                    tge_prices: Optional[pd.DataFrame]) -> Dict[str, float]:
+    """
+    Koszty wszystkich taryf dla jednego kanału SUPLA w danym miesiącu.
+
+    Returns:
+        Słownik {taryfa: suma_brutto} uzupełniony o 'kWh'
+    """
+    api_base = decode_supla_api_base_from_token(token)
+    start_utc, end_utc = month_range_utc(year, month)
+
+    json_data = download_measurement_logs_json(api_base, token, channel_id, start_utc, end_utc)
+    hourly = hourly_kwh_from_logs(json_data, start_utc, end_utc)
+
+    res = compute_costs(hourly, PRICES, METER_SUPPORTS_SUMMER_WINTER)
+    row = dict(zip(res["taryfa"], res["suma_brutto"]))
+
+    dynamic_result = None
+    if tge_prices is not None:
+        dynamic_result = compute_dynamic_tariff_cost(hourly, tge_prices)
+        if dynamic_result:
+            row["Dynamiczna"] = dynamic_result["suma_brutto"]
+    save_cube_month(channel_id, year, month, hourly, dynamic_result)
+
+    row["kWh"] = float(hourly["kwh"].sum())
+    return row
+
+
+def analyze_fleet(fleet: List[Tuple], year: int, month: int, max_workers: int = None) -> pd.DataFrame:
+    """
+    Porównanie taryf dla wielu liczników (kanałów SUPLA), także z różnych kont.
+
+    Logi pobierane są współbieżnie (maks. max_workers naraz, domyślnie
+    SUPLA_MAX_CONCURRENT_DOWNLOADS) przez współdzielone sesje HTTP per
+    serwer API. Ceny TGE pobierane są raz dla całej floty.
+
+    Args:
+        fleet: Lista (token, channel_id) lub (token, channel_id, nazwa)
+
+    Returns:
+        Tabela: wiersz na kanał, kolumny z kosztem brutto każdej taryfy,
+        'kWh' i 'najtansza'. Kanały z błędem mają wypełnioną kolumnę 'blad'.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    tge_prices = fetch_tge_prices(year, month, verbose=False)
+
+    def run(entry):
+        token, channel_id = entry[0], entry[1]
+        name = entry[2] if len(entry) > 2 else str(channel_id)
+        try:
+            row = analyze_channel(token, channel_id, year, month, tge_prices)
+            row["blad"] = None
+        except Exception as e:
+            log(f"⚠️  Kanał {name}: {e}")
+            row = {"blad": str(e)}
+        return {"kanal": name, **row}
+
+    with ThreadPoolExecutor(max_workers=max_workers or SUPLA_MAX_CONCURRENT_DOWNLOADS) as executor:
+        rows = list(executor.map(run, fleet))
+
+    table = pd.DataFrame(rows).set_index("kanal")
+    tariff_cols = [c for c in table.columns if c not in ("kWh", "blad")]
+    ok = table["blad"].isna()
+    table["najtansza"] = None
+    if tariff_cols and ok.any():
+        table.loc[ok, "najtansza"] = table.loc[ok, tariff_cols].idxmin(axis=1)
+    return table
+
+
+def main_fleet():
+    if not SUPLA_FLEET:
+        raise RuntimeError("Brak kanałów w SUPLA_FLEET (supla_config.py)")
+
+    table = analyze_fleet(SUPLA_FLEET, YEAR, MONTH)
+
+    print(f"\n{'='*60}")
+    print(f"  PORÓWNANIE TARYF DLA FLOTY LICZNIKÓW - {YEAR}-{MONTH:02d}")
+    print(f"{'='*60}\n")
+    print(table.drop(columns=["blad"]).round(2).to_string())
+    print(f"\n{'='*60}\n")
+    return table
+
+
+def main_shift(start: str, end: str):
+    if not FLEXIBLE_LOADS:
+        raise RuntimeError("Brak odbiorów w FLEXIBLE_LOADS (supla_config.py)")
+
+    loads = [FlexibleLoad(**load) for load in FLEXIBLE_LOADS]
+    parts = [fetch_tge_prices(y, m, verbose=False) for y, m in months_in_range(start, end)]
+    parts = [p for p in parts if p is not None]
+    if not parts:
+        raise RuntimeError("Brak cen TGE dla podanego zakresu")
+    tge_prices = pd.concat(parts, ignore_index=True).drop_duplicates('timestamp_utc')
+
+    table = optimize_flexible_loads(loads, tge_prices)
+
+    print(f"\n{'='*60}")
+    print(f"  PRZESUWANIE ODBIORÓW - {start} .. {end}")
+    print(f"{'='*60}\n")
+    print(table.round(2).to_string(index=False))
+    print(f"\n{'='*60}\n")
+    return table
+
+# ----------------------------
+# PODGLĄD BIEŻĄCEGO MIESIĄCA NA ŻYWO (WATCH)
+# ----------------------------
+class LiveCostTracker:
+    """
+    Narastające od początku miesiąca koszty wszystkich taryf (także dynamicznej)
+    dla jednego kanału, aktualizowane tylko o nowe odczyty.
+
+    Odczyty przechodzą przez HourlyEnergyAggregator; każdy zamknięty interwał
+    jest raz wyceniany (tariff_unit_prices, ceny TGE z archiwum) i dodawany
+    do sum, więc koszt odpytania jest O(liczba nowych odczytów) - bez
+    ponownego normalize_logs_to_hourly_kwh i compute_costs dla całego miesiąca.
+    Interwały bez znanej jeszcze ceny TGE czekają na refresh_prices.
+    Po zamknięciu miesiąca (finish) sumy są równe compute_costs /
+    compute_dynamic_tariff_cost dla bilansu całego miesiąca.
+    """
+
+    def __init__(self, channel_id: int, year: int, month: int, tge_prices: Optional[pd.DataFrame] = None):
+        self.channel_id = channel_id
+        self.year, self.month = year, month
+        self.start_utc, self.end_utc = month_range_utc(year, month)
+        self.aggregator = HourlyEnergyAggregator(interval_seconds())
+        self.tariffs = list(PRICES.keys())
+        self.tge_prices = tge_prices
+        self._prices = price_table(tge_prices)
+        self._archive = None
+        self.readings = 0
+        self.intervals = 0
+        self.kwh = 0.0
+        # Koszt zmienny netto zamkniętych interwałów (z OZE i kogeneracją)
+        self.energy = np.zeros(len(self.tariffs))
+        self.dynamic_energy = 0.0
+        self.unpriced_hours = np.empty(0, dtype=np.int64)
+        self.unpriced_kwh = np.empty(0)
+        self.finished = False
+
+    def add_readings(self, columns: Dict[str, np.ndarray]) -> int:
+        """Dolicza nowe odczyty (posortowane po czasie). Zwraca liczbę zamkniętych interwałów."""
+        if not _columns_len(columns):
+            return 0
+        if 'fae_balanced' not in columns:
+            raise RuntimeError(f"Brak kolumny fae_balanced. Dostępne kolumny: {list(columns)}")
+        ts, fae = columns['date_timestamp'], columns['fae_balanced']
+        in_month = (ts >= self.start_utc.timestamp()) & (ts <= self.end_utc.timestamp())
+        hours, kwh = self.aggregator.add_batch(ts[in_month], fae[in_month])
+        self.readings += int(in_month.sum())
+        self._close(hours, kwh)
+        return len(hours)
+
+    def finish(self):
+        """Koniec miesiąca - zamyka ostatni otwarty interwał."""
+        self._close(*self.aggregator.flush())
+        self.finished = True
+
+    def _close(self, hours: np.ndarray, kwh: np.ndarray):
+        if not len(hours):
+            return
+        _, unit_prices, _ = tariff_unit_prices(pd.to_datetime(hours, unit='s', utc=True))
+        self.energy += kwh @ unit_prices
+        self.kwh += float(kwh.sum())
+        self.intervals += len(hours)
+        self._price_dynamic(hours, kwh)
+
+    def _tge(self, hours: np.ndarray) -> np.ndarray:
+        return lookup_prices(hours, self._prices)
+
+    def _price_dynamic(self, hours: np.ndarray, kwh: np.ndarray):
+        tge = self._tge(hours)
+        priced = ~np.isnan(tge)
+        self.dynamic_energy += float(kwh[priced] @ dynamic_unit_prices(tge[priced]))
+        self.unpriced_hours = np.concatenate([self.unpriced_hours, hours[~priced]])
+        self.unpriced_kwh = np.concatenate([self.unpriced_kwh, kwh[~priced]])
+
+    def refresh_prices(self, tge_prices: Optional[pd.DataFrame]):
+        """Nowe ceny TGE - wycenia interwały, które czekały na cenę."""
+        self.tge_prices = tge_prices
+        self._prices = price_table(tge_prices)
+        hours, kwh = self.unpriced_hours, self.unpriced_kwh
+        self.unpriced_hours, self.unpriced_kwh = np.empty(0, dtype=np.int64), np.empty(0)
+        self._price_dynamic(hours, kwh)
+
+    def poll(self, api_base: str, token: str, now: datetime = None) -> int:
+        """
+        Pobiera odczyty nowsze niż ostatni przetworzony (do `now`) i dolicza je.
+        Pierwsze odpytanie wczytuje miesiąc przez cache (download_measurement_logs_json).
+        Zwraca liczbę nowych odczytów.
+        """
+        now = now or datetime.now(timezone.utc)
+        before = self.readings
+        if self.aggregator.last_ts is None:
+            columns = download_measurement_logs_json(api_base, token, self.channel_id, self.start_utc, self.end_utc)
+        else:
+            date_from = datetime.fromtimestamp(self.aggregator.last_ts + 1, tz=timezone.utc)
+            columns = fetch_measurement_logs_range(api_base, token, self.channel_id, date_from,
+                                                   min(now, self.end_utc))
+        self.add_readings(columns)
+
+        # Ceny TGE mogły dojść do archiwum (np. po `fetch` lub w kolejnym dniu);
+        # archiwum jest w pamięci, więc wycena od nowa tylko po zmianie plików
+        if len(self.unpriced_hours) or self.tge_prices is None:
+            archive = load_tge_archive()
+            if archive is not self._archive:
+                self._archive = archive
+                prices = archive.slice(self.start_utc, self.end_utc)
+                self.refresh_prices(prices if not prices.empty else None)
+        return self.readings - before
+
+    def snapshot(self, now: datetime = None) -> Dict:
+        """Stan do pliku JSON: koszty jak w compute_costs (+ otwarty interwał) i prognoza na cały miesiąc."""
+        now = now or datetime.now(timezone.utc)
+        additional_per_kwh = sum(ADDITIONAL_CHARGES.values())
+
+        # Otwarty (niezamknięty) interwał wliczany do stanu, ale nie do sum
+        energy, dynamic_energy, kwh = self.energy.copy(), self.dynamic_energy, self.kwh
+        if not self.finished and self.aggregator.open_hour is not None:
+            hours = np.array([self.aggregator.open_hour], dtype=np.int64)
+            open_kwh = np.array([self.aggregator.open_kwh])
+            _, unit_prices, _ = tariff_unit_prices(pd.to_datetime(hours, unit='s', utc=True))
+            energy += open_kwh @ unit_prices
+            tge = self._tge(hours)
+            dynamic_energy += float(np.nan_to_num(open_kwh @ dynamic_unit_prices(tge)))
+            kwh += float(open_kwh.sum())
+
+        last_ts = self.aggregator.last_ts
+        month_seconds = self.end_utc.timestamp() + 1 - self.start_utc.timestamp()
+        elapsed = (last_ts - self.start_utc.timestamp()) / month_seconds if last_ts is not None else 0.0
+        scale = 1.0 / elapsed if not self.finished and elapsed > 0 else 1.0
+
+        def row(name, energy_netto, fixed, oze):
+            suma_netto = energy_netto + fixed + oze
+            return {
+                "taryfa": name,
+                "koszt_energia_netto": round(energy_netto, 6),
+                "oplaty_stale": round(fixed, 6),
+                "oze_kogeneracja": round(oze, 6),
+                "suma_netto": round(suma_netto, 6),
+                "vat_23": round(suma_netto * VAT_RATE, 6),
+                "suma_brutto": round(suma_netto * (1 + VAT_RATE), 6),
+                "prognoza_brutto": round(((energy_netto + oze) * scale + fixed) * (1 + VAT_RATE), 6),
+            }
+
+        fixed = sum(FIXED_CHARGES.values())
+        rows = [row(t, float(e) - kwh * additional_per_kwh, fixed, kwh * additional_per_kwh)
+                for t, e in zip(self.tariffs, energy)]
+        if self.tge_prices is not None and not self.tge_prices.empty:
+            rows.append(row("Dynamiczna (TGE)", dynamic_energy, dynamic_fixed_monthly(), 0.0))
+        rows.sort(key=lambda r: r["suma_brutto"])
+
+        return {
+            "kanal": self.channel_id,
+            "miesiac": f"{self.year}-{self.month:02d}",
+            "aktualizacja": now.isoformat(timespec="seconds"),
+            "ostatni_odczyt": (datetime.fromtimestamp(last_ts, tz=timezone.utc).isoformat()
+                               if last_ts is not None else None),
+            "zakonczony": self.finished,
+            "odczyty": self.readings,
+            "interwaly": self.intervals,
+            "kWh": round(kwh, 6),
+            "bez_ceny_tge": int(len(self.unpriced_hours)),
+            "najtansza": rows[0]["taryfa"] if rows else None,
+            "taryfy": rows,
+        }
+
+
+def watch_state_path(channel_id: int) -> str:
+    return os.path.join(os.path.dirname(__file__), '..', 'output', f"live_{channel_id}.json")
+
+
+def save_watch_state(path: str, state: Dict):
+    """Zapis stanu atomowo (plik tymczasowy) - czytający nigdy nie widzi połowy pliku."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with atomic_write(path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+
+
+def watch(interval: float = None, state_file: str = None, polls: int = None, clock=None) -> Dict:
+    """
+    Podgląd kosztów bieżącego miesiąca na żywo: co `interval` sekund
+    (WATCH_INTERVAL_SECONDS) odpytuje API SUPLA o nowe odczyty kanału
+    CHANNEL_ID i zapisuje stan do `state_file` (WATCH_STATE_FILE, domyślnie
+    output/live_{kanał}.json). Po końcu miesiąca zapisuje stan końcowy
+    i zaczyna kolejny miesiąc.
+
+    Args:
+        polls: Liczba odpytań (None = bez końca)
+        clock: Funkcja zwracająca bieżący czas UTC (np. czas symulowany w testach)
+
+    Returns:
+        Ostatni zapisany stan
+    """
+    interval = WATCH_INTERVAL_SECONDS if interval is None else interval
+    state_file = state_file or WATCH_STATE_FILE or watch_state_path(CHANNEL_ID)
+    clock = clock or (lambda: datetime.now(timezone.utc))
+    api_base = decode_supla_api_base_from_token(SUPLA_TOKEN)
+
+    tracker = None
+    count = 0
+    while True:
+        now = clock()
+        error = None
+        try:
+            if tracker is not None and now > tracker.end_utc:
+                # Domknięcie poprzedniego miesiąca i stan końcowy
+                tracker.poll(api_base, SUPLA_TOKEN, tracker.end_utc)
+                tracker.finish()
+                save_watch_state(state_file, tracker.snapshot(now))
+                tracker = None
+            if tracker is None:
+                tracker = LiveCostTracker(CHANNEL_ID, now.year, now.month)
+            new = tracker.poll(api_base, SUPLA_TOKEN, now)
+        except Exception as e:
+            # Błąd sieci nie przerywa podglądu - stan zostaje, kolejna próba za `interval`
+            error = str(e)
+            new = 0
+            log(f"⚠️  Odpytanie SUPLA nieudane: {e}")
+
+        state = tracker.snapshot(now) if tracker is not None else {}
+        if error is not None:
+            state["blad"] = error
+        save_watch_state(state_file, state)
+        if state.get("taryfy"):
+            cheapest = state["taryfy"][0]
+            log(f"🔄 {now:%Y-%m-%d %H:%M} | nowe odczyty: {new} | {state['kWh']:.2f} kWh | "
+                f"najtańsza {cheapest['taryfa']}: {cheapest['suma_brutto']:.2f} zł "
+                f"(prognoza {cheapest['prognoza_brutto']:.2f} zł)")
+
+        count += 1
+        if polls is not None and count >= polls:
+            return state
+        time.sleep(interval)
+
+
+# ----------------------------
+# SERWIS HTTP (CIEPŁY CACHE W PAMIĘCI)
+# ----------------------------
+class LruCache:
+    """Słownik o ograniczonym rozmiarze - przy przepełnieniu usuwa najdawniej używany wpis."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+class TariffService:
+    """
+    Koszty taryf na żądanie z danymi trzymanymi w pamięci między zapytaniami.
+
+    Trzy poziomy cache (LRU, SERVICE_CACHE_SIZE wpisów każdy):
+    - bilans godzinowy per (token, kanał, miesiąc),
+    - ceny TGE per miesiąc,
+    - gotowe wyniki per (token, kanał, miesiąc) z wersjami danych, z których powstały.
+    Token klienta jest dodatkowo sprawdzany w SUPLA (authorize), bo logi
+    w data/ są wspólne dla wszystkich tokenów kanału.
+
+    Miesiąc zamknięty (po końcu + SUPLA_SYNC_GRACE) nie jest już odświeżany.
+    Bieżący miesiąc odświeżany jest najwyżej co SERVICE_REFRESH_SECONDS:
+    download_measurement_logs_json dociąga tylko nowe odczyty, a bilans
+    i wyniki liczone są ponownie tylko, gdy dane faktycznie się zmieniły.
+    """
+
+    def __init__(self, cache_size: int = None, refresh_seconds: float = None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        size = cache_size or SERVICE_CACHE_SIZE
+        self.refresh_seconds = SERVICE_REFRESH_SECONDS if refresh_seconds is None else refresh_seconds
+        self.hourly = LruCache(size)
+        self.prices = LruCache(size)
+        self.results = LruCache(size)
+        self.access = LruCache(size)
+        # Blokada na klucz istnieje tylko, póki ktoś na niej czeka: [lock, liczba użytkowników]
+        self._locks: Dict[Tuple, list] = {}
+        self._locks_guard = threading.Lock()
+        # Ceny TGE pobierane w tle równolegle z logami SUPLA (jak w compute_month)
+        self._background = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tge")
+
+    @contextmanager
+    def _locked(self, key: Tuple):
+        # Jedno pobieranie na klucz - równoległe zapytania o to samo czekają na wynik
+        with self._locks_guard:
+            slot = self._locks.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            with slot[0]:
+                yield
+        finally:
+            with self._locks_guard:
+                slot[1] -= 1
+                if not slot[1]:
+                    del self._locks[key]
+
+    @staticmethod
+    def token_key(token: str) -> str:
+        """Klucz cache dla tokena (skrót - sam token nie jest trzymany w kluczach)."""
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def _is_fresh(self, entry: Optional[Dict], now: float) -> bool:
+        return entry is not None and (entry["final"] or now - entry["checked_at"] < self.refresh_seconds)
+
+    @staticmethod
+    def token_for(channel_id: int) -> str:
+        """Token kanału z SUPLA_FLEET, w przeciwnym razie SUPLA_TOKEN."""
+        for item in SUPLA_FLEET:
+            if int(item[1]) == int(channel_id):
+                return item[0]
+        return SUPLA_TOKEN
+
+    @staticmethod
+    def trusted_api_bases() -> set:
+        """Serwery SUPLA z konfiguracji (SUPLA_TOKEN, SUPLA_FLEET)."""
+        bases = set()
+        for token in [SUPLA_TOKEN] + [item[0] for item in SUPLA_FLEET]:
+            try:
+                bases.add(decode_supla_api_base_from_token(token))
+            except RuntimeError:
+                pass
+        return bases
+
+    def authorize(self, token: str, channel_id: int):
+        """
+        Token spoza konfiguracji (nagłówek Authorization) musi wskazywać na
+        skonfigurowany serwer SUPLA i mieć tam dostęp do kanału - inaczej
+        PermissionError. Dane z cache (pamięć i data/) nie są przypisane do
+        tokena, więc dostęp sprawdzany jest w SUPLA, a wynik pamiętany
+        najwyżej SERVICE_REFRESH_SECONDS.
+        """
+        key = (self.token_key(token), channel_id)
+        now = time.time()
+        checked_at = self.access.get(key)
+        if checked_at is not None and now - checked_at < self.refresh_seconds:
+            return
+        try:
+            api_base = decode_supla_api_base_from_token(token)
+        except RuntimeError as e:
+            raise PermissionError(str(e))
+        if api_base not in self.trusted_api_bases():
+            raise PermissionError(f"Token wskazuje na nieobsługiwany serwer SUPLA: {api_base}")
+        verify_supla_token(token, channel_id)
+        self.access.put(key, now)
+
+    def get_hourly(self, token: str, channel_id: int, year: int, month: int) -> Dict:
+        key = (self.token_key(token), channel_id, year, month)
+        now = time.time()
+        entry = self.hourly.get(key)
+        if self._is_fresh(entry, now):
+            return entry
+
+        with self._locked(("hourly",) + key):
+            entry = self.hourly.get(key)
+            if self._is_fresh(entry, now):
+                return entry
+            start_utc, end_utc = month_range_utc(year, month)
+            columns = download_measurement_logs_json(decode_supla_api_base_from_token(token), token,
+                                                     channel_id, start_utc, end_utc)
+            version = (_columns_len(columns), int(columns["date_timestamp"][-1]) if _columns_len(columns) else None)
+            if entry is None or entry["version"] != version:
+                hourly = hourly_kwh_from_logs(columns, start_utc, end_utc)
+            else:
+                hourly = entry["hourly"]  # brak nowych odczytów - bilans bez zmian
+            entry = {
+                "hourly": hourly,
+                "version": version,
+                "checked_at": now,
+                "final": now > (end_utc + SUPLA_SYNC_GRACE).timestamp(),
+            }
+            self.hourly.put(key, entry)
+            return entry
+
+    def get_prices(self, year: int, month: int) -> Dict:
+        key = (year, month)
+        now = time.time()
+        entry = self.prices.get(key)
+        if self._is_fresh(entry, now):
+            return entry
+
+        with self._locked(("prices",) + key):
+            entry = self.prices.get(key)
+            if self._is_fresh(entry, now):
+                return entry
+            prices = fetch_tge_prices(year, month, verbose=False)
+            hours = 0 if prices is None else len(prices)
+            _, end_utc = month_range_utc(year, month)
+            entry = {
+                "prices": prices,
+                "version": hours,
+                "checked_at": now,
+                # Komplet notowań za zamknięty miesiąc już się nie zmieni
+                "final": hours > 0 and now > (end_utc + SUPLA_SYNC_GRACE).timestamp(),
+            }
+            self.prices.put(key, entry)
+            return entry
+
+    def costs(self, channel_id: int, year: int, month: int, dynamic: bool = True, token: str = None) -> Dict:
+        """
+        Koszty wszystkich taryf dla kanału i miesiąca (słownik gotowy do JSON).
+        Podany token (klienta) jest najpierw sprawdzany w SUPLA (authorize);
+        bez tokena używany jest token kanału z konfiguracji.
+        """
+        if token:
+            self.authorize(token, channel_id)
+        else:
+            token = self.token_for(channel_id)
+        prices_future = self._background.submit(self.get_prices, year, month) if dynamic else None
+        hourly_entry = self.get_hourly(token, channel_id, year, month)
+        price_entry = prices_future.result() if prices_future is not None else None
+        versions = (hourly_entry["version"], price_entry and price_entry["version"])
+
+        key = (self.token_key(token), channel_id, year, month, dynamic)
+        cached = self.results.get(key)
+        if cached is not None and cached["versions"] == versions:
+            return {**cached["result"], "cache": "hit"}
+
+        hourly = hourly_entry["hourly"]
+        res = compute_costs(hourly, PRICES, METER_SUPPORTS_SUMMER_WINTER)
+        dynamic_result = None
+        if price_entry and price_entry["prices"] is not None:
+            dynamic_result = compute_dynamic_tariff_cost(hourly, price_entry["prices"])
+        save_cube_month(channel_id, year, month, hourly, dynamic_result)
+
+        result = {
+            "channel": channel_id,
+            "miesiac": f"{year}-{month:02d}",
+            "godziny": int(len(hourly)),
+            "kWh": float(hourly["kwh"].sum()),
+            "najtansza": res.iloc[0]["taryfa"],
+            "taryfy": json.loads(res.to_json(orient="records", force_ascii=False)),
+            "dynamiczna": None if not dynamic_result else
+                {k: v for k, v in dynamic_result.items() if k != "hourly_data"},
+        }
+        self.results.put(key, {"versions": versions, "result": result})
+        return {**result, "cache": "miss" if cached is None else "refresh"}
+
+    def stats(self) -> Dict:
+        return {"hourly": self.hourly.stats(), "prices": self.prices.stats(), "results": self.results.stats(),
+                "access": self.access.stats(), "locks": len(self._locks)}
+
+
+def make_service_handler(service: TariffService):
+    """Handler http.server dla serwisu: /costs, /stats, /health."""
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import parse_qs
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            log(f"🌐 {self.address_string()} {fmt % args}")
+
+        def _send(self, status: int, payload: Dict):
+            body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                if url.path == "/health":
+                    return self._send(200, {"status": "ok"})
+                if url.path == "/stats":
+                    return self._send(200, service.stats())
+                if url.path == "/costs":
+                    year, month = (int(x) for x in query.get("month", f"{YEAR}-{MONTH:02d}").split("-"))
+                    channel_id = int(query.get("channel", CHANNEL_ID))
+                    dynamic = query.get("dynamic", "1") not in ("0", "false", "no")
+                    auth = self.headers.get("Authorization", "")
+                    token = auth[7:].strip() if auth.startswith("Bearer ") else None
+                    t0 = time.perf_counter()
+                    with stage("service_costs", channel=channel_id) as span:
+                        result = service.costs(channel_id, year, month, dynamic=dynamic, token=token)
+                        span["cache"] = result["cache"]
+                    result["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+                    return self._send(200, result)
+                return self._send(404, {"error": f"nieznana ścieżka: {url.path}"})
+            except ValueError as e:
+                return self._send(400, {"error": str(e)})
+            except PermissionError as e:
+                return self._send(403, {"error": str(e)})
+            except Exception as e:
+                return self._send(502, {"error": f"{type(e).__name__}: {e}"})
+
+    return Handler
+
+
+def serve(host: str = None, port: int = None, service: TariffService = None):
+    """Uruchamia serwis HTTP (wielowątkowy) aż do przerwania Ctrl+C."""
+    from http.server import ThreadingHTTPServer
+
+    service = service or TariffService()
+    server = ThreadingHTTPServer((host or SERVICE_HOST, SERVICE_PORT if port is None else port),
+                                 make_service_handler(service))
+    print(f"🌐 Serwis kosztów taryf: http://{server.server_address[0]}:{server.server_address[1]}/costs?channel={CHANNEL_ID}&month={YEAR}-{MONTH:02d}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# ----------------------------
+# WIERSZ POLECEŃ
+# ----------------------------
+def _month_arg(value: str) -> Tuple[int, int]:
+    try:
+        year, month = (int(x) for x in value.split("-"))
+        datetime(year, month, 1)
+    except ValueError:
+        import argparse
+        raise argparse.ArgumentTypeError(f"oczekiwano miesiąca RRRR-MM, podano: {value}")
+    return year, month
+
+
+def _months_from_args(args) -> List[Tuple[int, int]]:
+    """Miesiące z argumentów [START [KONIEC]]; bez argumentów YEAR/MONTH z konfiguracji."""
+    if not args.months:
+        return [(YEAR, MONTH)]
+    if len(args.months) > 2:
+        raise SystemExit("Podaj miesiąc lub zakres: START [KONIEC]")
+    start = args.months[0]
+    end = args.months[-1]
+    return months_in_range(f"{start[0]}-{start[1]:02d}", f"{end[0]}-{end[1]:02d}")
+
+
+def cmd_fetch(args):
+    """
+    Pobiera do cache logi SUPLA i/lub ceny TGE (bez obliczeń). Miesiące
+    SUPLA pobierane są współbieżnie; nieudany miesiąc nie przerywa pozostałych.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    api_base = decode_supla_api_base_from_token(SUPLA_TOKEN)
+    months = _months_from_args(args)
+    failed = []
+    if args.only in (None, "supla"):
+        def pull(year_month):
+            start_utc, end_utc = month_range_utc(*year_month)
+            try:
+                return _columns_len(download_measurement_logs_json(api_base, SUPLA_TOKEN, CHANNEL_ID,
+                                                                   start_utc, end_utc)), None
+            except Exception as e:
+                return 0, e
+
+        with ThreadPoolExecutor(max_workers=min(len(months), max(1, SUPLA_MAX_CONCURRENT_DOWNLOADS))) as executor:
+            for (year, month), (count, error) in zip(months, executor.map(pull, months)):
+                if error is None:
+                    print(f"📥 SUPLA {year}-{month:02d}: {count} odczytów")
+                else:
+                    print(f"⚠️  SUPLA {year}-{month:02d}: {error}")
+                    failed.append(f"{year}-{month:02d}")
+    if args.only in (None, "tge"):
+        for year, month in months:
+            prices = fetch_tge_prices(year, month, verbose=False)
+            print(f"📥 TGE   {year}-{month:02d}: {0 if prices is None else len(prices)} godzin")
+    if failed:
+        raise RuntimeError(f"Nie pobrano logów SUPLA dla: {', '.join(failed)} - uruchom ponownie, "
+                           "pobieranie będzie kontynuowane od miejsca przerwania")
+
+
+def cmd_compute(args):
+    """Tabela kosztów taryf (tekst lub JSON) - bez raportu i wykresów."""
+    months = _months_from_args(args)
+    start, end = (f"{y}-{m:02d}" for y, m in (months[0], months[-1]))
+    if len(months) > 1 and not args.json:
+        return main_range(start, end, dynamic=not args.no_dynamic, workers=args.workers)
+
+    if len(months) == 1:
+        # Jeden miesiąc liczony w tym procesie - bez uruchamiania puli procesów
+        table = analyze_month(*months[0], dynamic=not args.no_dynamic)
+        table["roznica_do_najtanszej_zl"] = table["suma_brutto"] - table["suma_brutto"].min()
+        table = table.sort_values("suma_brutto").reset_index(drop=True)
+    else:
+        table = analyze_range(start, end, workers=args.workers, dynamic=not args.no_dynamic)
+
+    if args.json:
+        print(table.to_json(orient="records", force_ascii=False, double_precision=6))
+    else:
+        print(f"\n{'='*60}")
+        print(f"  ANALIZA TARYF ENERGII ELEKTRYCZNEJ - {start}")
+        print(f"{'='*60}\n")
+        print(table[["miesiac", "taryfa", "suma_brutto", "kWh", "roznica_do_najtanszej_zl"]]
+              .to_string(index=False))
+        print(f"\n{'='*60}\n")
+    return table
+
+
+def cmd_report(args):
+    """Pełny raport tekstowy dla każdego miesiąca (bez wykresów)."""
+    for year, month in _months_from_args(args):
+        print_report(year, month, *compute_month(year, month, dynamic=not args.no_dynamic))
+
+
+def cmd_chart(args):
+    """Wykresy dla każdego miesiąca (domyślnie bez okna - CHART_SHOW)."""
+    for year, month in _months_from_args(args):
+        hourly, res, dynamic_result = compute_month(year, month, dynamic=not args.no_dynamic)
+        create_visualizations(hourly, res, year, month, dynamic_result,
+                              formats=args.format, dpi=args.dpi, show=args.show)
+
+
+def _cube_filter(value: str) -> Tuple[str, list]:
+    """WYMIAR=W1,W2 lub WYMIAR=OD-DO (zakres liczb włącznie), np. hour=17-21, zone:G12w=night."""
+    import argparse
+
+    name, sep, values = value.partition("=")
+    if not sep or not values:
+        raise argparse.ArgumentTypeError(f"oczekiwano WYMIAR=WARTOŚCI, podano: {value}")
+    parsed = []
+    for item in values.split(","):
+        low, dash, high = item.partition("-")
+        if dash and low.isdigit() and high.isdigit():
+            parsed.extend(range(int(low), int(high) + 1))
+        else:
+            parsed.append(int(item) if item.isdigit() else item)
+    return name, parsed
+
+
+def cmd_cube(args):
+    """Zapytanie do kostki zużycia i kosztów (bez pobierania i przeliczania logów)."""
+    cube = load_consumption_cube()
+    if not len(cube):
+        raise RuntimeError("Kostka jest pusta - najpierw policz miesiące (compute/report)")
+    table = cube.rollup(args.by, dict(args.where))
+    if args.json:
+        print(table.to_json(orient="records", force_ascii=False, double_precision=6, date_format="iso"))
+    else:
+        print(table.to_string(index=False))
+    return table
+
+
+def build_arg_parser():
+    import argparse
+
+    # Opcje wspólne działają przed i po poleceniu; SUPPRESS - podpolecenie nie nadpisuje
+    # wartości podanej przed nim (brak opcji = brak atrybutu w wyniku)
+    common = argparse.ArgumentParser(add_help=False, argument_default=argparse.SUPPRESS)
+    common.add_argument("--config", help="plik konfiguracji nadpisujący supla_config.py (bez niego: wartości z supla_config.example.py)")
+    common.add_argument("--token", help="token SUPLA (SUPLA_TOKEN)")
+    common.add_argument("--channel", type=int, help="ID kanału licznika (CHANNEL_ID)")
+    common.add_argument("--quiet", "-q", action="store_true", help="bez komunikatów postępu")
+    common.add_argument("--metrics-file", help="plik metryk etapów (*.jsonl lub *.prom)")
+
+    months = argparse.ArgumentParser(add_help=False)
+    months.add_argument("months", nargs="*", type=_month_arg, metavar="RRRR-MM",
+                        help="miesiąc lub zakres START KONIEC (domyślnie YEAR-MONTH z konfiguracji)")
+    months.add_argument("--no-dynamic", action="store_true", help="pomiń taryfę dynamiczną (bez cen TGE)")
+
+    parser = argparse.ArgumentParser(prog="supla_pge.py", parents=[common],
+                                     description="Porównanie taryf PGE na podstawie danych z SUPLA")
+    sub = parser.add_subparsers(dest="command", metavar="POLECENIE")
+
+    p = sub.add_parser("fetch", parents=[common, months], help="pobierz dane do cache")
+    p.add_argument("--only", choices=["supla", "tge"], help="tylko logi SUPLA lub tylko ceny TGE")
+    p.set_defaults(func=cmd_fetch)
+
+    p = sub.add_parser("compute", parents=[common, months], help="tabela kosztów taryf")
+    p.add_argument("--json", action="store_true", help="wynik jako JSON (lista rekordów, bez komunikatów postępu)")
+    p.add_argument("--workers", type=int, help="liczba procesów dla zakresu miesięcy")
+    p.set_defaults(func=cmd_compute)
+
+    p = sub.add_parser("report", parents=[common, months], help="raport tekstowy")
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser("chart", parents=[common, months], help="wykresy do katalogu output/")
+    p.add_argument("--format", nargs="+", help="formaty plików (domyślnie CHART_FORMATS)")
+    p.add_argument("--dpi", type=int, help="rozdzielczość (domyślnie CHART_DPI)")
+    p.add_argument("--show", action=argparse.BooleanOptionalAction, default=None,
+                   help="wyświetl okno wykresu (domyślnie CHART_SHOW)")
+    p.set_defaults(func=cmd_chart)
+
+    p = sub.add_parser("serve", parents=[common], help="serwis HTTP z kosztami taryf (cache w pamięci)")
+    p.add_argument("--host", help="adres nasłuchu (domyślnie SERVICE_HOST)")
+    p.add_argument("--port", type=int, help="port (domyślnie SERVICE_PORT)")
+    p.set_defaults(func=lambda args: serve(args.host, args.port))
+
+    p = sub.add_parser("cube", parents=[common], help="zapytanie do kostki zużycia i kosztów")
+    p.add_argument("--by", nargs="*", default=["month"], metavar="WYMIAR",
+                   help=f"grupowanie: {', '.join(CUBE_DIMENSIONS)}, zone:<taryfa>")
+    p.add_argument("--where", nargs="+", type=_cube_filter, default=[], metavar="WYMIAR=WARTOŚCI",
+                   help="filtry, np. day_type=2,3 month=12,1,2 hour=17-21")
+    p.add_argument("--json", action="store_true", help="wynik jako JSON (lista rekordów, bez komunikatów postępu)")
+    p.set_defaults(func=cmd_cube)
+
+    p = sub.add_parser("watch", parents=[common], help="koszty bieżącego miesiąca na żywo (plik JSON)")
+    p.add_argument("--interval", type=float, help="odstęp odpytań [s] (domyślnie WATCH_INTERVAL_SECONDS)")
+    p.add_argument("--state-file", help="plik stanu JSON (domyślnie output/live_KANAŁ.json)")
+    p.add_argument("--once", action="store_true", help="jedno odpytanie i koniec (np. z crona)")
+    p.set_defaults(func=lambda args: watch(args.interval, args.state_file, polls=1 if args.once else None))
+
+    p = sub.add_parser("fleet", parents=[common], help="taryfy dla wszystkich kanałów SUPLA_FLEET")
+    p.set_defaults(func=lambda args: main_fleet())
+
+    p = sub.add_parser("shift", parents=[common], help="przesuwanie odbiorów FLEXIBLE_LOADS")
+    p.add_argument("start", help="RRRR-MM")
+    p.add_argument("end", help="RRRR-MM")
+    p.set_defaults(func=lambda args: main_shift(args.start, args.end))
+    return parser
+
+
+def cli(argv: List[str] = None):
+    """
+    python supla_pge.py                        -> miesiąc YEAR/MONTH: raport + wykresy
+    python supla_pge.py compute 2025-11 --json -> tabela kosztów jako JSON
+    python supla_pge.py 2025-01 2025-12        -> jak compute 2025-01 2025-12
+    """
+    import re
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and re.fullmatch(r"\d{4}-\d{2}", argv[0]):
+        argv = ["compute"] + argv
+
+    args = build_arg_parser().parse_args(argv)
+    options = vars(args)
+
+    overrides = load_config_file(options["config"]) if "config" in options else {}
+    if "token" in options:
+        overrides["SUPLA_TOKEN"] = options["token"]
+    if "channel" in options:
+        overrides["CHANNEL_ID"] = options["channel"]
+    if options.get("quiet") or options.get("json"):
+        # JSON na stdout bez przeplatanych komunikatów postępu (do potoków)
+        overrides["VERBOSE"] = False
+    if "metrics_file" in options:
+        overrides["METRICS_FILE"] = options["metrics_file"]
+    configure(overrides)
+
+    if args.command is None:
+        return main()
+    return args.func(args)
+
+
 if __name__ == "__main__":
-    main()
+    cli()
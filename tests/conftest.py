@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+sys.path.insert(0, os.path.abspath(SRC_DIR))
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import supla_pge  # noqa: E402
+
+
+def config_snapshot() -> dict:
+    """Wszystkie opcje konfiguracji modułu (nazwy WIELKIMI literami)."""
+    return {name: value for name, value in vars(supla_pge).items()
+            if name.isupper() and not name.startswith("_")}
+
+
+@pytest.fixture(autouse=True)
+def quiet_config():
+    """Bez komunikatów, metryk i zapisu kostki; cała konfiguracja przywracana po teście."""
+    saved = config_snapshot()
+    saved_overrides = dict(supla_pge._CONFIG_OVERRIDES)
+    supla_pge.configure({"VERBOSE": False, "METRICS_FILE": None, "CONSUMPTION_CUBE": False,
+                         "SUPLA_RETRY_BACKOFF": 0.0})
+    yield
+    for name in set(config_snapshot()) - set(saved):
+        delattr(supla_pge, name)
+    vars(supla_pge).update(saved)
+    supla_pge._CONFIG_OVERRIDES.clear()
+    supla_pge._CONFIG_OVERRIDES.update(saved_overrides)
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """Katalog danych testu (ceny TGE, cache logów SUPLA, kostka) zamiast data/ repozytorium."""
+    path = tmp_path / "data"
+    path.mkdir()
+    monkeypatch.setattr(supla_pge, "_data_dir", lambda: str(path))
+    return path
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""batch_tariff_costs daje te same kwoty co compute_costs / compute_dynamic_tariff_cost."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import supla_pge
+
+
+def month_hours(year: int, month: int) -> pd.DatetimeIndex:
+    start, end = supla_pge.month_range_utc(year, month)
+    return pd.date_range(pd.Timestamp(start), pd.Timestamp(end), freq="h")
+
+
+def household(hours: pd.DatetimeIndex, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"hour_utc": hours, "kwh": rng.gamma(2.0, 0.2, len(hours))})
+
+
+@pytest.mark.parametrize("year, month", [(2025, 10), (2025, 3)])
+def test_batch_matches_single_household_costs(year, month):
+    # Miesiące ze zmianą czasu (26.10 - 25 h, 30.03 - 23 h doby lokalnej)
+    hours = month_hours(year, month)
+    rng = np.random.default_rng(month)
+    tge = pd.DataFrame({"timestamp_utc": hours, "price_per_kwh_netto": rng.uniform(-0.1, 0.9, len(hours))})
+    # Brakujące godziny TGE, w tym wokół zmiany czasu
+    local = hours.tz_convert("Europe/Warsaw")
+    missing = (local.day == local[len(local) // 2].day) | (rng.random(len(hours)) < 0.05)
+    missing |= (local.month == month) & (local.day == (26 if month == 10 else 30)) & (local.hour < 4)
+    tge = tge[~missing].reset_index(drop=True)
+
+    frames = {
+        "pelny": household(hours, 1),
+        # Gospodarstwo z lukami w odczytach - w macierzy zera
+        "luki": household(hours[rng.random(len(hours)) > 0.2], 2),
+    }
+    hour_utc, kwh = supla_pge.stack_hourly(frames)
+    batch = supla_pge.batch_tariff_costs(kwh, hour_utc, tge, households=list(frames),
+                                         prices=supla_pge.PRICES,
+                                         supports_summer_winter=supla_pge.METER_SUPPORTS_SUMMER_WINTER)
+
+    for name, hourly in frames.items():
+        single = supla_pge.compute_costs(hourly, supla_pge.PRICES, supla_pge.METER_SUPPORTS_SUMMER_WINTER)
+        for row in single.itertuples():
+            assert batch.loc[name, row.taryfa] == pytest.approx(row.suma_brutto, rel=1e-12)
+        dynamic = supla_pge.compute_dynamic_tariff_cost(hourly, tge)
+        assert batch.loc[name, "Dynamiczna"] == pytest.approx(dynamic["suma_brutto"], rel=1e-12)
+        assert batch.loc[name, "kWh"] == pytest.approx(hourly["kwh"].sum())
+        costs = {row.taryfa: row.suma_brutto for row in single.itertuples()}
+        costs["Dynamiczna"] = dynamic["suma_brutto"]
+        assert batch.loc[name, "najtansza"] == min(costs, key=costs.get)
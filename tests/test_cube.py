@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Kostka zużycia: równoległe zapisy partycji i aktualizacje nie gubią miesięcy."""
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import supla_pge
+
+
+@pytest.fixture(autouse=True)
+def cube_enabled():
+    supla_pge.configure({"CONSUMPTION_CUBE": True})
+
+
+def month_hourly(year: int, month: int, kwh: float) -> pd.DataFrame:
+    start, end = supla_pge.month_range_utc(year, month)
+    hours = pd.date_range(pd.Timestamp(start), pd.Timestamp(end), freq="h")
+    return pd.DataFrame({"hour_utc": hours, "kwh": np.full(len(hours), kwh)})
+
+
+def test_concurrent_months_all_reach_the_cube():
+    errors = []
+
+    def analyze(channel_id, month):
+        try:
+            supla_pge.save_cube_month(channel_id, 2025, month, month_hourly(2025, month, channel_id / 10))
+            supla_pge.load_consumption_cube()
+        except Exception as e:  # pragma: no cover - zgłaszane niżej
+            errors.append(e)
+
+    threads = [threading.Thread(target=analyze, args=(channel_id, month))
+               for channel_id in (1, 2) for month in range(1, 13)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    # Zapisana kostka (bez kolejnej aktualizacji) ma już wszystkie partycje
+    cube = supla_pge._read_consumption_cube(supla_pge.consumption_cube_path())
+    assert len(cube.sources) == 24
+    hours_2025 = 365 * 24
+    for channel_id in (1, 2):
+        mine = cube.meters == channel_id
+        assert mine.sum() == hours_2025
+        assert cube.kwh[mine].sum() == pytest.approx(hours_2025 * channel_id / 10)
+
+
+def test_recomputed_month_replaces_its_cells():
+    supla_pge.save_cube_month(1, 2025, 11, month_hourly(2025, 11, 0.5))
+    assert supla_pge.load_consumption_cube().kwh.sum() == pytest.approx(720 * 0.5)
+    supla_pge.save_cube_month(1, 2025, 11, month_hourly(2025, 11, 0.25))
+    path = supla_pge.cube_partition_path(1, 2025, 11)
+    os.utime(path, (1, 1))
+    assert supla_pge.load_consumption_cube().kwh.sum() == pytest.approx(720 * 0.25)
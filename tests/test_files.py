@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""Zapis atomowy: uprawnienia jak przy zwykłym open()."""
+import os
+import stat
+
+import supla_pge
+
+
+def mode_of(path) -> int:
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_new_file_gets_default_permissions(tmp_path):
+    target = tmp_path / "nowy.json"
+    with supla_pge.atomic_write(str(target)) as f:
+        f.write("{}")
+    plain = tmp_path / "zwykly.json"
+    plain.write_text("{}")
+    assert mode_of(target) == mode_of(plain) == 0o666 & ~supla_pge._UMASK
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_existing_file_keeps_its_permissions(tmp_path):
+    target = tmp_path / "ceny.csv"
+    target.write_text("stare")
+    os.chmod(target, 0o640)
+    with supla_pge.atomic_write(str(target)) as f:
+        f.write("nowe")
+    assert target.read_text() == "nowe"
+    assert mode_of(target) == 0o640
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Bilans paczkami (HourlyEnergyAggregator) kontra normalize_logs_to_hourly_kwh (cały DataFrame)."""
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import supla_pge
+
+
+def synthetic_logs(seed: int, n: int = 5000) -> dict:
+    """Nieregularne odczyty licznika: luki, powtórzenia, brak zużycia, resety i braki wartości."""
+    rng = np.random.default_rng(seed)
+    steps = rng.choice([0, 60, 300, 600, 601, 3600, 4 * 3600], size=n,
+                       p=[0.02, 0.2, 0.3, 0.35, 0.08, 0.04, 0.01])
+    ts = 1_761_000_000 + np.cumsum(steps)
+    increments = rng.gamma(1.5, 3000.0, n) * (rng.random(n) > 0.1)  # setne Wh
+    fae = 10_000_000 + np.cumsum(increments)
+    for reset in rng.choice(n, size=4, replace=False):
+        fae[reset:] -= fae[reset] - rng.uniform(0, 5000)  # reset licznika
+    fae[rng.choice(n, size=10, replace=False)] = np.nan
+    return {"date_timestamp": ts.astype(np.int64), "fae_balanced": fae}
+
+
+def assert_same_hourly(actual: pd.DataFrame, expected: pd.DataFrame):
+    assert list(actual["hour_utc"]) == list(expected["hour_utc"])
+    np.testing.assert_allclose(actual["kwh"].to_numpy(), expected["kwh"].to_numpy(), rtol=1e-9)
+
+
+@pytest.mark.parametrize("interval_minutes", [60, 15])
+@pytest.mark.parametrize("chunk_size", [1, 7, 599, 4999, None])
+def test_chunked_matches_dataframe(interval_minutes, chunk_size, monkeypatch):
+    if chunk_size:
+        monkeypatch.setattr(supla_pge, "HOURLY_CHUNK_SIZE", chunk_size)
+    columns = synthetic_logs(interval_minutes + (chunk_size or 0))
+    expected = supla_pge.normalize_logs_to_hourly_kwh(pd.DataFrame(columns), interval_minutes=interval_minutes)
+    actual = supla_pge.hourly_kwh_from_logs(columns, interval_minutes=interval_minutes)
+    assert len(expected) > 100
+    assert_same_hourly(actual, expected)
+
+
+@pytest.mark.parametrize("interval_minutes", [60, 15])
+def test_chunked_matches_dataframe_within_range(interval_minutes, monkeypatch):
+    monkeypatch.setattr(supla_pge, "HOURLY_CHUNK_SIZE", 333)
+    columns = synthetic_logs(3)
+    ts = columns["date_timestamp"]
+    start = datetime.fromtimestamp(int(ts[len(ts) // 4]) + 1, tz=timezone.utc)
+    end = datetime.fromtimestamp(int(ts[3 * len(ts) // 4]) - 1, tz=timezone.utc)
+    expected = supla_pge.normalize_logs_to_hourly_kwh(pd.DataFrame(columns), start, end, interval_minutes)
+    actual = supla_pge.hourly_kwh_from_logs(columns, start, end, interval_minutes)
+    assert_same_hourly(actual, expected)
+
+
+@pytest.mark.parametrize("interval", [3600, 900])
+def test_single_readings_match_batches(interval):
+    columns = synthetic_logs(7, n=2000)
+    aggregator = supla_pge.HourlyEnergyAggregator(interval)
+    closed = []
+    for t, f in zip(columns["date_timestamp"], columns["fae_balanced"]):
+        closed.extend(aggregator.add(int(t), f))
+    hours, kwh = aggregator.flush()
+    closed.extend(zip(hours.tolist(), kwh.tolist()))
+
+    expected = supla_pge.normalize_logs_to_hourly_kwh(pd.DataFrame(columns), interval_minutes=interval // 60)
+    actual = supla_pge.hourly_frame(np.array([h for h, _ in closed]), np.array([k for _, k in closed]))
+    assert_same_hourly(actual, expected)
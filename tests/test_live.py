@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Podgląd na żywo (LiveCostTracker) na lokalnym zastępcy API SUPLA."""
+import os
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import supla_api_standin
+import supla_pge
+
+CHANNEL = 990025
+
+
+def write_prices(data_dir, days: int):
+    """Ceny za pierwsze `days` dni listopada 2025 (reszta jeszcze nieopublikowana)."""
+    hours = pd.date_range("2025-11-01 00:00", periods=24 * days, freq="h")
+    price = 0.4 + 0.2 * np.sin(np.arange(len(hours)) / 5)
+    pd.DataFrame({"timestamp": hours, "price_kwh": price}).to_csv(
+        data_dir / "tge_prices_2025_11.csv", index=False)
+
+
+def test_live_month_matches_full_month_costs(data_dir, monkeypatch):
+    now = [0.0]
+    server = supla_api_standin.start({"live": {CHANNEL}}, clock=lambda: now[0])
+    api, token = supla_api_standin.url(server), supla_api_standin.token(server, "live")
+    archive_reads = []
+    read_tge_archive = supla_pge.read_tge_archive
+    monkeypatch.setattr(supla_pge, "read_tge_archive",
+                        lambda: archive_reads.append(1) or read_tge_archive())
+    try:
+        write_prices(data_dir, 20)
+        tracker = supla_pge.LiveCostTracker(CHANNEL, 2025, 11)
+        start, end = supla_pge.month_range_utc(2025, 11)
+        step = timedelta(hours=6)
+        polls = 0
+        t = start + step
+        while t <= end + step:
+            now[0] = t.timestamp()
+            new = tracker.poll(api, token, t)
+            if polls:
+                assert new <= step.total_seconds() // supla_api_standin.STEP_SECONDS + 1
+            polls += 1
+            if t == start + timedelta(days=25):
+                snapshot = tracker.snapshot(t)
+                assert snapshot["bez_ceny_tge"] > 0
+                write_prices(data_dir, 30)  # ceny reszty miesiąca pojawiają się w archiwum
+                os.utime(data_dir / "tge_prices_2025_11.csv", (2, 2))
+            t += step
+        tracker.finish()
+
+        # Archiwum czytane z dysku tylko po zmianie plików, nie przy każdym odpytaniu
+        assert polls == 120
+        assert len(archive_reads) <= 4
+
+        now[0] = end.timestamp() + 3600
+        columns = supla_pge.merge_log_columns(list(
+            supla_pge.fetch_measurement_log_pages(api, token, CHANNEL, start, end)))
+    finally:
+        server.shutdown()
+
+    hourly = supla_pge.hourly_kwh_from_logs(columns, start, end)
+    expected = supla_pge.compute_costs(hourly, supla_pge.PRICES, supla_pge.METER_SUPPORTS_SUMMER_WINTER)
+    expected = dict(zip(expected["taryfa"], expected["suma_brutto"]))
+    dynamic = supla_pge.compute_dynamic_tariff_cost(hourly, supla_pge.load_tge_prices_range(start, end))
+    expected["Dynamiczna (TGE)"] = dynamic["suma_brutto"]
+
+    state = tracker.snapshot(end)
+    assert state["zakonczony"] and state["bez_ceny_tge"] == 0
+    assert state["interwaly"] == len(hourly)
+    assert state["kWh"] == pytest.approx(hourly["kwh"].sum(), abs=1e-6)
+    assert {r["taryfa"]: r["suma_brutto"] for r in state["taryfy"]} == pytest.approx(expected, abs=1e-6)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Metryki etapów w formacie Prometheus przy analizie zakresu miesięcy (pula procesów)."""
+import os
+import re
+
+import pytest
+
+import supla_api_standin
+import supla_pge
+
+CHANNEL = 990014
+
+
+@pytest.fixture
+def supla():
+    server = supla_api_standin.start({"metrics": {CHANNEL}})
+    supla_pge.configure({"SUPLA_TOKEN": supla_api_standin.token(server, "metrics"), "CHANNEL_ID": CHANNEL})
+    yield server
+    server.shutdown()
+
+
+def read_prom(path) -> dict:
+    values = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            match = re.match(r'(\w+)\{stage="(\w+)"(?:,cache="(\w*)")?\} (\S+)', line)
+            if match:
+                metric, stage, cache, value = match.groups()
+                values[(metric, stage, cache or "")] = float(value)
+    return values
+
+
+def test_range_totals_include_every_worker(supla, tmp_path, data_dir):
+    prom = tmp_path / "supla_pge.prom"
+    supla_pge.configure({"METRICS_FILE": str(prom)})
+    supla_pge.take_stage_totals()
+
+    supla_pge.analyze_range("2025-09", "2025-12", workers=2, dynamic=False)
+
+    values = read_prom(prom)
+    assert values[("supla_pge_stage_runs_total", "analyze_month", "")] == 4
+    downloads = sum(v for (metric, stage, _), v in values.items()
+                    if metric == "supla_pge_stage_runs_total" and stage == "supla_download")
+    assert downloads == 4
+    assert not [name for name in os.listdir(tmp_path) if name not in (prom.name, data_dir.name)]
+    # Procesy robocze zapisują cache logów w katalogu danych testu
+    assert len(list(data_dir.glob(f"supla_logs_{CHANNEL}_*.npz"))) == 4
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Pobieranie notowań TGE przez HTTP (PgeTgeHttpClient) na lokalnym zastępcy strony PGE."""
+import glob
+import os
+import threading
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+import pge_tge_standin
+import supla_pge
+
+RECORDINGS = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "..", "data",
+                                           "pge_tge_recorded", "*.html")))
+
+
+class StaleDayHandler(pge_tge_standin.Handler):
+    """Strona ignorująca wysłaną datę - zawsze notowania z tego samego dnia."""
+    page_loads = 0
+
+    def do_GET(self):
+        type(self).page_loads += 1
+        super().do_GET()
+
+    def _respond(self, fields: dict):
+        fields[pge_tge_standin.DATE_FIELD] = ["2025-12-01"]
+        super()._respond(fields)
+
+
+@pytest.fixture(autouse=True)
+def synthetic_only(tmp_path, monkeypatch):
+    # Zastępca odtwarza nagrania z data/pge_tge_recorded - testy porównują z cenami syntetycznymi
+    monkeypatch.setattr(pge_tge_standin, "RECORDINGS_DIR", str(tmp_path / "pge_tge_recorded"))
+
+
+@pytest.fixture
+def standin():
+    server = pge_tge_standin.start()
+    yield pge_tge_standin.url(server)
+    server.shutdown()
+
+
+@pytest.fixture
+def stale_standin():
+    handler = type("Handler", (StaleDayHandler,), {"page_loads": 0})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield pge_tge_standin.url(server), handler
+    server.shutdown()
+
+
+def test_http_client_fetches_requested_days(standin):
+    with supla_pge.PgeTgeHttpClient(url=standin) as client:
+        for date_str in ("2025-03-30", "2025-12-02"):
+            df = client.fetch_day(date_str)
+            assert df is not None
+            assert (df["timestamp_local"].dt.strftime("%Y-%m-%d") == date_str).all()
+            np.testing.assert_allclose(df["price_per_kwh_netto"].to_numpy(),
+                                       pge_tge_standin.synthetic_prices(date_str) / 1000, atol=1e-5)
+
+
+def test_response_for_other_day_is_rejected(stale_standin):
+    url, handler = stale_standin
+    with supla_pge.PgeTgeHttpClient(url=url) as client:
+        assert client.fetch_day("2025-12-01") is not None
+        # Notowania innego dnia nie mogą zostać zapisane jako żądany dzień
+        assert client.fetch_day("2025-12-02") is None
+        assert client.fetch_day("2025-12-03") is None
+    assert handler.page_loads == 1  # formularz pobrany raz na sesję
+
+
+def test_parse_rejects_only_other_quotes_date():
+    fragment = pge_tge_standin.quotes_fragment("2025-12-02")
+    assert supla_pge.parse_pge_tge_page(fragment, "2025-12-02") is not None
+    assert supla_pge.parse_pge_tge_page(fragment, "2025-12-03") is None
+    # Bez nagłówka z datą notowania przypisywane są żądanemu dniowi
+    df = supla_pge.parse_pge_tge_page(fragment.replace("z dnia 2025-12-02", ""), "2025-12-03")
+    assert df is not None
+    assert (df["timestamp_local"].dt.strftime("%Y-%m-%d") == "2025-12-03").all()
+    assert supla_pge.pge_quotes_date("Notowania TGE z dnia 2.12.2025") == "2025-12-02"
+
+
+@pytest.mark.parametrize("path", RECORDINGS or [pytest.param(None, marks=pytest.mark.skip(
+    reason="brak nagrań w data/pge_tge_recorded"))])
+def test_parse_recorded_pge_page(path):
+    # Nagranie prawdziwej odpowiedzi PGE: <YYYY-MM-DD>.html
+    date_str = os.path.splitext(os.path.basename(path))[0]
+    with open(path, encoding="utf-8") as f:
+        df = supla_pge.parse_pge_tge_page(f.read(), date_str)
+    assert df is not None
+    assert len(df) in (23, 24, 25, 92, 96, 100)
+    assert (df["timestamp_local"].dt.strftime("%Y-%m-%d") == date_str).all()
+    assert df["price_per_kwh_netto"].between(-1, 5).all()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Serwis HTTP (TariffService) na lokalnym zastępcy API SUPLA."""
+import json
+import threading
+from http.server import ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+import supla_api_standin
+import supla_pge
+
+CHANNEL = 990017
+OTHER_CHANNEL = 990018
+
+
+@pytest.fixture
+def supla():
+    server = supla_api_standin.start({"owner": {CHANNEL}, "other": {OTHER_CHANNEL}})
+    supla_pge.configure({"SUPLA_TOKEN": supla_api_standin.token(server, "owner"),
+                         "CHANNEL_ID": CHANNEL, "SUPLA_FLEET": []})
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def http_service(supla):
+    service = supla_pge.TariffService(cache_size=8, refresh_seconds=3600)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), supla_pge.make_service_handler(service))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield service, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def get_costs(base: str, token: str = None):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    request = Request(f"{base}/costs?channel={CHANNEL}&month=2025-11&dynamic=0", headers=headers)
+    try:
+        with urlopen(request) as response:
+            return response.status, json.load(response)
+    except HTTPError as e:
+        return e.code, json.load(e)
+
+
+def test_costs_served_from_warm_cache(supla):
+    service = supla_pge.TariffService(cache_size=8, refresh_seconds=3600)
+    first = service.costs(CHANNEL, 2025, 11, dynamic=False)
+    requests_after_first = len(supla.requests)
+    second = service.costs(CHANNEL, 2025, 11, dynamic=False)
+
+    assert first["cache"] == "miss" and second["cache"] == "hit"
+    assert len(supla.requests) == requests_after_first
+    assert second["taryfy"] == first["taryfy"]
+    assert first["godziny"] == 30 * 24
+    # Zużycie = przyrost licznika zastępcy między pierwszym a ostatnim odczytem miesiąca
+    start, end = (int(t.timestamp()) for t in supla_pge.month_range_utc(2025, 11))
+    last = end // supla_api_standin.STEP_SECONDS * supla_api_standin.STEP_SECONDS
+    expected = supla_api_standin.counter_kwh(CHANNEL, [start, last])
+    assert first["kWh"] == pytest.approx(expected[1] - expected[0], abs=1e-3)
+    assert service.stats()["locks"] == 0
+
+
+def test_client_token_is_verified_before_cache(http_service, supla):
+    service, base = http_service
+    owner = supla_api_standin.token(supla, "owner")
+
+    status, body = get_costs(base)
+    assert status == 200 and body["cache"] == "miss"
+
+    # Ciepły cache nie może zastąpić sprawdzenia tokena w SUPLA
+    for secret in ("bogus", "other"):
+        status, body = get_costs(base, supla_api_standin.token(supla, secret))
+        assert status == 403, body
+
+    status, body = get_costs(base, owner)
+    assert status == 200
+    requests_before = len(supla.requests)
+    status, body = get_costs(base, owner)
+    assert status == 200 and body["cache"] == "hit"
+    assert len(supla.requests) == requests_before  # dostęp pamiętany przez refresh_seconds
+    assert service.stats()["locks"] == 0
+
+
+def test_client_token_for_foreign_server_is_rejected(http_service):
+    _, base = http_service
+    foreign = supla_api_standin.start({"evil": None})
+    try:
+        status, body = get_costs(base, supla_api_standin.token(foreign, "evil"))
+        assert status == 403
+        assert foreign.requests == []
+    finally:
+        foreign.shutdown()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Elastyczne odbiory: energia, która nie mieści się w oknie, nie jest wyceniana."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import supla_pge
+
+
+def flat_prices(days: int = 10, price: float = 0.5) -> pd.DataFrame:
+    hours = pd.date_range("2025-03-03", periods=24 * days, freq="h", tz="UTC")
+    return pd.DataFrame({"timestamp_utc": hours, "price_per_kwh_netto": np.full(len(hours), price)})
+
+
+def test_load_larger_than_window_is_rejected():
+    with pytest.raises(ValueError):
+        supla_pge.FlexibleLoad("x", 4, 1, 3, max_kw=1)
+    with pytest.raises(ValueError):
+        supla_pge.FlexibleLoad("x", 4, 1, 3, block_hours=3)
+    with pytest.raises(ValueError):
+        supla_pge.FlexibleLoad("x", 0, 1, 3)
+
+
+def test_load_filling_its_window_exactly_is_costed_in_full():
+    load = supla_pge.FlexibleLoad("x", 2, 1, 3, max_kw=1)
+    res = supla_pge.optimize_flexible_loads([load], flat_prices()).iloc[0]
+    assert res["doby"] > 0
+    assert res["kWh"] == 2 * res["doby"]
+    # Ta sama cena w każdej godzinie - koszt całej energii po cenie brutto
+    price = (0.5 + supla_pge.DYNAMIC_TARIFF_MARGIN + supla_pge.DYNAMIC_AVG_DISTRIBUTION
+             + sum(supla_pge.ADDITIONAL_CHARGES.values())) * (1 + supla_pge.VAT_RATE)
+    assert res["dyn_bazowy"] == pytest.approx(res["kWh"] * price)
+    assert res["dyn_optymalny"] == pytest.approx(res["dyn_bazowy"])
+
+
+def test_schedule_costs_skip_days_too_short_for_the_energy():
+    # Obejście walidacji: koszt liczony bezpośrednio na za wąskiej macierzy
+    load = object.__new__(supla_pge.FlexibleLoad)
+    for name, value in dict(name="x", kwh=4.0, window_start=1, window_end=3,
+                            max_kw=1.0, block_hours=None).items():
+        object.__setattr__(load, name, value)
+    baseline, best = supla_pge._schedule_costs(load, np.ones((5, 2)))
+    assert np.isnan(baseline).all() and np.isnan(best).all()
+
+    baseline, best = supla_pge._schedule_costs(load, np.ones((5, 4)))
+    assert baseline == pytest.approx(np.full(5, 4.0))
+    assert best == pytest.approx(np.full(5, 4.0))
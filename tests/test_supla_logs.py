@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Stronicowanie logów SUPLA, gdy serwer zwraca mniej odczytów niż limit."""
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+import supla_api_standin
+import supla_pge
+
+CHANNEL = 990008
+
+
+@pytest.fixture
+def capped_supla():
+    server = supla_api_standin.start({"owner": {CHANNEL}}, max_limit=50,
+                                     clock=lambda: datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp())
+    yield server
+    server.shutdown()
+
+
+def test_pages_continue_past_server_cap(capped_supla):
+    date_from = datetime(2025, 11, 3, tzinfo=timezone.utc)
+    date_to = datetime(2025, 11, 3, 23, 59, 59, tzinfo=timezone.utc)
+    pages = list(supla_pge.fetch_measurement_log_pages(
+        supla_api_standin.url(capped_supla), supla_api_standin.token(capped_supla, "owner"),
+        CHANNEL, date_from, date_to, page_size=200))
+
+    # 144 odczyty co 10 min, serwer oddaje najwyżej 50 na stronę mimo limit=200
+    assert [len(page["date_timestamp"]) for page in pages] == [50, 50, 44]
+    ts = np.concatenate([page["date_timestamp"] for page in pages])
+    expected = np.arange(int(date_from.timestamp()), int(date_to.timestamp()) + 1,
+                         supla_api_standin.STEP_SECONDS)
+    np.testing.assert_array_equal(ts, expected)
+    # Krótka strona nie kończy pobierania - dopiero pusta odpowiedź
+    assert len(capped_supla.requests) == 4
+
+
+def test_paging_stops_at_reading_on_date_to(capped_supla):
+    date_from = datetime(2025, 11, 3, tzinfo=timezone.utc)
+    date_to = datetime.fromtimestamp(date_from.timestamp() + 99 * supla_api_standin.STEP_SECONDS,
+                                     tz=timezone.utc)
+    pages = list(supla_pge.fetch_measurement_log_pages(
+        supla_api_standin.url(capped_supla), supla_api_standin.token(capped_supla, "owner"),
+        CHANNEL, date_from, date_to, page_size=200))
+
+    assert [len(page["date_timestamp"]) for page in pages] == [50, 50]
+    assert pages[-1]["date_timestamp"][-1] == int(date_to.timestamp())
+    assert len(capped_supla.requests) == 2
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Archiwum cen TGE: równoległe przebudowy nie gubią miesięcy."""
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import supla_pge
+
+
+def write_month_csv(data_dir, year: int, month: int, price: float = None):
+    hours = pd.date_range(pd.Timestamp(year, month, 1), periods=24 * 28, freq="h")
+    price = month / 10 if price is None else price
+    pd.DataFrame({"timestamp": hours, "price_kwh": np.full(len(hours), price)}).to_csv(
+        data_dir / f"tge_prices_{year}_{month:02d}.csv", index=False)
+
+
+def test_concurrent_rebuilds_keep_every_month(data_dir):
+    for month in range(1, 13):
+        write_month_csv(data_dir, 2024, month)
+
+    errors = []
+
+    def rebuild():
+        try:
+            supla_pge.load_tge_archive()
+        except Exception as e:  # pragma: no cover - zgłaszane niżej
+            errors.append(e)
+
+    threads = [threading.Thread(target=rebuild) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert not [name for name in os.listdir(data_dir) if name.endswith(".tmp")]
+    archive = supla_pge.read_tge_archive()
+    assert len(archive.sources) == 12
+    assert len(archive.hours) == 12 * 24 * 28
+
+    # Zmieniony plik miesiąca zastępuje jego ceny
+    write_month_csv(data_dir, 2024, 12, price=2.5)
+    os.utime(data_dir / "tge_prices_2024_12.csv", (1, 1))
+    prices = supla_pge.load_tge_prices_range(*supla_pge.month_range_utc(2024, 12))
+    assert prices["price_per_kwh_netto"].eq(2.5).all()
+
+
+def test_month_prices_cover_the_consumption_range(data_dir):
+    # Pliki CSV obejmują miesiące lokalne (Europe/Warsaw), bilans - miesiące UTC
+    for month in (11, 12):
+        first = pd.Timestamp(2024, month, 1, tz="Europe/Warsaw")
+        local = pd.date_range(first, first + pd.DateOffset(months=1), freq="h", inclusive="left")
+        pd.DataFrame({"timestamp": local.tz_convert(None), "price_kwh": np.full(len(local), month / 10)}).to_csv(
+            data_dir / f"tge_prices_2024_{month:02d}.csv", index=False)
+
+    start, end = supla_pge.month_range_utc(2024, 11)
+    prices = supla_pge.fetch_tge_prices(2024, 11)
+    assert prices["timestamp_utc"].min() == pd.Timestamp(start)
+    assert prices["timestamp_utc"].max() == pd.Timestamp(end).floor("h")
+    assert len(prices) == 30 * 24
+    # Ostatnia godzina UTC listopada to już 1 grudnia w Polsce
+    assert prices["price_per_kwh_netto"].iloc[-1] == pytest.approx(1.2)
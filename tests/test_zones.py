@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""classify_zones (wektorowo) kontra classify_zone (godzina po godzinie)."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import supla_pge
+
+TARIFFS = ["G11", "G12", "G12w", "G12n"]
+
+
+@pytest.mark.parametrize("supports_summer_winter", [True, False])
+def test_classify_zones_matches_classify_zone(supports_summer_winter):
+    # Trzy lata godzin: zmiany czasu (w tym podwójna godzina 02:00 w październiku) i święta
+    hour_local = pd.Series(pd.date_range("2024-01-01", "2026-12-31 23:00", freq="h", tz="UTC")
+                           ).dt.tz_convert("Europe/Warsaw")
+    zones = supla_pge.classify_zones(hour_local, TARIFFS, supports_summer_winter)
+
+    for tariff in TARIFFS:
+        expected = np.array([supla_pge.classify_zone(ts, tariff, supports_summer_winter)
+                             for ts in hour_local], dtype=object)
+        mismatch = np.flatnonzero(zones[tariff] != expected)
+        assert not len(mismatch), f"{tariff}: {hour_local.iloc[mismatch[:5]].tolist()}"
+
+
+@pytest.mark.parametrize("supports_summer_winter", [True, False])
+def test_classify_zones_quarter_hours_around_dst(supports_summer_winter):
+    # Kwadranse wokół obu zmian czasu 2025 (INTERVAL_MINUTES = 15)
+    intervals = pd.DatetimeIndex([]).tz_localize("UTC")
+    for day in ("2025-03-29", "2025-10-25"):
+        intervals = intervals.append(pd.date_range(day, periods=3 * 96, freq="15min", tz="UTC"))
+    hour_local = pd.Series(intervals).dt.tz_convert("Europe/Warsaw")
+    zones = supla_pge.classify_zones(hour_local, TARIFFS, supports_summer_winter)
+
+    for tariff in TARIFFS:
+        expected = [supla_pge.classify_zone(ts, tariff, supports_summer_winter) for ts in hour_local]
+        assert list(zones[tariff]) == expected
+
+
+def test_holidays_are_off_peak():
+    # 25 grudnia 2025 (czwartek, święto) - cała doba w strefie tańszej
+    hour_local = pd.Series(pd.date_range("2025-12-25", periods=24, freq="h", tz="Europe/Warsaw"))
+    zones = supla_pge.classify_zones(hour_local, ["G12w", "G12n"], True)
+    assert set(zones["G12w"]) == {"night"}
+    assert set(zones["G12n"]) == {"night"}